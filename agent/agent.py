@@ -2,30 +2,61 @@ from flask import Flask, request, jsonify
 import docker
 import os
 import random
+import threading
 import logging
 import psutil
+import heartbeat
+import telemetry
+import metrics
+import cpuset
+import images
+import workspaces
+import power
+from metrics import docker_call, CONTAINER_START_LATENCY
+from workers import DockerPool, BoundedExecutor, AgentBusy, offload
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-client = docker.from_env()
+metrics.init_app(app)
+
+# Slow: pulls, runs, stops (seconds to minutes). Fast: listings. Health uses neither.
+SLOW_WORKERS = int(os.environ.get('AGENT_SLOW_WORKERS', 4))
+FAST_WORKERS = int(os.environ.get('AGENT_FAST_WORKERS', 4))
+slow = BoundedExecutor("slow", SLOW_WORKERS, int(os.environ.get('AGENT_SLOW_QUEUE', 8)))
+fast = BoundedExecutor("fast", FAST_WORKERS, int(os.environ.get('AGENT_FAST_QUEUE', 16)))
+# One client per concurrent worker and workspace sync worker, plus spares for preemption timers
+docker_pool = DockerPool(int(os.environ.get(
+    'AGENT_DOCKER_CLIENTS', SLOW_WORKERS + FAST_WORKERS + workspaces.SYNC_WORKERS + 2)))
+
+# Dedicated cores per container; CPU_RESERVED_CORES are left to the host (e.g. "0")
+CPU_PINNING = os.environ.get('CPU_PINNING', 'True') == 'True'
+cores = cpuset.CoreAllocator(
+    cpuset.read_topology(), cpuset.parse_cpulist(os.environ.get('CPU_RESERVED_CORES', ''))
+) if CPU_PINNING else None
+# Per-user volumes kept between sessions
+workspace_cache = workspaces.WorkspaceCache(docker_pool) if os.environ.get('WORKSPACES', 'True') == 'True' else None
 
 @app.get('/health')
 def health():
-    """Health check endpoint."""
+    """Health check endpoint; never waits on Docker or the worker pools."""
     try:
         return jsonify({
             "status": "ok",
             "host": os.environ.get('AGENT_HOST', 'localhost'),
-            "cpu_percent": psutil.cpu_percent(interval=1),
-            "memory_percent": psutil.virtual_memory().percent
+            # Usage since the previous call (primed at startup), so the probe doesn't block
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": psutil.virtual_memory().percent,
+            "busy": {"slow": slow.in_flight, "fast": fast.in_flight}
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return jsonify({"status": "error", "error": str(e)}), 500
 
 @app.post('/start_container')
+@offload(slow)
+@CONTAINER_START_LATENCY.time()
 def start_container():
     """Start a container with resource limits."""
     try:
@@ -35,36 +66,60 @@ def start_container():
         memory = data.get('memory', '2g')
         port = data.get('port', 8888)
         user_id = data.get('user_id')
+        preemptible = bool(data.get('preemptible'))  # backfill may not take cores of preempted containers
         
         if not image:
             return jsonify({"error": "Missing image parameter"}), 400
         
         container_name = f"compute_{user_id}_{random.randint(10000,99999)}"
+        if cores:
+            pinned = cores.allocate(container_name, max(1, int(cpu)), reclaim=not preemptible)
+            if pinned is None:
+                return jsonify({"error": "Not enough free cores", "free": cores.free_per_node()}), 409
+            run_options = {"cpuset_cpus": pinned[0], "cpuset_mems": pinned[1]}
+        else:
+            run_options = {"cpu_quota": int(cpu * 100000)}
         
-        # Pull image if not present
         try:
-            client.images.get(image)
-        except docker.errors.ImageNotFound:
-            logger.info(f"Pulling image: {image}")
-            client.images.pull(image)
-        
-        # Run container with resource limits
-        container = client.containers.run(
-            image,
-            detach=True,
-            name=container_name,
-            ports={f'{port}/tcp': port},
-            mem_limit=memory,
-            cpu_quota=int(cpu * 100000),
-            environment={
-                'USER_ID': str(user_id),
-                'CONTAINER_PORT': str(port)
-            },
-            labels={
-                'user_id': str(user_id),
-                'managed_by': 'compute_booking'
-            }
-        )
+            if workspace_cache and user_id is not None:
+                volume = workspace_cache.acquire(user_id, container_name)
+                run_options["volumes"] = {volume: {'bind': workspaces.MOUNT_PATH, 'mode': 'rw'}}
+            with docker_pool.client() as client:
+                # Pull image if not present (through the registry mirror when configured)
+                images.ensure_image(client, image)
+                
+                # Run container with resource limits
+                with docker_call("run"):
+                    container = client.containers.run(
+                        image,
+                        detach=True,
+                        name=container_name,
+                        ports={f'{port}/tcp': port},
+                        mem_limit=memory,
+                        environment={
+                            'USER_ID': str(user_id),
+                            'CONTAINER_PORT': str(port)
+                        },
+                        labels={
+                            'user_id': str(user_id),
+                            'managed_by': 'compute_booking'
+                        },
+                        **run_options
+                    )
+        except workspaces.WorkspaceRestoring:
+            if cores:
+                cores.release(container_name)
+            return jsonify({"error": "Workspace restoring, retry later"}), 503, {"Retry-After": "30"}
+        except Exception:
+            if cores:
+                cores.release(container_name)
+            if workspace_cache:
+                workspace_cache.release(container_name)
+            raise
+        if cores:
+            cores.confirm(container_name)
+        if workspace_cache:
+            workspace_cache.confirm(container_name)
         
         url = f"http://{os.environ.get('AGENT_HOST','localhost')}:{port}"
         logger.info(f"Container started: {container_name} on port {port}")
@@ -83,13 +138,26 @@ def start_container():
         logger.error(f"Failed to start container: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _remove(container_name):
+    """Stop and remove a container, then give back its cores and workspace."""
+    with docker_pool.client() as client:
+        with docker_call("get"):
+            container = client.containers.get(container_name)
+        with docker_call("stop"):
+            container.stop(timeout=10)
+        with docker_call("remove"):
+            container.remove()
+    if cores:
+        cores.release(container_name)
+    if workspace_cache:
+        workspace_cache.release(container_name)
+
 @app.post('/stop_container/<container_name>')
+@offload(slow)
 def stop_container(container_name):
     """Stop and remove a container."""
     try:
-        container = client.containers.get(container_name)
-        container.stop(timeout=10)
-        container.remove()
+        _remove(container_name)
         logger.info(f"Container stopped: {container_name}")
         return jsonify({"msg": "Container stopped", "name": container_name}), 200
     except docker.errors.NotFound:
@@ -98,12 +166,49 @@ def stop_container(container_name):
         logger.error(f"Failed to stop container: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _stop_preempted(container_name):
+    try:
+        _remove(container_name)
+        logger.info(f"Preempted container removed: {container_name}")
+    except docker.errors.NotFound:
+        pass
+    except Exception as e:
+        logger.error(f"Failed to remove preempted container {container_name}: {e}")
+
+@app.post('/preempt_container/<container_name>')
+@offload(fast)
+def preempt_container(container_name):
+    """Send SIGUSR1 so the workload can checkpoint, then stop it after a grace period."""
+    try:
+        grace = int((request.get_json(silent=True) or {}).get('grace', 30))
+        with docker_pool.client() as client:
+            with docker_call("get"):
+                container = client.containers.get(container_name)
+            with docker_call("kill"):
+                container.kill(signal="SIGUSR1")
+        if cores:
+            # The controller starts the session that needed the room right away
+            cores.preempt(container_name)
+        # A timer, so the grace period doesn't hold a worker
+        timer = threading.Timer(grace, _stop_preempted, args=(container_name,))
+        timer.daemon = True
+        timer.start()
+        logger.info(f"Preempting container {container_name}, stopping in {grace}s")
+        return jsonify({"msg": "Container preempted", "name": container_name, "grace": grace}), 202
+    except docker.errors.NotFound:
+        return jsonify({"error": "Container not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to preempt container: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.get('/containers')
+@offload(fast)
 def list_containers():
     """List all managed containers."""
     try:
         filters = {'label': 'managed_by=compute_booking'}
-        containers = client.containers.list(filters=filters)
+        with docker_pool.client() as client, docker_call("list"):
+            containers = client.containers.list(filters=filters)
         return jsonify([{
             "id": c.id[:12],
             "name": c.name,
@@ -113,17 +218,94 @@ def list_containers():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.post('/test_image/<image>')
+@app.post('/workspaces/<int:user_id>/prepare')
+@offload(fast)
+def prepare_workspace(user_id):
+    """Restore a user's workspace from the store ahead of their session; 202 while it runs."""
+    if not workspace_cache:
+        return jsonify({"error": "Workspaces disabled"}), 404
+    try:
+        if workspace_cache.prepare(user_id):
+            return jsonify({"msg": "Restoring"}), 202
+        return jsonify({"msg": "Ready"}), 200
+    except Exception as e:
+        logger.error(f"Failed to prepare workspace of user {user_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.post('/suspend')
+@offload(fast)
+def suspend():
+    """Suspend this machine; refused while managed containers are running.
+
+    Answers 501 where SUSPEND_COMMAND can't run (e.g. the agent is in a
+    container) so the controller stops asking.
+    """
+    if not power.supported():
+        return jsonify({"error": "Suspend not supported on this agent"}), 501
+    try:
+        with docker_pool.client() as client, docker_call("list"):
+            running = client.containers.list(filters={'label': 'managed_by=compute_booking'})
+        if running:
+            return jsonify({"error": "Containers running", "count": len(running)}), 409
+        power.suspend()
+        logger.info("Suspending on controller request")
+        return jsonify({"msg": "Suspending"}), 202
+    except Exception as e:
+        logger.error(f"Suspend failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.post('/test_image/<path:image>')
+@offload(slow)
 def test_image(image):
-    """Test if an image can be pulled."""
+    """Test if an image is available locally or can be pulled."""
     try:
-        client.images.pull(image)
+        with docker_pool.client() as client:
+            images.ensure_image(client, image)
         return jsonify({"msg": f"Image {image} available"}), 200
     except Exception as e:
         return jsonify({"error": f"Failed to pull image: {e}"}), 400
 
+def _prefetch(image):
+    try:
+        with docker_pool.client() as client:
+            images.ensure_image(client, image)
+    except Exception as e:
+        logger.error(f"Prefetch of {image} failed: {e}")
+
+@app.post('/pull')
+def pull_image():
+    """Start pulling an image in the background so later sessions start without waiting."""
+    image = (request.get_json(silent=True) or {}).get('image')
+    if not image:
+        return jsonify({"error": "Missing image parameter"}), 400
+    try:
+        slow.submit(_prefetch, image)
+    except AgentBusy:
+        return jsonify({"error": "Agent busy, retry later"}), 503, {"Retry-After": "5"}
+    return jsonify({"msg": "Pull started", "image": image}), 202
+
+def serve(host, port):
+    """Serve with waitress on AGENT_THREADS threads, or Flask's threaded server without it."""
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        logger.warning("waitress is not installed; falling back to Flask's development server")
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+    waitress_serve(app, host=host, port=port, threads=int(os.environ.get('AGENT_THREADS', 32)))
+
 if __name__ == '__main__':
     host = os.environ.get('AGENT_HOST', '0.0.0.0')
     port = int(os.environ.get('AGENT_PORT', 5000))
     logger.info(f"Starting agent on {host}:{port}")
-    app.run(host=host, port=port, debug=False)
+    psutil.cpu_percent(interval=None)  # prime the counter /health reads
+    with docker_pool.client() as client:
+        running = client.containers.list(filters={'label': 'managed_by=compute_booking'})
+    if cores:
+        cores.rebuild(running)
+    if workspace_cache:
+        workspace_cache.rebuild(running)
+    # The background loops each keep a client of their own
+    heartbeat.start(docker.from_env(), cores, workspace_cache)
+    telemetry.start(docker.from_env())
+    serve(host, port)
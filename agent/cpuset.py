@@ -0,0 +1,131 @@
+"""Dedicated cores for session containers, NUMA aware.
+
+Each container gets whole cores through cpuset_cpus, taken from a single NUMA
+node when one has enough free (its memory node is pinned too). The allocator
+keeps its state in memory and rebuilds it from running containers' cpusets
+when the agent restarts.
+"""
+import glob
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11] (the kernel/docker cpulist format)."""
+    cpus = []
+    for part in (text or "").strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def format_cpulist(cpus):
+    """[0, 1, 2, 3, 8] -> '0-3,8'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def read_topology(root="/sys/devices/system/node"):
+    """{numa node: [cpus]} for the cores this process may use; one node if NUMA info is missing."""
+    usable = set(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    nodes = {}
+    for path in glob.glob(os.path.join(root, "node[0-9]*", "cpulist")):
+        node = int(re.search(r"node(\d+)", path).group(1))
+        with open(path) as f:
+            cpus = [c for c in parse_cpulist(f.read()) if c in usable]
+        if cpus:
+            nodes[node] = cpus
+    return nodes or {0: sorted(usable)}
+
+class CoreAllocator:
+    """Track which cores belong to which container."""
+
+    def __init__(self, topology, reserved=()):
+        self.numa = len(topology) > 1
+        self.nodes = {node: [c for c in cpus if c not in set(reserved)] for node, cpus in topology.items()}
+        self.node_of = {cpu: node for node, cpus in self.nodes.items() for cpu in cpus}
+        self.owner = {}  # container name -> [cpus]
+        self.pending = set()  # allocated, container not created yet
+        self.draining = set()  # preempted, stopping after the grace period; cores reclaimable
+        self.lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.node_of)
+
+    def _free(self, reclaim=False):
+        used = {cpu for name, cpus in self.owner.items() if not (reclaim and name in self.draining) for cpu in cpus}
+        return {node: [c for c in cpus if c not in used] for node, cpus in self.nodes.items()}
+
+    def free_per_node(self):
+        with self.lock:
+            return {node: len(cpus) for node, cpus in self._free().items()}
+
+    def allocate(self, name, count, reclaim=False):
+        """Reserve `count` cores for `name`; returns (cpuset_cpus, cpuset_mems) or None if full.
+
+        The fullest node that still fits is used so large holes stay available;
+        otherwise cores are taken from the emptiest nodes first. With `reclaim`
+        (guaranteed sessions), cores of preempted containers still in their
+        grace period count as free and are shared until those stop.
+        """
+        with self.lock:
+            free = self._free(reclaim)
+            if sum(len(cpus) for cpus in free.values()) < count:
+                return None
+            fits = [node for node, cpus in free.items() if len(cpus) >= count]
+            if fits:
+                node = min(fits, key=lambda n: (len(free[n]), n))
+                cpus, mems = free[node][:count], str(node) if self.numa else None
+            else:
+                cpus, mems = [], None
+                for node in sorted(free, key=lambda n: -len(free[n])):
+                    cpus.extend(free[node][:count - len(cpus)])
+            self.owner[name] = cpus
+            self.pending.add(name)
+            return format_cpulist(cpus), mems
+
+    def confirm(self, name):
+        with self.lock:
+            self.pending.discard(name)
+
+    def preempt(self, name):
+        """Let guaranteed sessions take `name`'s cores while it is being stopped."""
+        with self.lock:
+            if name in self.owner:
+                self.draining.add(name)
+
+    def release(self, name):
+        with self.lock:
+            self.pending.discard(name)
+            self.draining.discard(name)
+            return self.owner.pop(name, None)
+
+    def rebuild(self, containers):
+        """Take ownership state from the cpusets of running containers (after a restart)."""
+        with self.lock:
+            self.owner = {}
+            for c in containers:
+                cpus = parse_cpulist((c.attrs.get("HostConfig") or {}).get("CpusetCpus"))
+                cpus = [cpu for cpu in cpus if cpu in self.node_of]
+                if cpus:
+                    self.owner[c.name] = cpus
+        logger.info(f"Core allocator rebuilt: {len(self.owner)} pinned containers, "
+                    f"{self.total - sum(len(c) for c in self.owner.values())}/{self.total} cores free")
+
+    def retain(self, names):
+        """Free the cores of containers that are gone (exited or removed outside the agent)."""
+        names = set(names)
+        with self.lock:
+            for name in [n for n in self.owner if n not in names and n not in self.pending]:
+                del self.owner[name]
+                self.draining.discard(name)
+                logger.info(f"Released cores of vanished container {name}")
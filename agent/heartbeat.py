@@ -0,0 +1,125 @@
+"""Self-registration and heartbeat push to the controller."""
+import os
+import socket
+import threading
+import time
+import logging
+import psutil
+import requests
+import images
+import power
+
+logger = logging.getLogger(__name__)
+
+CONTROLLER_URL = os.environ.get('CONTROLLER_URL', '').rstrip('/')
+AGENT_TOKEN = os.environ.get('AGENT_TOKEN', 'agent-secret')
+MANAGED_FILTER = {'label': 'managed_by=compute_booking'}
+
+state = {
+    "agent_id": None,
+    "interval": float(os.environ.get('HEARTBEAT_INTERVAL', 5)),
+    "cores": None,
+    "workspaces": None
+}
+
+def _mac_address():
+    if os.environ.get('AGENT_MAC'):
+        return os.environ['AGENT_MAC']
+    for name, addrs in psutil.net_if_addrs().items():
+        if name == 'lo':
+            continue
+        for addr in addrs:
+            if addr.family == psutil.AF_LINK and addr.address and addr.address != '00:00:00:00:00:00':
+                return addr.address
+    return None
+
+def registration_payload():
+    """Describe this node using the real hardware totals."""
+    advertised = os.environ.get('AGENT_ADVERTISE_HOST', os.environ.get('AGENT_HOST', ''))
+    cores = state["cores"]
+    return {
+        "name": os.environ.get('AGENT_NAME', socket.gethostname()),
+        # 0.0.0.0 is a bind address; let the controller use the source address instead
+        "ip": advertised if advertised not in ('', '0.0.0.0') else None,
+        "mac": _mac_address(),
+        "port": int(os.environ.get('AGENT_PORT', 5000)),
+        # with pinning, only the cores sessions can be given
+        "total_cpu": cores.total if cores else psutil.cpu_count(),
+        "numa_nodes": len(cores.nodes) if cores else 1,
+        "total_mem": max(1, psutil.virtual_memory().total // 1024 ** 3),
+        "can_suspend": power.supported(),
+        "tags": os.environ.get('AGENT_TAGS', '')
+    }
+
+def register():
+    res = requests.post(
+        f"{CONTROLLER_URL}/api/agents/register",
+        json=registration_payload(),
+        headers={"X-Agent-Token": AGENT_TOKEN},
+        timeout=10
+    )
+    res.raise_for_status()
+    body = res.json()
+    state["agent_id"] = body["id"]
+    state["interval"] = float(body.get("heartbeat_interval", state["interval"]))
+    if body.get("registry_mirror"):
+        images.state["mirror"] = body["registry_mirror"]
+    logger.info(f"Registered with controller as agent {state['agent_id']}")
+
+def heartbeat_payload(client):
+    containers = client.containers.list(filters=MANAGED_FILTER)
+    names = [c.name for c in containers]
+    cores, cache = state["cores"], state["workspaces"]
+    if cores:
+        cores.retain(names)
+    if cache:
+        cache.retain(names)
+    return {
+        "id": state["agent_id"],
+        "cpu": psutil.cpu_percent(interval=None),
+        "mem": psutil.virtual_memory().percent,
+        "containers": names,
+        # most free cores on one NUMA node: the largest session that can stay node-local
+        "node_free_cpu": max(cores.free_per_node().values()) if cores else None,
+        # users whose workspace volume is cached here, for placement
+        "workspaces": cache.held() if cache else None,
+        # filled in by the telemetry sampler; None means idleness isn't tracked
+        "idle": state.get("idle")
+    }
+
+def _loop(client):
+    backoff = 1
+    session = requests.Session()
+    session.headers["X-Agent-Token"] = AGENT_TOKEN
+    while True:
+        try:
+            if state["agent_id"] is None:
+                register()
+                backoff = 1
+            res = session.post(
+                f"{CONTROLLER_URL}/api/agents/heartbeat",
+                json=heartbeat_payload(client),
+                timeout=5
+            )
+            if res.status_code == 404:
+                # Controller forgot us (e.g. DB reset): register again on the next pass
+                state["agent_id"] = None
+                continue
+            res.raise_for_status()
+            time.sleep(state["interval"])
+        except Exception as e:
+            logger.warning(f"Heartbeat failed, retrying in {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+def start(client, cores=None, workspaces=None):
+    """Start the background heartbeat thread if a controller URL is configured."""
+    state["cores"] = cores
+    state["workspaces"] = workspaces
+    if not CONTROLLER_URL:
+        logger.info("CONTROLLER_URL not set, running in passive (polled) mode")
+        return None
+    psutil.cpu_percent(interval=None)  # prime the counter so the first sample is meaningful
+    thread = threading.Thread(target=_loop, args=(client,), name="heartbeat", daemon=True)
+    thread.start()
+    return thread
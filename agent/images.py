@@ -0,0 +1,75 @@
+"""Image pulls through the lab's pull-through registry mirror.
+
+Docker Hub images are fetched from the mirror first and tagged under their
+usual name, so the lab's uplink carries each layer once (the mirror caches
+by digest) instead of once per agent. Concurrent requests for the same image
+on one agent share a single pull.
+"""
+import os
+import threading
+import logging
+import docker
+from metrics import docker_call
+
+logger = logging.getLogger(__name__)
+
+# host[:port] of the mirror; the controller's registration response overrides it
+state = {"mirror": os.environ.get('REGISTRY_MIRROR', '')}
+
+_lock = threading.Lock()
+_inflight = {}  # image -> Event set when its pull finishes
+
+def split_tag(image):
+    """'repo:tag' -> ('repo', 'tag'), ignoring a registry port; no tag means latest."""
+    repo, sep, tag = image.rpartition(":")
+    if not sep or "/" in tag:
+        return image, "latest"
+    return repo, tag
+
+def mirror_ref(image, mirror):
+    """The mirror's name for a Docker Hub image, or None for images from other registries."""
+    name = image[len("docker.io/"):] if image.startswith("docker.io/") else image
+    first, sep, _ = name.partition("/")
+    if sep and ("." in first or ":" in first or first == "localhost"):
+        return None  # the mirror only proxies Docker Hub
+    return f"{mirror}/{name if sep else 'library/' + name}"
+
+def _pull(client, image):
+    mirror = state["mirror"]
+    ref = mirror_ref(image, mirror) if mirror and "@" not in image else None
+    if ref:
+        try:
+            with docker_call("pull_mirror"):
+                pulled = client.images.pull(ref)
+            pulled.tag(*split_tag(image))  # so runs and lookups by the usual name find it
+            logger.info(f"Pulled {image} through mirror {mirror}")
+            return
+        except Exception as e:
+            logger.warning(f"Mirror pull of {image} failed, pulling upstream: {e}")
+    logger.info(f"Pulling image: {image}")
+    with docker_call("pull"):
+        client.images.pull(image)
+
+def ensure_image(client, image):
+    """Make `image` available locally, pulling it at most once at a time."""
+    try:
+        client.images.get(image)
+        return
+    except docker.errors.ImageNotFound:
+        pass
+
+    with _lock:
+        done = _inflight.get(image)
+        owner = done is None
+        if owner:
+            done = _inflight[image] = threading.Event()
+    if not owner:
+        done.wait()
+        client.images.get(image)  # raises ImageNotFound if the shared pull failed
+        return
+    try:
+        _pull(client, image)
+    finally:
+        with _lock:
+            del _inflight[image]
+        done.set()
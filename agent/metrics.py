@@ -0,0 +1,52 @@
+"""Prometheus metrics for the agent."""
+import time
+from flask import request, g, Response
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+HTTP_REQUESTS = Counter(
+    'agent_http_requests_total', 'HTTP requests handled', ['endpoint', 'method', 'status'])
+HTTP_LATENCY = Histogram(
+    'agent_http_request_duration_seconds', 'HTTP request latency', ['endpoint'])
+DOCKER_CALL_LATENCY = Histogram(
+    'agent_docker_call_seconds', 'Docker API call latency', ['op'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+DOCKER_CALL_FAILURES = Counter('agent_docker_call_failures_total', 'Failed Docker API calls', ['op'])
+CONTAINER_START_LATENCY = Histogram(
+    'agent_container_start_seconds', 'End-to-end /start_container latency including image pull',
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+
+class docker_call:
+    """Context manager timing one Docker operation: `with docker_call("pull"): ...`."""
+
+    def __init__(self, op):
+        self.op = op
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        DOCKER_CALL_LATENCY.labels(self.op).observe(time.perf_counter() - self.started)
+        if exc_type is not None:
+            DOCKER_CALL_FAILURES.labels(self.op).inc()
+        return False
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+def _after_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.endpoint or "unmatched"
+        HTTP_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+def metrics_view():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+    """Time every request and expose all metrics on /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,48 @@
+"""Suspending this machine on controller request (POWER_MANAGEMENT).
+
+Suspend only works when the agent runs on the host: inside a container there
+is no systemd to ask. Support is detected at startup, reported at
+registration, and withdrawn if the command fails, so the controller stops
+asking instead of marking the agent asleep while it keeps running.
+"""
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUSPEND_COMMAND = os.environ.get('SUSPEND_COMMAND', 'systemctl suspend')
+
+state = {"supported": None}
+
+def _detect():
+    argv = shlex.split(SUSPEND_COMMAND)
+    if not argv or shutil.which(argv[0]) is None:
+        return False
+    if os.path.basename(argv[0]) == "systemctl" and not os.path.isdir("/run/systemd/system"):
+        return False  # systemd isn't running here, e.g. the agent is in a container
+    return True
+
+def supported():
+    if state["supported"] is None:
+        state["supported"] = _detect()
+        if not state["supported"]:
+            logger.info(f"Suspend unavailable: '{SUSPEND_COMMAND}' can't run here")
+    return state["supported"]
+
+def _run():
+    try:
+        result = subprocess.run(shlex.split(SUSPEND_COMMAND), capture_output=True, text=True, timeout=60)
+        error = result.stderr.strip() if result.returncode else None
+    except (OSError, subprocess.SubprocessError) as e:
+        error = str(e)
+    if error:
+        state["supported"] = False
+        logger.error(f"Suspend failed, no longer offering it: {error}")
+
+def suspend(delay=2):
+    """Run SUSPEND_COMMAND after `delay` seconds, giving the response time to reach the controller."""
+    threading.Timer(delay, _run).start()
@@ -0,0 +1,125 @@
+"""Docker stats sampling for managed containers, shipped to the controller in batches."""
+import os
+import threading
+import time
+import logging
+from collections import deque
+import requests
+import heartbeat
+from metrics import docker_call
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = float(os.environ.get('TELEMETRY_INTERVAL', 10))
+FLUSH_INTERVAL = float(os.environ.get('TELEMETRY_FLUSH_SECONDS', 30))
+MAX_BUFFER = int(os.environ.get('TELEMETRY_MAX_BUFFER', 10000))
+IDLE_CPU_PERCENT = float(os.environ.get('IDLE_CPU_PERCENT', 2.0))
+IDLE_NET_BYTES = int(os.environ.get('IDLE_NET_BYTES', 1024))  # per sample interval
+
+# Oldest samples are dropped first if the controller is unreachable for a long time
+_buffer = deque(maxlen=MAX_BUFFER)
+# container name -> (container cpu time, system cpu time) from the previous sample
+_prev_cpu = {}
+# container name -> (rx+tx bytes at previous sample, epoch when the container went idle or None)
+_activity = {}
+
+def cpu_percent(name, stats):
+    """CPU use since the previous sample, in percent of one core (like `docker stats`)."""
+    cpu = stats.get('cpu_stats') or {}
+    total = (cpu.get('cpu_usage') or {}).get('total_usage', 0)
+    system = cpu.get('system_cpu_usage', 0)
+    prev = _prev_cpu.get(name)
+    _prev_cpu[name] = (total, system)
+    if prev is None or system <= prev[1]:
+        return None
+    cpus = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or [1])
+    return (total - prev[0]) / (system - prev[1]) * cpus * 100.0
+
+def memory_mb(stats):
+    mem = stats.get('memory_stats') or {}
+    detail = mem.get('stats') or {}
+    # Exclude page cache the same way `docker stats` does
+    cache = detail.get('inactive_file', detail.get('cache', 0))
+    return max(0, mem.get('usage', 0) - cache) / 1024 ** 2
+
+def network_bytes(stats):
+    return sum(n.get('rx_bytes', 0) + n.get('tx_bytes', 0) for n in (stats.get('networks') or {}).values())
+
+def track_idle(name, cpu, net, now):
+    """Remember when a container went quiet: low CPU and (almost) no network traffic."""
+    prev_net, idle_since = _activity.get(name, (net, None))
+    quiet = cpu < IDLE_CPU_PERCENT and net - prev_net <= IDLE_NET_BYTES
+    if not quiet:
+        idle_since = None
+    elif idle_since is None:
+        idle_since = now
+    _activity[name] = (net, idle_since)
+
+def idle_report(now):
+    """Seconds each idle container has been idle, for the heartbeat."""
+    return {name: now - since for name, (_, since) in _activity.items() if since is not None}
+
+def sample(client):
+    """Take one stats sample of every managed container and buffer it."""
+    now = int(time.time())
+    seen = set()
+    rows = []
+    for container in client.containers.list(filters=heartbeat.MANAGED_FILTER):
+        seen.add(container.name)
+        try:
+            # one_shot skips the daemon's built-in 1s pre-sample; we diff against our own
+            with docker_call("stats"):
+                stats = container.stats(stream=False, one_shot=True)
+        except Exception as e:
+            logger.debug(f"Stats failed for {container.name}: {e}")
+            continue
+        cpu = cpu_percent(container.name, stats)
+        if cpu is None:
+            continue
+        track_idle(container.name, cpu, network_bytes(stats), now)
+        rows.append({"c": container.name, "t": now, "cpu": round(cpu, 2), "mem": round(memory_mb(stats), 1)})
+
+    for name in set(_prev_cpu) - seen:
+        del _prev_cpu[name]
+    for name in set(_activity) - seen:
+        del _activity[name]
+    heartbeat.state["idle"] = idle_report(now)
+    _buffer.extend(rows)
+    return rows
+
+def flush(session):
+    """Ship buffered samples; they stay buffered if the controller can't take them."""
+    if not _buffer or heartbeat.state["agent_id"] is None:
+        return 0
+    batch = list(_buffer)
+    res = session.post(
+        f"{heartbeat.CONTROLLER_URL}/api/agents/telemetry",
+        json={"id": heartbeat.state["agent_id"], "samples": batch},
+        timeout=10
+    )
+    res.raise_for_status()
+    for _ in range(len(batch)):
+        _buffer.popleft()
+    return len(batch)
+
+def _loop(client):
+    session = requests.Session()
+    session.headers["X-Agent-Token"] = heartbeat.AGENT_TOKEN
+    last_flush = time.monotonic()
+    while True:
+        try:
+            sample(client)
+            if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                last_flush = time.monotonic()
+                flush(session)
+        except Exception as e:
+            logger.warning(f"Telemetry cycle failed: {e}")
+        time.sleep(SAMPLE_INTERVAL)
+
+def start(client):
+    """Start the background sampler if a controller URL is configured."""
+    if not heartbeat.CONTROLLER_URL:
+        return None
+    thread = threading.Thread(target=_loop, args=(client,), name="telemetry", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,73 @@
+"""Docker client pool and bounded executors for serving the agent API concurrently.
+
+Slow Docker work (pulls, runs, stops) and fast work (listing) run on separate
+bounded pools, so a burst of session starts can't starve container listings,
+and the health endpoint, which touches neither, always has a server thread.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from flask import copy_current_request_context, jsonify
+import docker
+
+class AgentBusy(Exception):
+    """Raised when an executor's workers and queue are all taken."""
+
+class DockerPool:
+    """Fixed set of Docker clients; each is used by one thread at a time."""
+
+    def __init__(self, size, factory=docker.from_env):
+        self.clients = queue.Queue()
+        for _ in range(size):
+            self.clients.put(factory())
+
+    @contextmanager
+    def client(self):
+        client = self.clients.get()
+        try:
+            yield client
+        finally:
+            self.clients.put(client)
+
+class BoundedExecutor:
+    """At most `workers` tasks run and `queue` more wait; beyond that submit() raises AgentBusy."""
+
+    def __init__(self, name, workers, queue):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.capacity = workers + queue
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        if not self.slots.acquire(blocking=False):
+            raise AgentBusy()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+def offload(executor):
+    """Run a view on `executor` and wait for it; 503 with Retry-After when the executor is full."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                future = executor.submit(copy_current_request_context(fn), *args, **kwargs)
+            except AgentBusy:
+                return jsonify({"error": "Agent busy, retry later"}), 503, {"Retry-After": "5"}
+            return future.result()
+        return wrapper
+    return decorator
@@ -0,0 +1,300 @@
+"""Per-user workspace volumes, cached on the agent and synced to a central store.
+
+A session mounts its user's `workspace_<id>` volume. Volumes stay on the agent
+after the session ends and are evicted least recently used first once they
+exceed WORKSPACE_QUOTA_GB. With WORKSPACE_STORE set (a host path shared by all
+agents, e.g. an NFS mount), each workspace is archived there in the background
+when its session ends, and restored from it when a session lands on an agent
+without a current copy. Syncs run on a small thread pool, never in a request:
+a start that needs a restore is refused with WorkspaceRestoring and retried,
+and the controller asks for restores ahead of time through prepare(). While a
+push writes an archive, a `.pushing` marker next to it makes restores of that
+workspace (on any agent) wait for the new copy.
+"""
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import docker
+from metrics import docker_call
+
+logger = logging.getLogger(__name__)
+
+MOUNT_PATH = os.environ.get('WORKSPACE_PATH', '/home/jovyan/work')
+QUOTA_GB = float(os.environ.get('WORKSPACE_QUOTA_GB', 50))
+STORE = os.environ.get('WORKSPACE_STORE', '')
+STATE_FILE = os.environ.get('WORKSPACE_STATE', '/var/lib/compute-agent/workspaces.json')
+SYNC_IMAGE = os.environ.get('WORKSPACE_SYNC_IMAGE', 'alpine:3')
+SYNC_WORKERS = int(os.environ.get('WORKSPACE_SYNC_WORKERS', 2))  # concurrent pushes/restores
+PUSH_TIMEOUT = int(os.environ.get('WORKSPACE_PUSH_TIMEOUT', 1800))  # older .pushing markers are stale
+LABELS = {'managed_by': 'compute_booking', 'workspace': 'true'}
+
+def volume_name(user_id):
+    return f"workspace_{user_id}"
+
+class WorkspaceRestoring(Exception):
+    """The workspace is being restored from the store; retry the start later."""
+
+class WorkspaceCache:
+    """Track workspace volumes on this agent: in use, last used, last synced."""
+
+    def __init__(self, pool, quota_gb=QUOTA_GB, store=STORE, state_file=STATE_FILE, sync_workers=SYNC_WORKERS):
+        self.pool = pool  # DockerPool; each sync worker holds one client while it runs
+        self.syncs = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="workspace-sync")
+        self.quota = quota_gb * 1024 ** 3
+        self.store = store
+        self.state_file = state_file
+        self.sessions = {}  # container name -> user id whose workspace it mounts
+        self.pending = set()  # acquired, container not created yet
+        self.restoring = {}  # user id -> Future of its running restore
+        self.pushing = set()  # user ids this agent is pushing
+        self.lock = threading.Lock()
+        self.state = self._load()  # user id -> {"last_used": epoch, "synced": store mtime or None}
+
+    def _load(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        with self.lock:
+            data = json.dumps(self.state)
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+            with open(self.state_file + ".tmp", "w") as f:
+                f.write(data)
+            os.replace(self.state_file + ".tmp", self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save workspace state: {e}")
+
+    def _archive(self, user_id):
+        return os.path.join(self.store, f"{volume_name(user_id)}.tar")
+
+    def _run_sync(self, user_id, command):
+        with self.pool.client() as client, docker_call("workspace_sync"):
+            client.containers.run(
+                SYNC_IMAGE, ["sh", "-c", command], remove=True,
+                volumes={volume_name(user_id): {'bind': '/w', 'mode': 'rw'},
+                         self.store: {'bind': '/store', 'mode': 'rw'}}
+            )
+
+    def held(self):
+        """User ids with a workspace on this agent, reported in heartbeats."""
+        with self.lock:
+            return sorted(int(u) for u in self.state)
+
+    def _in_use(self):
+        return set(self.sessions.values())
+
+    def _ensure_volume(self, user_id):
+        """Create the user's volume if missing; returns True if it was created."""
+        name = volume_name(user_id)
+        with self.pool.client() as client:
+            try:
+                with docker_call("volume_get"):
+                    client.volumes.get(name)
+                return False
+            except docker.errors.NotFound:
+                with docker_call("volume_create"):
+                    client.volumes.create(name, labels={**LABELS, 'user_id': str(user_id)})
+                return True
+
+    def _marker(self, user_id):
+        return self._archive(user_id) + ".pushing"
+
+    def _pushing_elsewhere(self, user_id):
+        """Whether a push of this workspace is writing to the store; stale markers don't count."""
+        try:
+            return time.time() - os.path.getmtime(self._marker(user_id)) < PUSH_TIMEOUT
+        except OSError:
+            return False
+
+    def _stale(self, key):
+        """Whether the store has (or is being sent) a newer copy than this agent (lock held)."""
+        if not self.store or key in self._in_use() or key in self.pushing:
+            return False  # never restore under a running session or over our own newer copy
+        if self._pushing_elsewhere(key):
+            return True
+        if not os.path.exists(self._archive(key)):
+            return False
+        entry = self.state.get(key)
+        return entry is None or entry["synced"] is None or os.path.getmtime(self._archive(key)) > entry["synced"]
+
+    def _start_restore(self, key):
+        """Restore `key` in the background if stale (lock held); True while a restore runs."""
+        future = self.restoring.get(key)
+        if future is None and self._stale(key):
+            future = self.restoring[key] = self.syncs.submit(self._restore, key)
+        return future is not None
+
+    def prepare(self, user_id):
+        """Restore a workspace ahead of its session; True while the restore runs."""
+        with self.lock:
+            return self._start_restore(str(user_id))
+
+    def _restore(self, key):
+        try:
+            while self._pushing_elsewhere(key):
+                time.sleep(1)
+            if self._ensure_volume(key):
+                with self.lock:
+                    self.state.pop(key, None)
+            if not os.path.exists(self._archive(key)):
+                return
+            # The newest copy was written by another agent
+            stored = os.path.getmtime(self._archive(key))
+            logger.info(f"Restoring workspace of user {key} from the store")
+            self._run_sync(key, f"find /w -mindepth 1 -delete && tar -C /w -xf /store/{volume_name(key)}.tar")
+            with self.lock:
+                self.state.setdefault(key, {"last_used": time.time(), "synced": None})["synced"] = stored
+            self._save()
+        except Exception as e:
+            logger.error(f"Restoring workspace of user {key} failed: {e}")
+        finally:
+            with self.lock:
+                self.restoring.pop(key, None)
+
+    def acquire(self, user_id, container_name):
+        """Volume name to mount for `container_name`.
+
+        Raises WorkspaceRestoring if the store has a newer copy; the restore
+        then runs in the background and the start should be retried.
+        """
+        key, name = str(user_id), volume_name(user_id)
+        created = self._ensure_volume(key)
+        with self.lock:
+            if created:
+                self.state.pop(key, None)
+            if self._start_restore(key):
+                raise WorkspaceRestoring(key)
+            self.sessions[container_name] = key
+            self.pending.add(container_name)
+            entry = self.state.setdefault(key, {"last_used": time.time(), "synced": None})
+            entry["last_used"] = time.time()
+        self._save()
+        return name
+
+    def confirm(self, container_name):
+        with self.lock:
+            self.pending.discard(container_name)
+
+    def release(self, container_name):
+        """Session over: push the workspace to the store in the background, then enforce the quota."""
+        with self.lock:
+            self.pending.discard(container_name)
+            key = self.sessions.pop(container_name, None)
+            if key is None:
+                return
+            if key in self.state:
+                self.state[key]["last_used"] = time.time()
+        self.syncs.submit(self._after_release, key)
+
+    def retain(self, names):
+        """Release workspaces of containers that are gone (exited or removed outside the agent)."""
+        names = set(names)
+        with self.lock:
+            gone = [n for n in self.sessions if n not in names and n not in self.pending]
+        for name in gone:
+            self.release(name)
+
+    def _after_release(self, user_id):
+        try:
+            with self.lock:
+                last = user_id not in self._in_use()
+            if self.store and last:
+                self.push(user_id)
+            self.evict()
+        except Exception as e:
+            logger.error(f"Workspace sync for user {user_id} failed: {e}")
+
+    @contextmanager
+    def _push_marker(self, user_id):
+        """Hold the store's `.pushing` marker for a workspace, waiting out other agents' pushes."""
+        marker = self._marker(user_id)
+        while True:
+            try:
+                os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                if not self._pushing_elsewhere(user_id):
+                    logger.warning(f"Removing stale push marker {marker}")
+                    try:
+                        os.remove(marker)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                time.sleep(1)
+        try:
+            yield
+        finally:
+            os.remove(marker)
+
+    def push(self, user_id):
+        key, name = str(user_id), volume_name(user_id)
+        with self.lock:
+            self.pushing.add(key)
+        try:
+            with self._push_marker(key):
+                self._run_sync(key, f"tar -C /w -cf /store/{name}.tar.tmp . && "
+                                    f"mv /store/{name}.tar.tmp /store/{name}.tar")
+                with self.lock:
+                    if key in self.state:
+                        self.state[key]["synced"] = os.path.getmtime(self._archive(key))
+        finally:
+            with self.lock:
+                self.pushing.discard(key)
+        self._save()
+        logger.info(f"Workspace of user {user_id} synced to the store")
+
+    def evict(self):
+        """Remove idle workspaces, least recently used first, until the total fits the quota.
+
+        Without a store, eviction deletes the only copy; with one, only synced
+        workspaces are evicted.
+        """
+        with self.pool.client() as client, docker_call("df"):
+            volumes = client.df().get("Volumes") or []
+        sizes = {v["Name"]: max(0, (v.get("UsageData") or {}).get("Size", 0)) for v in volumes
+                 if (v.get("Labels") or {}).get("workspace") == "true"}
+        total = sum(sizes.values())
+        with self.lock:
+            in_use = self._in_use()
+            candidates = sorted(
+                (entry["last_used"], key) for key, entry in self.state.items()
+                if key not in in_use and key not in self.restoring
+                and (not self.store or entry["synced"] is not None)
+            )
+        for _, key in candidates:
+            if total <= self.quota:
+                break
+            name = volume_name(key)
+            try:
+                with self.pool.client() as client, docker_call("volume_remove"):
+                    client.volumes.get(name).remove()
+            except docker.errors.NotFound:
+                pass
+            except docker.errors.APIError as e:
+                logger.warning(f"Could not evict {name}: {e}")
+                continue
+            total -= sizes.get(name, 0)
+            with self.lock:
+                self.state.pop(key, None)
+            logger.info(f"Evicted workspace {name}")
+        self._save()
+
+    def rebuild(self, containers):
+        """After a restart: count sessions still running and forget volumes removed meanwhile."""
+        with self.pool.client() as client, docker_call("volume_list"):
+            present = {v.name for v in client.volumes.list(filters={'label': 'workspace=true'})}
+        with self.lock:
+            self.state = {k: v for k, v in self.state.items() if volume_name(k) in present}
+            for name in present:
+                self.state.setdefault(name.split("_", 1)[1], {"last_used": 0, "synced": None})
+            self.sessions = {c.name: c.labels['user_id'] for c in containers
+                             if c.labels.get('user_id') in self.state}
+        self._save()
@@ -0,0 +1 @@
+"""Benchmark harness for the booking lifecycle (see benchmarks/README.md)."""
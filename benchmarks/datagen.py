@@ -0,0 +1,87 @@
+"""Seeded generator for users, agents and bookings at realistic distributions."""
+import random
+from datetime import datetime, timedelta
+
+# Most sessions are small notebooks; a few are heavy training jobs.
+CPU_CHOICES = ([1, 2, 4, 8, 16], [30, 35, 20, 10, 5])
+MEMORY_CHOICES = (["2g", "4g", "8g", "16g", "32g"], [25, 35, 25, 10, 5])
+DURATION_CHOICES = ([1, 2, 3, 4, 8, 24], [30, 30, 15, 15, 8, 2])
+IMAGES = (["jupyter/base-notebook", "jupyter/scipy-notebook", "pytorch/pytorch", "tensorflow/tensorflow"],
+          [40, 30, 20, 10])
+STATUS_CHOICES = (["pending", "approved", "active", "completed", "cancelled", "rejected"],
+                  [15, 15, 5, 55, 5, 5])
+DEPARTMENTS = ["CS", "EE", "Physics", "Math", "Biology"]
+AGENT_SHAPES = ([(8, 16), (16, 32), (32, 64), (64, 256)], [40, 35, 20, 5])
+
+
+def _pick(rng, choices):
+    values, weights = choices
+    return rng.choices(values, weights)[0]
+
+
+def _start_time(rng, now, status):
+    """Past starts for finished sessions, lab-hours-biased future starts otherwise."""
+    if status in ("completed", "cancelled", "rejected"):
+        return now - timedelta(days=rng.uniform(1, 180))
+    if status == "active":
+        return now - timedelta(minutes=rng.uniform(5, 60))
+    day = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=rng.randint(0, 6))
+    return day.replace(hour=rng.choice([9, 10, 11, 13, 14, 15, 16, 18, 20])) + timedelta(days=1)
+
+
+def generate(db, User, Agent, Booking, users=200, agents=20, bookings=2000, seed=42,
+             agent_host="127.0.0.1", agent_port=5000, password_hash="x"):
+    """Insert a reproducible dataset and return (user_ids, agent_ids, booking_ids)."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.session.execute(db.insert(User), [{
+        "name": f"Student {i}",
+        "email": f"student{i}@bench.local",
+        "password_hash": password_hash,
+        "role": "student",
+        "department": rng.choice(DEPARTMENTS)
+    } for i in range(users)])
+
+    agent_rows = []
+    for i in range(agents):
+        cpu, mem = _pick(rng, AGENT_SHAPES)
+        agent_rows.append({
+            "name": f"bench-agent-{i}",
+            "ip": agent_host,
+            "port": agent_port,
+            "mac": f"02:00:00:00:{i // 256:02x}:{i % 256:02x}",
+            "status": "online",
+            "total_cpu": cpu,
+            "available_cpu": cpu,
+            "total_mem": mem,
+            "available_mem": mem,
+            "tags": rng.choice(["", "", "gpu", "ml"])
+        })
+    db.session.execute(db.insert(Agent), agent_rows)
+    db.session.commit()
+
+    user_ids = [u for (u,) in db.session.query(User.id).filter(User.email.like("%@bench.local")).all()]
+    agent_ids = [a for (a,) in db.session.query(Agent.id).filter(Agent.name.like("bench-agent-%")).all()]
+
+    booking_rows = []
+    for i in range(bookings):
+        status = _pick(rng, STATUS_CHOICES)
+        start = _start_time(rng, now, status)
+        booking_rows.append({
+            "user_id": rng.choice(user_ids),
+            "agent_id": rng.choice(agent_ids) if status in ("approved", "active", "completed") else None,
+            "cpu": _pick(rng, CPU_CHOICES),
+            "memory": _pick(rng, MEMORY_CHOICES),
+            "image": _pick(rng, IMAGES),
+            "start_time": start,
+            "end_time": start + timedelta(hours=_pick(rng, DURATION_CHOICES)),
+            "status": status,
+            "container_name": f"compute_bench_{i}" if status == "active" else None
+        })
+    for chunk in range(0, len(booking_rows), 1000):
+        db.session.execute(db.insert(Booking), booking_rows[chunk:chunk + 1000])
+    db.session.commit()
+
+    booking_ids = [b for (b,) in db.session.query(Booking.id).all()]
+    return user_ids, agent_ids, booking_ids
@@ -0,0 +1,99 @@
+"""In-process stand-in for agent/agent.py: same HTTP API, no Docker."""
+import itertools
+import random
+import threading
+import time
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+def create_fake_agent(latency=0.0, failure_rate=0.0, seed=0):
+    """Flask app answering like an agent, with fixed latency and random 500s."""
+    app = Flask("fake_agent")
+    rng = random.Random(seed)
+    containers = {}
+    pulls = []
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def delay_or_fail():
+        if latency:
+            time.sleep(latency)
+        with lock:
+            return failure_rate and rng.random() < failure_rate
+
+    @app.get("/health")
+    def health():
+        return jsonify({"status": "ok", "host": "fake", "cpu_percent": 0.0, "memory_percent": 0.0}), 200
+
+    @app.post("/start_container")
+    def start_container():
+        if delay_or_fail():
+            return jsonify({"error": "simulated failure"}), 500
+        data = request.get_json() or {}
+        name = f"compute_{data.get('user_id')}_{next(counter)}"
+        with lock:
+            containers[name] = data
+        port = data.get("port", 8888)
+        return jsonify({"container_name": name, "url": f"http://127.0.0.1:{port}", "port": port}), 200
+
+    @app.post("/stop_container/<name>")
+    def stop_container(name):
+        if delay_or_fail():
+            return jsonify({"error": "simulated failure"}), 500
+        with lock:
+            if containers.pop(name, None) is None:
+                return jsonify({"error": "Container not found"}), 404
+        return jsonify({"msg": "Container stopped", "name": name}), 200
+
+    @app.post("/preempt_container/<name>")
+    def preempt_container(name):
+        with lock:
+            if containers.pop(name, None) is None:
+                return jsonify({"error": "Container not found"}), 404
+        return jsonify({"msg": "Container preempted", "name": name}), 202
+
+    @app.get("/containers")
+    def list_containers():
+        with lock:
+            names = list(containers)
+        return jsonify([{"id": n[-12:], "name": n, "status": "running",
+                         "labels": {"managed_by": "compute_booking"}} for n in names]), 200
+
+    @app.post("/suspend")
+    def suspend():
+        with lock:
+            if containers:
+                return jsonify({"error": "Containers running", "count": len(containers)}), 409
+        return jsonify({"msg": "Suspending"}), 202
+
+    @app.post("/pull")
+    def pull():
+        image = (request.get_json(silent=True) or {}).get("image")
+        if not image:
+            return jsonify({"error": "Missing image parameter"}), 400
+        with lock:
+            pulls.append(image)
+        return jsonify({"msg": "Pull started", "image": image}), 202
+
+    app.containers = containers
+    app.pulls = pulls
+    return app
+
+
+class FakeAgentServer:
+    """Serve a fake agent on a background thread: `with FakeAgentServer() as server: server.port`."""
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.server = make_server(host, port, create_fake_agent(**options), threaded=True)
+        self.host = host
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        return False
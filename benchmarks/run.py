@@ -0,0 +1,216 @@
+"""Benchmark the booking lifecycle against an in-process controller and fake agent.
+
+    python -m benchmarks.run --bookings 5000 --save bench_baseline.json
+    python -m benchmarks.run --bookings 5000 --compare bench_baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, wall, statuses=None):
+    result = {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "throughput_per_s": round(len(latencies) / wall, 1) if wall else None
+    }
+    if statuses:
+        result["statuses"] = statuses
+    return result
+
+
+def measure(calls):
+    """Run zero-arg callables, returning (latencies, wall time, status code counts)."""
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    for call in calls:
+        t0 = time.perf_counter()
+        status = call()
+        latencies.append(time.perf_counter() - t0)
+        if status is not None:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return latencies, time.perf_counter() - started, statuses
+
+
+def bench_book(client, tokens, rng, n):
+    def call(token, start, cpu):
+        return client.post("/api/student/book", json={
+            "cpu": cpu,
+            "memory": "4g",
+            "image": "jupyter/base-notebook",
+            "start_time": start.isoformat(),
+            "duration_hr": 2
+        }, headers={"Authorization": f"Bearer {token}"}).status_code
+
+    base = datetime.utcnow() + timedelta(days=30)
+    calls = []
+    for i in range(n):
+        start = base + timedelta(hours=rng.randint(0, 24 * 30))
+        calls.append(lambda t=rng.choice(tokens), s=start, c=rng.choice([1, 2, 4]): call(t, s, c))
+    return summarize(*measure(calls))
+
+
+def bench_approve(client, admin_headers, booking_ids):
+    calls = [lambda b=b: client.post(f"/api/admin/approve/{b}", json={}, headers=admin_headers).status_code
+             for b in booking_ids]
+    return summarize(*measure(calls))
+
+
+def bench_get(client, headers, path, n):
+    return summarize(*measure([lambda: client.get(path, headers=headers).status_code] * n))
+
+
+def bench_ticks(app, db, Booking, Agent, ticks):
+    from controller.utils.scheduler import run_booking_cycle
+
+    def tick():
+        with app.app_context():
+            run_booking_cycle(db, Booking, Agent, app.config)
+
+    return summarize(*measure([tick] * ticks))
+
+
+def make_due(app, db, Booking, count):
+    """Move `count` approved bookings to start now so the next tick has real work."""
+    with app.app_context():
+        ids = [b for (b,) in db.session.query(Booking.id).filter(Booking.status == "approved")
+               .order_by(Booking.id).limit(count).all()]
+        now = datetime.utcnow()
+        db.session.execute(db.update(Booking).where(Booking.id.in_(ids)).values(
+            start_time=now - timedelta(minutes=1), end_time=now + timedelta(hours=2)))
+        db.session.commit()
+        return len(ids)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print deltas against a saved run; returns False if any p99 regressed past threshold."""
+    ok = True
+    print(f"{'scenario':<24}{'p50 ms':>18}{'p99 ms':>18}{'ops/s':>18}")
+    for name, current in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+
+        def cell(key):
+            if not old.get(key) or current.get(key) is None:
+                return f"{current.get(key)}".rjust(18)
+            delta = (current[key] - old[key]) / old[key] * 100
+            return f"{current[key]} ({delta:+.0f}%)".rjust(18)
+
+        print(f"{name:<24}{cell('p50_ms')}{cell('p99_ms')}{cell('throughput_per_s')}")
+        if old.get("p99_ms") and current["p99_ms"] > old["p99_ms"] * (1 + threshold / 100.0):
+            ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per API scenario")
+    parser.add_argument("--ticks", type=int, default=20, help="steady-state scheduler ticks")
+    parser.add_argument("--due", type=int, default=200, help="bookings started by the cold tick")
+    parser.add_argument("--agent-latency", type=float, default=0.0, help="fake agent latency in seconds")
+    parser.add_argument("--save", help="write results JSON here (e.g. a baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed p99 regression in percent")
+    args = parser.parse_args(argv)
+
+    # The controller binds its engine at import time, so pick the database first. The
+    # benchmark drops all tables: never fall back to the application's DATABASE_URL.
+    os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL",
+                                                f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+    from controller.app import app, db, scheduler
+    from controller.models import User, Agent, Booking
+    from flask_jwt_extended import create_access_token
+    from controller.utils.security import token_claims
+    from benchmarks.datagen import generate
+    from benchmarks.fake_agent import FakeAgentServer
+
+    if scheduler.running:
+        scheduler.pause()  # background jobs would skew the numbers
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    results = {}
+
+    with FakeAgentServer(latency=args.agent_latency, seed=args.seed) as agent_server:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_ids, _, _ = generate(db, User, Agent, Booking, users=args.users, agents=args.agents,
+                                      bookings=args.bookings, seed=args.seed, agent_port=agent_server.port)
+            admin = User(name="Bench Admin", email="admin@bench.local", password_hash="x", role="admin")
+            db.session.add(admin)
+            db.session.commit()
+            tokens = [create_access_token(**token_claims(u)) for u in
+                      User.query.filter(User.id.in_(user_ids[:100])).all()]
+            admin_headers = {"Authorization": "Bearer " + create_access_token(**token_claims(admin))}
+            pending = [b for (b,) in db.session.query(Booking.id).filter(Booking.status == "pending")
+                       .limit(args.requests).all()]
+
+        results["book"] = bench_book(client, tokens, rng, args.requests)
+        results["approve"] = bench_approve(client, admin_headers, pending)
+        results["admin_list_bookings"] = bench_get(client, admin_headers, "/api/admin/bookings?status=pending",
+                                                   max(1, args.requests // 10))
+        results["admin_stats"] = bench_get(client, admin_headers, "/api/admin/stats", args.requests)
+        results["student_bookings"] = bench_get(client, {"Authorization": f"Bearer {tokens[0]}"},
+                                                "/api/student/bookings", args.requests)
+
+        make_due(app, db, Booking, args.due)
+        results["scheduler_tick_cold"] = bench_ticks(app, db, Booking, Agent, 1)
+        results["scheduler_tick"] = bench_ticks(app, db, Booking, Agent, args.ticks)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+            "params": vars(args)
+        },
+        "results": results
+    }
+    print(json.dumps(results, indent=2))
+
+    ok = True
+    if args.compare:
+        with open(args.compare) as f:
+            ok = compare(results, json.load(f), args.threshold)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Simulate a fleet of agents in one asyncio process.
+
+Each virtual agent listens on its own port and speaks the agent HTTP API
+(/health, /start_container, /stop_container/<name>, /preempt_container/<name>,
+/containers, /suspend, /pull, /workspaces/<id>/prepare) with configurable
+latency, failures, image pull times and outages. Preempted containers keep
+their resources for the grace period, and a suspended agent stops answering
+until it wakes, which stands in for Wake-on-LAN after about --outage-seconds.
+With --controller the agents self-register and push heartbeats like real ones.
+
+    python -m benchmarks.simulator --agents 200 --base-port 6000 \\
+        --controller http://localhost:8000 --token agent-secret
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger("simulator")
+
+REASONS = {200: "OK", 201: "Created", 202: "Accepted", 204: "No Content", 400: "Bad Request",
+           404: "Not Found", 409: "Conflict", 500: "Internal Server Error"}
+
+
+@dataclass
+class SimConfig:
+    host: str = "127.0.0.1"
+    base_port: int = 6000
+    agents: int = 10
+    latency_ms: float = 20.0  # median
+    latency_sigma: float = 0.5  # lognormal shape; 0 = constant latency
+    failure_rate: float = 0.0  # share of start/stop calls answered with 500
+    pull_seconds: float = 30.0  # median time to pull an image the agent hasn't seen
+    pull_sigma: float = 0.8
+    mtbf: float = 0.0  # mean seconds between outages per agent, 0 = never down
+    outage_seconds: float = 60.0
+    total_cpu: int = 16
+    total_mem: int = 64
+    seed: int = 42
+    controller: str = ""
+    token: str = "agent-secret"
+    heartbeat_interval: float = 5.0
+
+
+def lognormal(rng, median, sigma):
+    return median * rng.lognormvariate(0, sigma) if sigma else median
+
+
+async def http_request(host, port, method, path, payload=None, headers=None, timeout=10):
+    """Minimal HTTP/1.1 client: returns (status, decoded JSON body or None)."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close",
+             f"Content-Length: {len(body)}", "Content-Type: application/json"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = raw.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+class VirtualAgent:
+    def __init__(self, index, config, rng):
+        self.index = index
+        self.config = config
+        self.rng = rng
+        self.port = config.base_port + index if config.base_port else 0
+        self.name = f"sim-agent-{index}"
+        self.images = set()
+        self.containers = {}
+        self.down = False
+        self.agent_id = None
+        self.counter = itertools.count(1)
+        self.tasks = set()
+        self.stats = {"requests": 0, "failures": 0, "pulls": 0, "dropped": 0, "preempted": 0, "suspends": 0}
+
+    def used(self):
+        return (sum(c["cpu"] for c in self.containers.values()),
+                sum(int(str(c["memory"]).rstrip("gm") or 0) for c in self.containers.values()))
+
+    async def pull(self, image):
+        if image not in self.images:
+            self.stats["pulls"] += 1
+            await asyncio.sleep(lognormal(self.rng, self.config.pull_seconds, self.config.pull_sigma))
+            self.images.add(image)
+
+    async def sleep_until_woken(self):
+        """Suspended: no answers and no heartbeats until woken."""
+        await asyncio.sleep(2)  # the real agent suspends 2 s after answering
+        self.down = True
+        await asyncio.sleep(lognormal(self.rng, self.config.outage_seconds, 0.5))
+        self.down = False
+
+    async def route(self, method, path, data):
+        if method == "GET" and path == "/health":
+            cpu, mem = self.used()
+            return 200, {"status": "ok", "host": self.name,
+                         "cpu_percent": round(100.0 * cpu / self.config.total_cpu, 1),
+                         "memory_percent": round(100.0 * mem / self.config.total_mem, 1)}
+        if method == "GET" and path == "/containers":
+            return 200, [{"id": f"{n[-12:]}", "name": n, "status": "running",
+                          "labels": {"managed_by": "compute_booking", "user_id": str(c["user_id"])}}
+                         for n, c in self.containers.items()]
+        if method == "POST" and path == "/start_container":
+            if self.rng.random() < self.config.failure_rate:
+                return 500, {"error": "simulated failure"}
+            image = data.get("image")
+            if not image:
+                return 400, {"error": "Missing image parameter"}
+            await self.pull(image)
+            name = f"compute_{data.get('user_id')}_{next(self.counter)}"
+            self.containers[name] = {"user_id": data.get("user_id"), "cpu": data.get("cpu", 1),
+                                     "memory": data.get("memory", "2g")}
+            port = data.get("port", 8888)
+            return 200, {"container_name": name, "url": f"http://{self.config.host}:{port}", "port": port}
+        if method == "POST" and path.startswith("/stop_container/"):
+            if self.rng.random() < self.config.failure_rate:
+                return 500, {"error": "simulated failure"}
+            name = path.rsplit("/", 1)[1]
+            if self.containers.pop(name, None) is None:
+                return 404, {"error": "Container not found"}
+            return 200, {"msg": "Container stopped", "name": name}
+        if method == "POST" and path.startswith("/preempt_container/"):
+            name = path.rsplit("/", 1)[1]
+            if name not in self.containers:
+                return 404, {"error": "Container not found"}
+            grace = float(data.get("grace", 30))
+            self.stats["preempted"] += 1
+            # Like the agent: the container keeps running (and its cores) through the grace period
+            asyncio.get_running_loop().call_later(grace, self.containers.pop, name, None)
+            return 202, {"msg": "Container preempted", "name": name, "grace": grace}
+        if method == "POST" and path == "/suspend":
+            if self.containers:
+                return 409, {"error": "Containers running", "count": len(self.containers)}
+            self.stats["suspends"] += 1
+            self.background(self.sleep_until_woken())
+            return 202, {"msg": "Suspending"}
+        if method == "POST" and path == "/pull":
+            image = data.get("image")
+            if not image:
+                return 400, {"error": "Missing image parameter"}
+            self.background(self.pull(image))
+            return 202, {"msg": "Pull started", "image": image}
+        if method == "POST" and path.startswith("/workspaces/") and path.endswith("/prepare"):
+            return 200, {"msg": "Ready"}  # simulated agents keep no workspaces
+        return 404, {"error": "Not found"}
+
+    def background(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)  # keep a reference until it finishes
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, v in
+                       (line.split(":", 1) for line in header_lines if ":" in line)}
+            length = int(headers.get("content-length", 0))
+            raw = await reader.readexactly(length) if length else b""
+
+            if self.down:
+                # A powered-off machine never answers: let the caller hit its timeout
+                self.stats["dropped"] += 1
+                await asyncio.sleep(3600)
+                return
+
+            self.stats["requests"] += 1
+            await asyncio.sleep(lognormal(self.rng, self.config.latency_ms, self.config.latency_sigma) / 1000.0)
+            status, payload = await self.route(method, path.split("?", 1)[0], json.loads(raw) if raw else {})
+            if status >= 500:
+                self.stats["failures"] += 1
+            body = json.dumps(payload).encode()
+            writer.write((f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                          f"Connection: close\r\n\r\n").encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.config.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def outages(self):
+        while True:
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.config.mtbf))
+            self.down = True
+            logger.info(f"{self.name} down")
+            await asyncio.sleep(lognormal(self.rng, self.config.outage_seconds, 0.5))
+            self.down = False
+            logger.info(f"{self.name} back up")
+
+    async def heartbeats(self):
+        """Register with the controller, then heartbeat like agent/heartbeat.py does."""
+        host, _, port = self.config.controller.split("://", 1)[-1].rstrip("/").partition(":")
+        port = int(port or 80)
+        headers = {"X-Agent-Token": self.config.token}
+        while True:
+            try:
+                if self.down:
+                    pass  # a machine that is off sends nothing
+                elif self.agent_id is None:
+                    status, body = await http_request(host, port, "POST", "/api/agents/register", {
+                        "name": self.name, "ip": self.config.host, "port": self.port,
+                        "mac": f"02:00:00:00:{self.index // 256:02x}:{self.index % 256:02x}",
+                        "total_cpu": self.config.total_cpu, "total_mem": self.config.total_mem,
+                        "tags": "sim", "can_suspend": True
+                    }, headers)
+                    if status in (200, 201):
+                        self.agent_id = body["id"]
+                else:
+                    cpu, mem = self.used()
+                    status, _ = await http_request(host, port, "POST", "/api/agents/heartbeat", {
+                        "id": self.agent_id,
+                        "cpu": round(100.0 * cpu / self.config.total_cpu, 1),
+                        "mem": round(100.0 * mem / self.config.total_mem, 1),
+                        "containers": list(self.containers)
+                    }, headers)
+                    if status == 404:
+                        self.agent_id = None
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.debug(f"{self.name} heartbeat failed: {e}")
+            await asyncio.sleep(self.config.heartbeat_interval)
+
+
+async def run(config, duration=0, report_every=30):
+    rng = random.Random(config.seed)
+    agents = [await VirtualAgent(i, config, random.Random(rng.random())).start() for i in range(config.agents)]
+    tasks = []
+    for agent in agents:
+        if config.mtbf:
+            tasks.append(asyncio.create_task(agent.outages()))
+        if config.controller:
+            tasks.append(asyncio.create_task(agent.heartbeats()))
+    logger.info(f"{len(agents)} agents listening on {config.host}:{agents[0].port}-{agents[-1].port}")
+
+    started = time.monotonic()
+    try:
+        while not duration or time.monotonic() - started < duration:
+            await asyncio.sleep(min(report_every, duration) if duration else report_every)
+            totals = {k: sum(a.stats[k] for a in agents) for k in agents[0].stats}
+            totals["containers"] = sum(len(a.containers) for a in agents)
+            totals["down"] = sum(a.down for a in agents)
+            logger.info(f"fleet: {totals}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        for agent in agents:
+            agent.server.close()
+    return agents
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = SimConfig()
+    for field, value in vars(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run, 0 = until Ctrl-C")
+    args = vars(parser.parse_args(argv))
+    duration = args.pop("duration")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(run(SimConfig(**args), duration=duration))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
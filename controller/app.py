@@ -3,7 +3,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from apscheduler.schedulers.background import BackgroundScheduler
+from prometheus_client import start_http_server
+from controller.utils.database import RoutingSession, engine_options, REPLICA
 import os
+import time
 import logging
 
 # Configure logging
@@ -13,7 +16,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
 scheduler = BackgroundScheduler()
 
@@ -21,9 +24,93 @@ def create_app():
     app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), 'templates'))
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'supersecret')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///compute.db')
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL', '')  # for @read_replica views
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # Below the server's idle-connection cutoff, so pooled connections aren't found dead
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))  # Postgres, 0 = none
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JSON_SORT_KEYS'] = False
+    app.config['AGENT_TOKEN'] = os.environ.get('AGENT_TOKEN', 'agent-secret')
+    app.config['AGENT_HEARTBEAT_INTERVAL'] = int(os.environ.get('AGENT_HEARTBEAT_INTERVAL', 5))
+    app.config['AGENT_HEARTBEAT_TIMEOUT'] = int(os.environ.get('AGENT_HEARTBEAT_TIMEOUT', 30))
+    app.config['HEARTBEAT_FLUSH_SECONDS'] = float(os.environ.get('HEARTBEAT_FLUSH_SECONDS', 2))
+    app.config['IDLE_WARN_MINUTES'] = int(os.environ.get('IDLE_WARN_MINUTES', 15))
+    app.config['IDLE_STOP_MINUTES'] = int(os.environ.get('IDLE_STOP_MINUTES', 30))  # 0 disables reclamation
+    app.config['IDLE_GRACE_MINUTES'] = int(os.environ.get('IDLE_GRACE_MINUTES', 10))
+    app.config['SQL_PROFILING'] = os.environ.get('SQL_PROFILING', 'False') == 'True'
+    app.config['SQL_QUERY_BUDGET'] = int(os.environ.get('SQL_QUERY_BUDGET', 0))  # 0 = no budget
+    app.config['SQL_BUDGET_STRICT'] = os.environ.get('SQL_BUDGET_STRICT', 'False') == 'True'
+    app.config['SQL_REPEAT_THRESHOLD'] = int(os.environ.get('SQL_REPEAT_THRESHOLD', 5))
+    app.config['TELEMETRY_ROLLUP_LAG'] = int(os.environ.get('TELEMETRY_ROLLUP_LAG', 120))
+    app.config['TELEMETRY_RAW_RETENTION_HOURS'] = int(os.environ.get('TELEMETRY_RAW_RETENTION_HOURS', 6))
+    app.config['TELEMETRY_MINUTE_RETENTION_DAYS'] = int(os.environ.get('TELEMETRY_MINUTE_RETENTION_DAYS', 7))
+    app.config['TELEMETRY_HOUR_RETENTION_DAYS'] = int(os.environ.get('TELEMETRY_HOUR_RETENTION_DAYS', 365))
+    # werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; changing it rehashes on next login
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_HASH_WORKERS'] = int(
+        os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    app.config['LOGIN_RATE_WINDOW'] = int(os.environ.get('LOGIN_RATE_WINDOW', 60))
+    app.config['LOGIN_RATE_PER_IP'] = int(os.environ.get('LOGIN_RATE_PER_IP', 30))  # 0 = unlimited
+    app.config['LOGIN_RATE_PER_ACCOUNT'] = int(os.environ.get('LOGIN_RATE_PER_ACCOUNT', 10))
+    # Reverse proxies in front of the controller (1 behind Traefik); client IPs come from X-Forwarded-For
+    app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+    # Seconds a cached user active/role lookup is trusted; bounds how long a disabled account keeps working
+    app.config['USER_STATUS_TTL'] = float(os.environ.get('USER_STATUS_TTL', 5))
+    app.config['USER_STATUS_CACHE_SIZE'] = int(os.environ.get('USER_STATUS_CACHE_SIZE', 10000))
+    # Comma-separated; use subnet broadcasts (e.g. 10.0.1.255) when agents sit on several subnets
+    app.config['WOL_BROADCAST'] = tuple(os.environ.get('WOL_BROADCAST', '<broadcast>').split(','))
+    app.config['WOL_PORT'] = int(os.environ.get('WOL_PORT', 9))
+    app.config['WOL_REPEAT'] = int(os.environ.get('WOL_REPEAT', 3))
+    app.config['POWER_MANAGEMENT'] = os.environ.get('POWER_MANAGEMENT', 'False') == 'True'  # suspend idle agents
+    app.config['POWER_SLEEP_HORIZON_MINUTES'] = int(os.environ.get('POWER_SLEEP_HORIZON_MINUTES', 60))
+    app.config['POWER_KEEP_AWAKE'] = int(os.environ.get('POWER_KEEP_AWAKE', 1))
+    # until boot time is measured
+    app.config['POWER_DEFAULT_LEAD_SECONDS'] = int(os.environ.get('POWER_DEFAULT_LEAD_SECONDS', 600))
+    app.config['POWER_WAKE_MARGIN'] = float(os.environ.get('POWER_WAKE_MARGIN', 1.5))
+    # covers the 1-min tick
+    app.config['POWER_WAKE_SLACK_SECONDS'] = int(os.environ.get('POWER_WAKE_SLACK_SECONDS', 120))
+    app.config['POWER_WAKE_RETRY_SECONDS'] = int(os.environ.get('POWER_WAKE_RETRY_SECONDS', 300))
+    app.config['BACKFILL_PREEMPT_GRACE_SECONDS'] = int(os.environ.get('BACKFILL_PREEMPT_GRACE_SECONDS', 30))
+    app.config['BACKFILL_BATCH'] = int(os.environ.get('BACKFILL_BATCH', 20))  # backfill starts per tick
+    # Weekly reservation limits in CPU-hours / memory-GB-hours, 0 = unlimited
+    app.config['QUOTA_USER_CPU_HOURS'] = float(os.environ.get('QUOTA_USER_CPU_HOURS', 0))
+    app.config['QUOTA_USER_MEM_GB_HOURS'] = float(os.environ.get('QUOTA_USER_MEM_GB_HOURS', 0))
+    app.config['QUOTA_DEPT_CPU_HOURS'] = float(os.environ.get('QUOTA_DEPT_CPU_HOURS', 0))
+    app.config['QUOTA_DEPT_MEM_GB_HOURS'] = float(os.environ.get('QUOTA_DEPT_MEM_GB_HOURS', 0))
+    app.config['AUTO_APPROVE'] = os.environ.get('AUTO_APPROVE', 'False') == 'True'
+    app.config['AUTO_APPROVE_LEAD_MINUTES'] = int(os.environ.get('AUTO_APPROVE_LEAD_MINUTES', 15))
+    app.config['BULK_BOOKING_MAX'] = int(os.environ.get('BULK_BOOKING_MAX', 500))
+    # Run the background jobs in this process; with several web workers, disable it there
+    # and run `flask scheduler` once instead so every job runs exactly once per tick
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', 'True') == 'True'
+    # Port of the /metrics server of `flask scheduler`, 0 = none (web workers serve theirs on /metrics)
+    app.config['SCHEDULER_METRICS_PORT'] = int(os.environ.get('SCHEDULER_METRICS_PORT', 8001))
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL', '')  # share booking events across processes
+    app.config['EVENT_QUEUE_SIZE'] = int(os.environ.get('EVENT_QUEUE_SIZE', 100))
+    app.config['EVENT_KEEPALIVE_SECONDS'] = int(os.environ.get('EVENT_KEEPALIVE_SECONDS', 15))
+    app.config['EVENT_STREAM_MAX_SECONDS'] = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 900))
+    app.config['EVENT_RETRY_MS'] = int(os.environ.get('EVENT_RETRY_MS', 3000))
+    app.config['REGISTRY_MIRROR'] = os.environ.get('REGISTRY_MIRROR', '')  # host:port of the pull-through cache
+    # Minutes before a session its agent restores the workspace from the store, 0 = only at start
+    app.config['WORKSPACE_PREPARE_MINUTES'] = int(os.environ.get('WORKSPACE_PREPARE_MINUTES', 10))
+    app.config['RECONCILE_INTERVAL_SECONDS'] = int(os.environ.get('RECONCILE_INTERVAL_SECONDS', 120))
+    app.config['RECONCILE_WORKERS'] = int(os.environ.get('RECONCILE_WORKERS', 16))  # concurrent /containers calls
+    app.config['RECONCILE_TIMEOUT'] = float(os.environ.get('RECONCILE_TIMEOUT', 5))
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))  # 0 disables archiving
+    app.config['ARCHIVE_CHUNK'] = int(os.environ.get('ARCHIVE_CHUNK', 1000))
+    app.config['ARCHIVE_MAX_CHUNKS'] = int(os.environ.get('ARCHIVE_MAX_CHUNKS', 50))  # per run
+    app.config['ARCHIVE_PAUSE_SECONDS'] = float(os.environ.get('ARCHIVE_PAUSE_SECONDS', 0.1))
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA: app.config['DATABASE_REPLICA_URL']}
 
     db.init_app(app)
     jwt.init_app(app)
@@ -32,25 +119,50 @@ def create_app():
     from controller.routes.auth import auth_bp
     from controller.routes.student import student_bp
     from controller.routes.admin import admin_bp
+    from controller.routes.agents import agents_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(student_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(agents_bp)
+
+    from controller.utils import metrics, profiler, security, events
+    metrics.init_app(app)
+    profiler.init_app(app)
+    security.init_app(app, jwt)
+    events.init_app(app)
 
     with app.app_context():
         from controller import models
         db.create_all()
         logger.info("Database initialized")
 
-        # import scheduler here to avoid circular imports (models import controller.app)
-        from controller.utils.scheduler import schedule_jobs
+    if app.config['SCHEDULER_ENABLED']:
+        start_scheduler(app)
+
+    @app.cli.command("scheduler")
+    def run_scheduler():
+        """Run the background jobs until interrupted (pair with SCHEDULER_ENABLED=False web workers)."""
+        if app.config['SCHEDULER_METRICS_PORT']:
+            # Job durations, failures and agent call latency are recorded in this process
+            start_http_server(app.config['SCHEDULER_METRICS_PORT'])
+        start_scheduler(app)
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            scheduler.shutdown()
+    
+    logger.info("Flask app created and configured")
+    return app
+
+def start_scheduler(app):
+    # import scheduler here to avoid circular imports (models import controller.app)
+    from controller.utils.scheduler import schedule_jobs
     # schedule background jobs
     schedule_jobs(scheduler, app)
     if not scheduler.running:
         scheduler.start()
         logger.info("Scheduler started")
-    
-    logger.info("Flask app created and configured")
-    return app
 
 app = create_app()
 
@@ -0,0 +1,34 @@
+"""gunicorn settings for the controller web workers: `gunicorn -c controller/gunicorn.conf.py controller.app:app`.
+
+Flags in GUNICORN_CMD_ARGS (e.g. --workers 4) override the values here.
+"""
+import os
+import shutil
+
+# Async workers so idle booking event streams don't each hold a process
+worker_class = "gevent"
+workers = 2
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+# Each worker keeps its own counters; they go to files here and /metrics merges them.
+# Set before the workers import prometheus_client, which reads it at import time.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/controller-metrics")
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to this run's totals
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def post_fork(server, worker):
+    # psycopg2 waits on the socket in C and would block every greenlet of the worker
+    # during each query; psycogreen makes it wait through the gevent hub instead
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
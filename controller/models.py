@@ -1,5 +1,6 @@
 from controller.app import db
 from datetime import datetime
+from sqlalchemy import event, inspect
 import enum
 
 class User(db.Model):
@@ -18,6 +19,7 @@ class AgentStatus(enum.Enum):
     ONLINE = "online"
     OFFLINE = "offline"
     MAINTENANCE = "maintenance"
+    SLEEPING = "sleeping"
 
 class Agent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,7 +28,8 @@ class Agent(db.Model):
     mac = db.Column(db.String(32))
     port = db.Column(db.Integer, default=5000)
     wol_enabled = db.Column(db.Boolean, default=True)
-    status = db.Column(db.String(20), default="offline")  # online/offline/maintenance
+    can_suspend = db.Column(db.Boolean, default=False)  # SUSPEND_COMMAND works there, reported at registration
+    status = db.Column(db.String(20), default="offline")  # online/offline/maintenance/sleeping
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     total_cpu = db.Column(db.Integer, default=4)
     total_mem = db.Column(db.Integer, default=8)  # in GB
@@ -34,9 +37,35 @@ class Agent(db.Model):
     available_mem = db.Column(db.Integer, default=8)
     tags = db.Column(db.String(255), default="")  # comma-separated: gpu,ml,heavy
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)  # set once the agent pushes heartbeats
+    cpu_percent = db.Column(db.Float)
+    mem_percent = db.Column(db.Float)
+    running_containers = db.Column(db.Integer, default=0)
+    suspended_at = db.Column(db.DateTime)
+    wake_sent_at = db.Column(db.DateTime)  # cleared once the agent is seen again
+    boot_seconds = db.Column(db.Float)  # moving average of wake-to-first-contact time
+    backfill_cpu = db.Column(db.Integer, default=0)  # part of total in use by preemptible sessions
+    backfill_mem = db.Column(db.Integer, default=0)
+    state_changed_at = db.Column(db.DateTime, default=datetime.utcnow)  # last change to a listed field
+    numa_nodes = db.Column(db.Integer, default=1)
+    node_free_cpu = db.Column(db.Integer)  # most unpinned cores on one NUMA node, from heartbeats
     
     bookings = db.relationship('Booking', backref='agent', lazy=True)
 
+    __table_args__ = (
+        # placement: agents of a status with enough free capacity
+        db.Index('ix_agent_status_capacity', 'status', 'available_cpu', 'available_mem'),
+    )
+
+# Fields shown in the agent list; heartbeat-only columns don't count as a state change
+AGENT_STATE_FIELDS = ("name", "ip", "status", "total_cpu", "total_mem", "available_cpu", "available_mem", "tags")
+
+@event.listens_for(Agent, "before_update")
+def _touch_agent_state(mapper, connection, agent):
+    state = inspect(agent)
+    if any(state.attrs[name].history.has_changes() for name in AGENT_STATE_FIELDS):
+        agent.state_changed_at = datetime.utcnow()
+
 class BookingStatus(enum.Enum):
     PENDING = "pending"
     APPROVED = "approved"
@@ -44,6 +73,7 @@ class BookingStatus(enum.Enum):
     ACTIVE = "active"
     COMPLETED = "completed"
     CANCELLED = "cancelled"
+    QUEUED = "queued"  # backfill waiting for free capacity
 
 class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -61,3 +91,89 @@ class Booking(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     notes = db.Column(db.String(500))
     rejection_reason = db.Column(db.String(500))
+    idle_since = db.Column(db.DateTime)  # reported by the agent, cleared on activity
+    idle_warned_at = db.Column(db.DateTime)
+    end_reason = db.Column(db.String(20))  # expired/idle
+    priority_class = db.Column(db.String(20), default="guaranteed")  # guaranteed/backfill
+    preempted_at = db.Column(db.DateTime)  # last time a backfill session was preempted and requeued
+
+    __table_args__ = (
+        # scheduler scans: due/upcoming bookings by status and start time
+        db.Index('ix_booking_status_start', 'status', 'start_time'),
+    )
+
+class UsageSample(db.Model):
+    """Container usage time series: raw agent samples plus 1-min and 1-hour rollups."""
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, nullable=False)
+    agent_id = db.Column(db.Integer)
+    resolution = db.Column(db.Integer, nullable=False)  # seconds per bucket, 0 = raw sample
+    ts = db.Column(db.Integer, nullable=False)  # epoch seconds (bucket start for rollups)
+    cpu = db.Column(db.Float)  # percent of one core, averaged over the bucket
+    cpu_max = db.Column(db.Float)
+    mem = db.Column(db.Float)  # MB, averaged over the bucket
+    mem_max = db.Column(db.Float)
+    samples = db.Column(db.Integer, default=1)
+
+    __table_args__ = (
+        db.Index('ix_usage_booking_res_ts', 'booking_id', 'resolution', 'ts'),
+        db.Index('ix_usage_res_ts', 'resolution', 'ts'),
+    )
+
+class RollupWatermark(db.Model):
+    """Highest usage_sample id already folded into the rollups, so late samples are merged once."""
+    resolution = db.Column(db.Integer, primary_key=True, autoincrement=False)  # source resolution
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
+class UsageLedger(db.Model):
+    """Reserved CPU-hours and memory-GB-hours per user or department and week."""
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # user/department
+    key = db.Column(db.String(100), nullable=False)  # user id or department name
+    period_start = db.Column(db.DateTime, nullable=False)  # Monday 00:00 UTC
+    cpu_hours = db.Column(db.Float, nullable=False, default=0.0)
+    mem_gb_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', 'period_start', name='uq_ledger_scope_key_period'),
+    )
+
+class WorkspaceLocation(db.Model):
+    """Agents holding a cached copy of a user's workspace volume, from heartbeats."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    agent_id = db.Column(db.Integer, db.ForeignKey('agent.id'), nullable=False)
+    seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'agent_id', name='uq_workspace_user_agent'),
+    )
+
+class BookingArchive(db.Model):
+    """Terminal bookings moved out of the hot table; monthly range partitions on Postgres."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    agent_id = db.Column(db.Integer)
+    cpu = db.Column(db.Integer, nullable=False)
+    memory = db.Column(db.String(20), nullable=False)
+    image = db.Column(db.String(100), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, primary_key=True)  # partition key must be part of the key
+    status = db.Column(db.String(20))
+    container_name = db.Column(db.String(100))
+    access_url = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    notes = db.Column(db.String(500))
+    rejection_reason = db.Column(db.String(500))
+    idle_since = db.Column(db.DateTime)
+    idle_warned_at = db.Column(db.DateTime)
+    end_reason = db.Column(db.String(20))
+    priority_class = db.Column(db.String(20))
+    preempted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_booking_archive_user_created', 'user_id', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (end_time)'},
+    )
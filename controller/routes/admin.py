@@ -1,7 +1,20 @@
-from flask import Blueprint, request, jsonify
-from controller.models import db, Booking, Agent, User
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from controller.models import db, Booking, BookingArchive, Agent, User, UsageSample, UsageLedger, WorkspaceLocation
+from controller.utils.telemetry import RAW, MINUTE, HOUR
+from controller.utils.placement import find_agent, free_capacity, memory_gb, workspace_agents
+from controller.utils.quota import charge, charge_many, over_quota, refund, period_start
+from controller.utils.events import publish
+from controller.utils.archive import booking_history, TERMINAL
+from controller.utils.conditional import collection_version
+from controller.utils.database import read_replica
+from controller.utils.scheduler import agent_request
+from controller.schemas import BulkBookingSchema
+from marshmallow import ValidationError
+from sqlalchemy import func
+from flask_jwt_extended import jwt_required
+from controller.utils.security import current_role
 from datetime import datetime, timedelta
+import time
 from functools import wraps
 import logging
 
@@ -13,25 +26,38 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def decorated(*args, **kwargs):
-        identity = get_jwt_identity()
-        if identity.get("role") != "admin":
+        # The role claim is checked against the cached user status when the token is verified
+        if current_role() != "admin":
             return jsonify({"error": "Admin role required"}), 403
         return fn(*args, **kwargs)
     return decorated
 
 @admin_bp.get("/bookings")
 @admin_required
+@read_replica
 def list_bookings():
     status = request.args.get("status")
-    query = Booking.query
-    if status:
-        query = query.filter_by(status=status)
-    
-    bookings = query.order_by(Booking.created_at.desc()).all()
-    return jsonify([{
+    filters = {"status": status} if status else {}
+    # Only terminal bookings are ever archived
+    include_archive = status in (None, *TERMINAL)
+    sources = [(Booking.updated_at, *([Booking.status == status] if status else []))]
+    if include_archive:
+        sources.append((BookingArchive.updated_at, *([BookingArchive.status == status] if status else [])))
+    version = collection_version(db, *sources, scope=status or "")
+    cached = version.not_modified()
+    if cached:
+        return cached
+
+    history = booking_history(db, Booking, BookingArchive, include_archive=include_archive, **filters)
+    bookings = db.session.execute(
+        db.select(history, User.name.label("user_name"))
+        .outerjoin(User, User.id == history.c.user_id)
+        .order_by(history.c.created_at.desc())
+    ).all()
+    return version.apply(jsonify([{
         "id": b.id,
         "user_id": b.user_id,
-        "user_name": b.user.name if b.user else "Unknown",
+        "user_name": b.user_name or "Unknown",
         "agent_id": b.agent_id,
         "status": b.status,
         "start": b.start_time.isoformat() if b.start_time else None,
@@ -40,8 +66,113 @@ def list_bookings():
         "cpu": b.cpu,
         "memory": b.memory,
         "url": b.access_url,
-        "rejection_reason": b.rejection_reason
-    } for b in bookings]), 200
+        "rejection_reason": b.rejection_reason,
+        "priority_class": b.priority_class
+    } for b in bookings])), 200
+
+@admin_bp.post("/bookings/bulk")
+@admin_required
+def bulk_booking():
+    """Book the same session for a list of users (e.g. a class) in one transaction."""
+    try:
+        data = BulkBookingSchema().load(request.get_json())
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    start = data["start_time"]
+    if start < datetime.utcnow():
+        return jsonify({"error": "Start time must be in the future"}), 400
+    end = start + timedelta(hours=int(data["duration_hr"]))
+
+    limit = current_app.config['BULK_BOOKING_MAX']
+    if len(data["user_ids"]) + len(data["emails"]) > limit:
+        return jsonify({"error": f"At most {limit} bookings per request"}), 400
+
+    # Resolve all users in one query
+    filters = []
+    if data["user_ids"]:
+        filters.append(User.id.in_(data["user_ids"]))
+    if data["emails"]:
+        filters.append(User.email.in_(data["emails"]))
+    if not filters:
+        return jsonify({"error": "user_ids or emails required"}), 400
+    users = db.session.query(User.id, User.email, User.department, User.active).filter(db.or_(*filters)).all()
+    missing = sorted(set(data["user_ids"]) - {u.id for u in users}) + \
+        sorted(set(data["emails"]) - {u.email for u in users})
+    if missing:
+        return jsonify({"error": "Unknown users", "missing": missing}), 400
+    departments = {u.id: u.department for u in users if u.active}
+    inactive = sorted(u.id for u in users if not u.active)
+
+    # One set-based overlap check for the whole class
+    conflicts = sorted(user_id for (user_id,) in db.session.query(Booking.user_id).filter(
+        Booking.user_id.in_(list(departments)),
+        Booking.status.in_(["approved", "active"]),
+        Booking.start_time < end,
+        Booking.end_time > start
+    ).distinct())
+    if conflicts and not data["skip_conflicts"]:
+        return jsonify({"error": "Bookings overlap with existing sessions", "conflicts": conflicts,
+                        "inactive": inactive}), 409
+
+    # Weekly limits apply as for single bookings, from one ledger read for the whole class
+    candidates = {u: departments[u] for u in set(departments) - set(conflicts)}
+    over = over_quota(db, candidates, start, data["cpu"], data["memory"], data["duration_hr"], current_app.config)
+    if over and not data["skip_conflicts"]:
+        return jsonify({"error": "Bookings exceed weekly quotas", "over_quota": over, "conflicts": conflicts,
+                        "inactive": inactive}), 403
+    user_ids = sorted(set(candidates) - set(over))
+    if not user_ids:
+        return jsonify({"error": "No users left to book", "conflicts": conflicts, "over_quota": over,
+                        "inactive": inactive}), 409
+
+    rows = [{
+        "user_id": user_id,
+        "cpu": data["cpu"],
+        "memory": data["memory"],
+        "image": data["image"],
+        "start_time": start,
+        "end_time": end,
+        "status": "pending",
+        "priority_class": "guaranteed",
+        "notes": data.get("tags", "")
+    } for user_id in user_ids]
+
+    placed = 0
+    if data["place"]:
+        free, online = free_capacity(db, Booking, Agent, start, end)
+        mem = memory_gb(data["memory"])
+        for row in rows:
+            fits = [a for a in free if free[a][0] >= row["cpu"] and free[a][1] >= mem]
+            if not fits:
+                break
+            # Spread like single approvals: awake agents first, then the most free CPU
+            agent_id = min(fits, key=lambda a: (a not in online, -free[a][0]))
+            free[agent_id][0] -= row["cpu"]
+            free[agent_id][1] -= mem
+            row.update(status="approved", agent_id=agent_id)
+            placed += 1
+
+    try:
+        # One row per user, so map ids back by user instead of forcing parameter order
+        ids = dict((user_id, booking_id) for booking_id, user_id in db.session.execute(
+            db.insert(Booking).returning(Booking.id, Booking.user_id), rows
+        ))
+        charge_many(db, rows, departments)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Bulk booking failed: {e}")
+        return jsonify({"error": "Failed to create bookings"}), 500
+
+    for row in rows:
+        publish(row["user_id"], {"id": ids[row["user_id"]], "status": row["status"], "url": None,
+                                 "start": start.isoformat(), "end": end.isoformat(),
+                                 "end_reason": None, "idle_warning": False})
+    logger.info(f"Bulk booking: {len(ids)} created, {placed} placed, {len(conflicts)} conflicts, "
+                f"{len(over)} over quota, {len(inactive)} inactive")
+    return jsonify({"created": len(ids), "ids": [ids[row["user_id"]] for row in rows], "placed": placed,
+                    "conflicts": conflicts, "over_quota": over, "inactive": inactive}), 201
 
 @admin_bp.post("/approve/<int:id>")
 @admin_required
@@ -59,15 +190,16 @@ def approve_booking(id):
     
     if agent_id:
         agent = Agent.query.get(agent_id)
-        if not agent or agent.status != "online":
+        if not agent or agent.status not in ("online", "sleeping"):
             return jsonify({"error": "Selected agent not available"}), 400
     else:
-        # Auto-select best agent based on resource availability
-        agent = Agent.query.filter(
-            Agent.status == "online",
-            Agent.available_cpu >= booking.cpu,
-            Agent.available_mem >= int(booking.memory.rstrip('gm'))
-        ).order_by(Agent.available_cpu.desc()).first()
+        # Auto-select best agent based on resource availability; sleeping agents are
+        # woken before the booking starts, but an awake one avoids the boot entirely.
+        # Capacity held by backfill sessions is reclaimed by preemption at start time.
+        held = workspace_agents(db, WorkspaceLocation, [booking.user_id])
+        agent = find_agent(Agent, booking.cpu, memory_gb(booking.memory),
+                           statuses=("online", "sleeping"), reclaim_backfill=True,
+                           prefer=held.get(booking.user_id, ()))
         
         if not agent:
             return jsonify({"error": "No available agents"}), 503
@@ -99,6 +231,7 @@ def reject_booking(id):
     try:
         booking.status = "rejected"
         booking.rejection_reason = reason
+        refund(db, booking, booking.user.department)
         db.session.commit()
         logger.info(f"Booking rejected: {id}")
         return jsonify({"msg": "Booking rejected"}), 200
@@ -122,6 +255,7 @@ def extend_booking(id):
     
     try:
         booking.end_time = booking.end_time + timedelta(hours=hours)
+        charge(db, booking, booking.user.department, hours=hours)
         db.session.commit()
         logger.info(f"Booking extended: {id} by {hours} hours")
         return jsonify({"msg": "Booking extended", "new_end": booking.end_time.isoformat()}), 200
@@ -132,9 +266,14 @@ def extend_booking(id):
 
 @admin_bp.get("/agents")
 @admin_required
+@read_replica
 def list_agents():
+    version = collection_version(db, (Agent.state_changed_at,))
+    cached = version.not_modified()
+    if cached:
+        return cached
     agents = Agent.query.all()
-    return jsonify([{
+    return version.apply(jsonify([{
         "id": a.id,
         "name": a.name,
         "ip": a.ip,
@@ -144,7 +283,7 @@ def list_agents():
         "total_cpu": a.total_cpu,
         "total_mem": a.total_mem,
         "tags": a.tags
-    } for a in agents]), 200
+    } for a in agents])), 200
 
 @admin_bp.post("/agents/<int:id>/status")
 @admin_required
@@ -169,19 +308,161 @@ def update_agent_status(id):
         logger.error(f"Status update failed: {e}")
         return jsonify({"error": "Failed to update agent status"}), 500
 
+@admin_bp.post("/users/<int:id>/status")
+@admin_required
+def update_user_status(id):
+    user = db.session.get(User, id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    data = request.get_json() or {}
+    active = data.get("active")
+    if not isinstance(active, bool):
+        return jsonify({"error": "active must be true or false"}), 400
+
+    try:
+        user.active = active
+        db.session.commit()
+        # Other controller processes pick this up once their cached entry expires
+        current_app.extensions["user_status"].invalidate(id)
+        logger.info(f"User status updated: {id} -> {'active' if active else 'disabled'}")
+        return jsonify({"msg": "User status updated"}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"User status update failed: {e}")
+        return jsonify({"error": "Failed to update user status"}), 500
+
+@admin_bp.get("/quota")
+@admin_required
+@read_replica
+def quota_usage():
+    """Reserved usage per user or department for a week (default: the current one)."""
+    scope = request.args.get("scope", "department")
+    if scope not in ("user", "department"):
+        return jsonify({"error": "scope must be user or department"}), 400
+    try:
+        week = period_start(datetime.fromisoformat(request.args["week"])) if "week" in request.args \
+            else period_start(datetime.utcnow())
+    except ValueError:
+        return jsonify({"error": "Invalid week"}), 400
+
+    rows = UsageLedger.query.filter_by(scope=scope, period_start=week) \
+        .order_by(UsageLedger.cpu_hours.desc()).all()
+    return jsonify({
+        "period_start": week.isoformat(),
+        "scope": scope,
+        "usage": [{"key": r.key, "cpu_hours": round(r.cpu_hours, 2), "mem_gb_hours": round(r.mem_gb_hours, 2)}
+                  for r in rows]
+    }), 200
+
 @admin_bp.get("/stats")
 @admin_required
+@read_replica
 def get_stats():
-    total_bookings = Booking.query.count()
-    pending = Booking.query.filter_by(status="pending").count()
-    active = Booking.query.filter_by(status="active").count()
-    completed = Booking.query.filter_by(status="completed").count()
+    statuses = db.union_all(db.select(Booking.status), db.select(BookingArchive.status)).subquery()
+    by_status = dict(db.session.execute(
+        db.select(statuses.c.status, func.count()).group_by(statuses.c.status)
+    ).all())
     online_agents = Agent.query.filter_by(status="online").count()
     
     return jsonify({
-        "total_bookings": total_bookings,
-        "pending": pending,
-        "active": active,
-        "completed": completed,
+        "total_bookings": sum(by_status.values()),
+        "pending": by_status.get("pending", 0),
+        "active": by_status.get("active", 0),
+        "completed": by_status.get("completed", 0),
         "online_agents": online_agents
     }), 200
+
+@admin_bp.get("/bookings/<int:id>/usage")
+@admin_required
+@read_replica
+def booking_usage(id):
+    booking = Booking.query.get(id) or BookingArchive.query.filter_by(id=id).first()
+    if not booking:
+        return jsonify({"error": "Booking not found"}), 404
+
+    resolution = request.args.get("resolution", MINUTE, type=int)
+    if resolution not in (RAW, MINUTE, HOUR):
+        return jsonify({"error": "resolution must be 0, 60 or 3600"}), 400
+
+    rows = db.session.query(
+        UsageSample.ts, UsageSample.cpu, UsageSample.cpu_max, UsageSample.mem, UsageSample.mem_max
+    ).filter(
+        UsageSample.booking_id == id,
+        UsageSample.resolution == resolution
+    ).order_by(UsageSample.ts).all()
+
+    return jsonify({
+        "booking_id": id,
+        "requested": {"cpu": booking.cpu, "memory": booking.memory},
+        "resolution": resolution,
+        "columns": ["ts", "cpu", "cpu_max", "mem", "mem_max"],
+        "points": [list(r) for r in rows],
+        "peak": {
+            "cpu": max((r.cpu_max for r in rows), default=None),
+            "mem": max((r.mem_max for r in rows), default=None)
+        }
+    }), 200
+
+@admin_bp.get("/usage/heatmap")
+@admin_required
+@read_replica
+def usage_heatmap():
+    hours = min(request.args.get("hours", 24, type=int), 24 * 31)
+    now = int(time.time())
+    since = now - now % HOUR - hours * HOUR
+
+    # Sum of per-session averages = CPU (percent of one core) and MB used on each agent per hour
+    rows = db.session.query(
+        UsageSample.agent_id, UsageSample.ts, func.sum(UsageSample.cpu), func.sum(UsageSample.mem)
+    ).filter(
+        UsageSample.resolution == HOUR,
+        UsageSample.ts >= since
+    ).group_by(UsageSample.agent_id, UsageSample.ts).all()
+
+    buckets = [since + i * HOUR for i in range(hours)]
+    index = {ts: i for i, ts in enumerate(buckets)}
+    cpu, mem = {}, {}
+    for agent_id, ts, cpu_sum, mem_sum in rows:
+        if ts not in index:
+            continue
+        cpu.setdefault(agent_id, [None] * hours)[index[ts]] = round(cpu_sum, 1)
+        mem.setdefault(agent_id, [None] * hours)[index[ts]] = round(mem_sum, 1)
+
+    return jsonify({"hours": buckets, "cpu": cpu, "mem": mem}), 200
+
+@admin_bp.post("/images/prefetch")
+@admin_required
+def prefetch_images():
+    """Have agents pull images ahead of time (through the registry mirror when configured).
+
+    Defaults to the images of bookings starting in the next 24 hours, on all
+    online agents.
+    """
+    data = request.get_json(silent=True) or {}
+    images = data.get("images")
+    if not images:
+        now = datetime.utcnow()
+        images = [image for image, in db.session.query(Booking.image).filter(
+            Booking.status.in_(["pending", "approved"]),
+            Booking.start_time < now + timedelta(hours=24)
+        ).distinct()]
+    query = Agent.query.filter_by(status="online")
+    if data.get("agent_ids"):
+        query = query.filter(Agent.id.in_(data["agent_ids"]))
+
+    started, failed = [], {}
+    for agent in query.all():
+        for image in images:
+            try:
+                res = agent_request("post", agent, "pull", "/pull", json={"image": image}, timeout=5)
+                if res.status_code != 202:
+                    raise RuntimeError(f"agent answered {res.status_code}")
+                started.append({"agent_id": agent.id, "image": image})
+            except Exception as e:
+                failed.setdefault(agent.id, {})[image] = str(e)
+    return jsonify({
+        "mirror": current_app.config["REGISTRY_MIRROR"] or None,
+        "started": started,
+        "failed": failed
+    }), 200
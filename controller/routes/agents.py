@@ -0,0 +1,112 @@
+from flask import Blueprint, request, jsonify, current_app
+from controller.models import db, Agent, Booking, UsageSample, RollupWatermark
+from controller.schemas import AgentRegisterSchema, HeartbeatSchema, TelemetryBatchSchema
+from controller.utils.heartbeat import record_heartbeat, flush_due, flush_heartbeats
+from controller.utils.telemetry import ingest_samples
+from marshmallow import ValidationError
+from datetime import datetime
+from functools import wraps
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+agents_bp = Blueprint('agents', __name__, url_prefix="/api/agents")
+
+# Agent ids known to exist, so heartbeats don't need a lookup each time.
+_known_agents = set()
+
+def agent_token_required(fn):
+    """Decorator to ensure the caller presents the shared agent token."""
+    @wraps(fn)
+    def decorated(*args, **kwargs):
+        token = request.headers.get("X-Agent-Token", "")
+        if not hmac.compare_digest(token, current_app.config["AGENT_TOKEN"]):
+            return jsonify({"error": "Invalid agent token"}), 401
+        return fn(*args, **kwargs)
+    return decorated
+
+@agents_bp.post("/register")
+@agent_token_required
+def register_agent():
+    try:
+        data = AgentRegisterSchema().load(request.get_json())
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    ip = data["ip"] or request.remote_addr
+    agent = Agent.query.filter_by(ip=ip, port=data["port"]).first()
+    created = agent is None
+
+    try:
+        if created:
+            agent = Agent(ip=ip, port=data["port"])
+            db.session.add(agent)
+            in_use_cpu, in_use_mem = 0, 0
+        else:
+            # Keep reservations held by running sessions when the hardware changes
+            in_use_cpu = (agent.total_cpu or 0) - (agent.available_cpu or 0)
+            in_use_mem = (agent.total_mem or 0) - (agent.available_mem or 0)
+
+        now = datetime.utcnow()
+        agent.name = data["name"]
+        if data["mac"]:
+            agent.mac = data["mac"]
+        agent.tags = data["tags"]
+        agent.total_cpu = data["total_cpu"]
+        agent.total_mem = data["total_mem"]
+        agent.numa_nodes = data["numa_nodes"]
+        agent.can_suspend = data["can_suspend"]
+        agent.available_cpu = data["total_cpu"] - in_use_cpu
+        agent.available_mem = data["total_mem"] - in_use_mem
+        if agent.status != "maintenance":
+            agent.status = "online"
+        agent.last_seen = now
+        agent.heartbeat_at = now
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Agent registration failed: {e}")
+        return jsonify({"error": "Failed to register agent"}), 500
+
+    _known_agents.add(agent.id)
+    logger.info(f"Agent {'registered' if created else 're-registered'}: {agent.id} ({ip}:{agent.port})")
+    return jsonify({
+        "id": agent.id,
+        "heartbeat_interval": current_app.config["AGENT_HEARTBEAT_INTERVAL"],
+        "registry_mirror": current_app.config["REGISTRY_MIRROR"] or None
+    }), 201 if created else 200
+
+@agents_bp.post("/heartbeat")
+@agent_token_required
+def heartbeat():
+    try:
+        data = HeartbeatSchema().load(request.get_json())
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    agent_id = data["id"]
+    if agent_id not in _known_agents:
+        if not db.session.get(Agent, agent_id):
+            return jsonify({"error": "Unknown agent, register first"}), 404
+        _known_agents.add(agent_id)
+
+    record_heartbeat(agent_id, data)
+    if flush_due(current_app.config["HEARTBEAT_FLUSH_SECONDS"]):
+        flush_heartbeats(db, Agent, Booking)
+    return "", 204
+
+@agents_bp.post("/telemetry")
+@agent_token_required
+def telemetry():
+    try:
+        data = TelemetryBatchSchema().load(request.get_json())
+    except ValidationError as err:
+        return jsonify({"error": err.messages}), 400
+
+    try:
+        stored = ingest_samples(db, UsageSample, RollupWatermark, Booking, data["id"], data["samples"])
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Telemetry ingest failed for agent {data['id']}: {e}")
+        return jsonify({"error": "Failed to store telemetry"}), 500
+    return jsonify({"stored": stored}), 200
@@ -1,7 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from controller.models import db, User
 from controller.schemas import RegisterSchema, LoginSchema
-from werkzeug.security import generate_password_hash, check_password_hash
+from controller.utils.security import HashingBusy, hash_password, verify_password, needs_rehash, token_claims
 from flask_jwt_extended import create_access_token
 from marshmallow import ValidationError
 import logging
@@ -9,6 +9,21 @@ import logging
 logger = logging.getLogger(__name__)
 auth_bp = Blueprint('auth', __name__, url_prefix="/api/auth")
 
+def _throttled(limiter, key):
+    retry = current_app.extensions["login_limits"][limiter].hit(key)
+    if not retry:
+        return None
+    logger.warning(f"Login rate limit ({limiter}) hit for {key}")
+    resp = jsonify({"error": "Too many attempts, try again later"})
+    resp.headers["Retry-After"] = str(retry)
+    return resp, 429
+
+def _busy():
+    logger.warning("Password hashing pool saturated, shedding request")
+    resp = jsonify({"error": "Server busy, try again shortly"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
 @auth_bp.post("/register")
 def register():
     try:
@@ -16,16 +31,25 @@ def register():
         data = schema.load(request.get_json())
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
-    
+
+    throttled = _throttled("ip", request.remote_addr)
+    if throttled:
+        return throttled
+
     # Check if user exists
     if User.query.filter_by(email=data["email"]).first():
         return jsonify({"error": "Email already registered"}), 409
     
+    try:
+        password_hash = hash_password(current_app, data["password"])
+    except HashingBusy:
+        return _busy()
+
     try:
         user = User(
             name=data["name"],
             email=data["email"],
-            password_hash=generate_password_hash(data["password"]),
+            password_hash=password_hash,
             role=data.get("role", "student"),
             department="General"  # Always set department to avoid DB errors
         )
@@ -46,14 +70,31 @@ def login():
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
     
+    # Throttle before touching the hash so floods can't buy CPU time
+    throttled = _throttled("ip", request.remote_addr) or _throttled("account", data["email"].lower())
+    if throttled:
+        return throttled
+
     user = User.query.filter_by(email=data["email"]).first()
-    if not user or not check_password_hash(user.password_hash, data["password"]):
-        return jsonify({"error": "Invalid credentials"}), 401
-    
+    try:
+        if not user or not verify_password(current_app, user.password_hash, data["password"]):
+            return jsonify({"error": "Invalid credentials"}), 401
+    except HashingBusy:
+        return _busy()
+
     if not user.active:
         return jsonify({"error": "Account disabled"}), 403
+
+    method = current_app.config["PASSWORD_HASH_METHOD"]
+    if needs_rehash(user.password_hash, method):
+        try:
+            user.password_hash = hash_password(current_app, data["password"])
+            db.session.commit()
+            logger.info(f"Rehashed password for {data['email']} with {method}")
+        except HashingBusy:
+            pass  # the old hash still verifies; upgrade on a quieter login
     
-    token = create_access_token(identity={"id": user.id, "role": user.role, "email": user.email})
+    token = create_access_token(**token_claims(user))
     logger.info(f"User login: {data['email']}")
     return jsonify({"access_token": token, "role": user.role}), 200
 
@@ -1,9 +1,17 @@
-from flask import Blueprint, request, jsonify
-from controller.models import db, Booking, User, Agent
+from flask import Blueprint, Response, request, jsonify, current_app
+from controller.models import db, Booking, BookingArchive, User, Agent
 from controller.schemas import BookingRequestSchema, BookingResponseSchema
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from controller.utils.security import current_user_id
+from controller.utils.quota import check_quota, charge, refund, usage, period_start
+from controller.utils.events import booking_event
+from controller.utils.archive import booking_history
+from controller.utils.conditional import collection_version
 from datetime import datetime, timedelta
 from marshmallow import ValidationError
+import json
+import queue
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,8 +20,7 @@ student_bp = Blueprint('student', __name__, url_prefix="/api/student")
 @student_bp.post("/book")
 @jwt_required()
 def create_booking():
-    identity = get_jwt_identity()
-    user_id = identity["id"]
+    user_id = current_user_id()
     
     try:
         schema = BookingRequestSchema()
@@ -23,7 +30,10 @@ def create_booking():
     
     # Validate time
     start = data["start_time"]
-    if start < datetime.utcnow():
+    backfill = data["priority_class"] == "backfill"
+    if backfill:
+        start = max(start, datetime.utcnow())  # backfill runs as soon as capacity allows
+    elif start < datetime.utcnow():
         return jsonify({"error": "Start time must be in the future"}), 400
     
     end = start + timedelta(hours=int(data["duration_hr"]))
@@ -40,6 +50,12 @@ def create_booking():
     
     if overlap:
         return jsonify({"error": "Booking overlaps with existing session"}), 409
+
+    department = db.session.query(User.department).filter(User.id == user_id).scalar()
+    error = check_quota(db, user_id, department, start, data["cpu"], data["memory"],
+                        data["duration_hr"], current_app.config)
+    if error:
+        return jsonify({"error": error}), 403
     
     try:
         booking = Booking(
@@ -49,10 +65,13 @@ def create_booking():
             image=data["image"],
             start_time=start,
             end_time=end,
-            status="pending",
+            # backfill needs no approval: the scheduler queues it onto spare capacity
+            status="queued" if backfill else "pending",
+            priority_class=data["priority_class"],
             notes=data.get("tags", "")
         )
         db.session.add(booking)
+        charge(db, booking, department)
         db.session.commit()
         logger.info(f"Booking created: {booking.id} by user {user_id}")
         return jsonify({"msg": "Booking submitted", "id": booking.id}), 201
@@ -64,10 +83,18 @@ def create_booking():
 @student_bp.get("/bookings")
 @jwt_required()
 def view_bookings():
-    identity = get_jwt_identity()
-    user_id = identity["id"]
-    bookings = Booking.query.filter_by(user_id=user_id).order_by(Booking.created_at.desc()).all()
-    return jsonify([{
+    user_id = current_user_id()
+    version = collection_version(
+        db,
+        (Booking.updated_at, Booking.user_id == user_id),
+        (BookingArchive.updated_at, BookingArchive.user_id == user_id)
+    )
+    cached = version.not_modified()
+    if cached:
+        return cached
+    history = booking_history(db, Booking, BookingArchive, user_id=user_id)
+    bookings = db.session.execute(db.select(history).order_by(history.c.created_at.desc())).all()
+    return version.apply(jsonify([{
         "id": b.id,
         "status": b.status,
         "start": b.start_time.isoformat() if b.start_time else None,
@@ -75,24 +102,72 @@ def view_bookings():
         "url": b.access_url,
         "image": b.image,
         "cpu": b.cpu,
-        "memory": b.memory
-    } for b in bookings]), 200
+        "memory": b.memory,
+        "idle_since": b.idle_since.isoformat() if b.idle_since else None,
+        "idle_warning": b.idle_warned_at is not None,
+        "end_reason": b.end_reason,
+        "priority_class": b.priority_class,
+        "preempted_at": b.preempted_at.isoformat() if b.preempted_at else None
+    } for b in bookings])), 200
+
+@student_bp.get("/bookings/stream")
+@jwt_required(locations=["headers", "query_string"])  # EventSource can't set headers: ?jwt=<token>
+def stream_bookings():
+    """Server-sent events with the caller's booking changes.
+
+    Starts with a snapshot of open bookings, then pushes one `booking` event per
+    state change. Streams end after EVENT_STREAM_MAX_SECONDS so the browser
+    reconnects and the token is checked again.
+    """
+    user_id = current_user_id()
+    config = current_app.config
+    bus = current_app.extensions["events"]
+    # Subscribe before the snapshot so no change falls between the two
+    subscription = bus.subscribe(user_id)
+    snapshot = [booking_event(b) for b in Booking.query.filter(
+        Booking.user_id == user_id,
+        Booking.status.in_(["pending", "approved", "queued", "active"])
+    )]
+    db.session.remove()  # don't hold a DB connection for the life of the stream
+
+    keepalive = config['EVENT_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + config['EVENT_STREAM_MAX_SECONDS']
+
+    def generate():
+        try:
+            yield f"retry: {config['EVENT_RETRY_MS']}\n\n"
+            for payload in snapshot:
+                yield f"event: booking\ndata: {json.dumps(payload)}\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    payload = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: booking\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            bus.unsubscribe(user_id, subscription)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @student_bp.post("/bookings/<int:id>/cancel")
 @jwt_required()
 def cancel_booking(id):
-    identity = get_jwt_identity()
-    user_id = identity["id"]
+    user_id = current_user_id()
     
     booking = Booking.query.get(id)
     if not booking or booking.user_id != user_id:
         return jsonify({"error": "Booking not found"}), 404
     
-    if booking.status not in ["pending", "approved"]:
+    if booking.status not in ["pending", "approved", "queued"]:
         return jsonify({"error": f"Cannot cancel booking in {booking.status} status"}), 400
     
     try:
         booking.status = "cancelled"
+        # A requeued backfill booking keeps the hours it ran before preemption, as on queue expiry
+        ran_until = booking.preempted_at or booking.start_time
+        refund(db, booking, booking.user.department, hours=(booking.end_time - ran_until).total_seconds() / 3600.0)
         db.session.commit()
         logger.info(f"Booking cancelled: {id}")
         return jsonify({"msg": "Booking cancelled"}), 200
@@ -104,15 +179,25 @@ def cancel_booking(id):
 @student_bp.get("/profile")
 @jwt_required()
 def get_profile():
-    identity = get_jwt_identity()
-    user = User.query.get(identity["id"])
+    user = db.session.get(User, current_user_id())
     if not user:
         return jsonify({"error": "User not found"}), 404
+    config = current_app.config
+    week = usage(db, user.id, user.department, period_start(datetime.utcnow()))
     return jsonify({
         "id": user.id,
         "name": user.name,
         "email": user.email,
         "role": user.role,
         "department": user.department,
-        "active": user.active
+        "active": user.active,
+        "usage": {
+            "period_start": period_start(datetime.utcnow()).isoformat(),
+            "cpu_hours": week["user"][0],
+            "mem_gb_hours": week["user"][1],
+            "cpu_hours_limit": config['QUOTA_USER_CPU_HOURS'] or None,
+            "mem_gb_hours_limit": config['QUOTA_USER_MEM_GB_HOURS'] or None,
+            "department_cpu_hours": week["department"][0],
+            "department_mem_gb_hours": week["department"][1]
+        }
     }), 200
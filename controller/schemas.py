@@ -18,6 +18,18 @@ class BookingRequestSchema(Schema):
     start_time = fields.DateTime(required=True)
     duration_hr = fields.Int(required=True, validate=validate.Range(min=1, max=24))
     tags = fields.Str(load_default="")  # optional: filter agents by tags
+    # backfill: no approval, runs on spare capacity as soon as possible, may be preempted
+    priority_class = fields.Str(validate=validate.OneOf(["guaranteed", "backfill"]), load_default="guaranteed")
+
+class BulkBookingSchema(BookingRequestSchema):
+    """One booking with the same shape and time for every listed user."""
+    user_ids = fields.List(fields.Int(), load_default=list)
+    emails = fields.List(fields.Email(), load_default=list)
+    place = fields.Bool(load_default=False)  # approve onto agents in the same request
+    # class sessions are reserved up front; backfill has to be booked one by one
+    priority_class = fields.Str(validate=validate.Equal("guaranteed", error="Bulk bookings are always guaranteed"),
+                                load_default="guaranteed")
+    skip_conflicts = fields.Bool(load_default=False)  # book the rest instead of failing on overlaps or quotas
 
 class ApproveBookingSchema(Schema):
     agent_id = fields.Int(required=True)
@@ -41,3 +53,28 @@ class AgentSchema(Schema):
     available_mem = fields.Int()
     total_cpu = fields.Int()
     total_mem = fields.Int()
+
+class AgentRegisterSchema(Schema):
+    name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    ip = fields.Str(load_default=None, validate=validate.Length(max=100))
+    mac = fields.Str(load_default=None, validate=validate.Length(max=32))
+    port = fields.Int(load_default=5000, validate=validate.Range(min=1, max=65535))
+    total_cpu = fields.Int(required=True, validate=validate.Range(min=1))
+    total_mem = fields.Int(required=True, validate=validate.Range(min=1))
+    tags = fields.Str(load_default="", validate=validate.Length(max=255))
+    numa_nodes = fields.Int(load_default=1, validate=validate.Range(min=1))
+    can_suspend = fields.Bool(load_default=False)
+
+class HeartbeatSchema(Schema):
+    id = fields.Int(required=True)
+    cpu = fields.Float(load_default=None)  # percent
+    mem = fields.Float(load_default=None)  # percent
+    containers = fields.List(fields.Str(), load_default=list)
+    idle = fields.Dict(keys=fields.Str(), values=fields.Int(), load_default=None)  # container -> idle seconds
+    node_free_cpu = fields.Int(load_default=None)  # None when the agent doesn't pin cores
+    workspaces = fields.List(fields.Int(), load_default=None)  # user ids with a cached workspace
+
+class TelemetryBatchSchema(Schema):
+    id = fields.Int(required=True)
+    # compact rows: {"c": container_name, "t": epoch, "cpu": pct, "mem": MB}
+    samples = fields.List(fields.Dict(), required=True)
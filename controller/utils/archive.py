@@ -0,0 +1,82 @@
+import datetime
+import time
+import logging
+from sqlalchemy import literal, text
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = ("completed", "cancelled", "rejected")
+
+# Columns shared by the hot and archive tables, in the order history queries return them
+HISTORY_COLUMNS = ("id", "user_id", "agent_id", "cpu", "memory", "image", "start_time", "end_time",
+                   "status", "container_name", "access_url", "created_at", "updated_at", "notes",
+                   "rejection_reason", "idle_since", "idle_warned_at", "end_reason", "priority_class",
+                   "preempted_at")
+
+def month_start(when):
+    return datetime.datetime(when.year, when.month, 1)
+
+def next_month(when):
+    return datetime.datetime(when.year + when.month // 12, when.month % 12 + 1, 1)
+
+def ensure_partitions(db, months):
+    """Create the monthly booking_archive partitions covering `months` (Postgres only)."""
+    if db.engine.dialect.name != "postgresql":
+        return
+    for month in sorted(set(months)):
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS booking_archive_{month:%Y_%m} PARTITION OF booking_archive "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+        ))
+
+def archive_bookings(db, Booking, BookingArchive, config, now=None):
+    """Move terminal bookings that ended more than ARCHIVE_AFTER_DAYS ago, in short chunks.
+
+    Each chunk copies and deletes up to ARCHIVE_CHUNK rows in its own transaction,
+    so locks on the hot table are only ever held briefly. Returns rows moved.
+    """
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=config['ARCHIVE_AFTER_DAYS'])
+    moved = 0
+    for _ in range(config['ARCHIVE_MAX_CHUNKS']):
+        rows = db.session.query(Booking.id, Booking.end_time).filter(
+            Booking.status.in_(TERMINAL),
+            Booking.end_time < cutoff
+        ).order_by(Booking.id).limit(config['ARCHIVE_CHUNK']).all()
+        if not rows:
+            break
+        ids = [booking_id for booking_id, _ in rows]
+        try:
+            ensure_partitions(db, [month_start(end) for _, end in rows])
+            columns = [getattr(Booking, c) for c in HISTORY_COLUMNS]
+            db.session.execute(
+                db.insert(BookingArchive).from_select(
+                    list(HISTORY_COLUMNS) + ["archived_at"],
+                    db.select(*columns, literal(now)).where(Booking.id.in_(ids))
+                )
+            )
+            db.session.execute(db.delete(Booking).where(Booking.id.in_(ids)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Archiving chunk of {len(ids)} bookings failed: {e}")
+            break
+        moved += len(ids)
+        if len(ids) < config['ARCHIVE_CHUNK']:
+            break
+        time.sleep(config['ARCHIVE_PAUSE_SECONDS'])  # let other writers in between chunks
+    if moved:
+        logger.info(f"Archived {moved} bookings that ended before {cutoff.isoformat()}")
+    return moved
+
+def booking_history(db, Booking, BookingArchive, include_archive=True, **filters):
+    """Subquery over live and archived bookings with HISTORY_COLUMNS, filtered by column=value."""
+    def part(model):
+        query = db.select(*[getattr(model, c) for c in HISTORY_COLUMNS])
+        for name, value in filters.items():
+            query = query.where(getattr(model, name) == value)
+        return query
+
+    if not include_archive:
+        return part(Booking).subquery()
+    return db.union_all(part(Booking), part(BookingArchive)).subquery()
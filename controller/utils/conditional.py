@@ -0,0 +1,45 @@
+"""Conditional GET for polled list endpoints.
+
+A collection's version is the row count and newest change timestamp of each
+source table, read in one aggregate query. Matching If-None-Match gets a 304
+before any rows are loaded. If-Modified-Since is not honoured: at one-second
+resolution it can't see a change later in the same second, nor a deletion.
+"""
+import hashlib
+from flask import request, Response
+from sqlalchemy import func
+
+class Version:
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def not_modified(self):
+        """A 304 response if the client's copy is current, else None."""
+        fresh = bool(request.if_none_match) and request.if_none_match.contains_weak(self.etag)
+        return self.apply(Response(status=304)) if fresh else None
+
+    def apply(self, response):
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        # Per-user data: browsers may keep it but must revalidate every poll
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Authorization")
+        return response
+
+def collection_version(db, *sources, scope=""):
+    """Version of the rows selected by each (timestamp column, *criteria) source.
+
+    `scope` folds request parameters that change the response (e.g. a status
+    filter) into the ETag.
+    """
+    columns = []
+    for column, *criteria in sources:
+        columns.append(db.select(func.count()).select_from(column.table).where(*criteria).scalar_subquery())
+        columns.append(db.select(func.max(column)).where(*criteria).scalar_subquery())
+    values = db.session.execute(db.select(*columns)).one()
+    stamps = [v for v in values[1::2] if v is not None]
+    digest = hashlib.sha1(repr((scope, tuple(values))).encode()).hexdigest()[:20]
+    return Version(digest, max(stamps) if stamps else None)
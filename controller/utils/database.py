@@ -0,0 +1,48 @@
+"""Engine pooling and read-replica routing.
+
+Connections to a remote Postgres (e.g. Neon) are expensive to open, so the
+pool is sized, recycled and pre-pinged from config. With DATABASE_REPLICA_URL
+set, views marked @read_replica run their queries on the replica; everything
+else, including the auth check before such a view, flushes and scheduler jobs,
+stays on the primary.
+"""
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+REPLICA = "replica"
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`; also applied to the replica bind."""
+    options = {"pool_pre_ping": config['DB_POOL_PRE_PING'], "pool_recycle": config['DB_POOL_RECYCLE']}
+    if not url.startswith("sqlite"):  # in-memory SQLite uses a StaticPool, which takes no size
+        options.update(pool_size=config['DB_POOL_SIZE'], max_overflow=config['DB_MAX_OVERFLOW'],
+                       pool_timeout=config['DB_POOL_TIMEOUT'])
+    if url.startswith("postgres") and config['DB_STATEMENT_TIMEOUT_MS']:
+        options["connect_args"] = {"options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+class RoutingSession(Session):
+    """Session that reads from the replica inside @read_replica views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get("read_replica"):
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_replica(fn):
+    """Route a read-only view's queries to the replica; place it below the auth decorator.
+
+    Replicas lag the primary slightly, so use it for listings and reports, not
+    for views that must see a write the caller just made.
+    """
+    @wraps(fn)
+    def decorated(*args, **kwargs):
+        g.read_replica = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            g.read_replica = False
+    return decorated
@@ -0,0 +1,142 @@
+"""Booking state change events for the student SSE stream.
+
+Booking changes are picked up from the ORM session on flush and published
+once the transaction commits, so routes and scheduler stages need no extra
+calls. Events go through an in-process bus, or through Redis pub/sub when
+REDIS_URL is set so every controller process sees every change.
+"""
+import json
+import queue
+import threading
+import time
+import logging
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TRACKED = ("status", "access_url", "end_time", "idle_warned_at")
+
+class EventBus:
+    """Fan events out to per-connection queues, keyed by user id."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self.lock:
+            queues = self.subscribers.get(user_id)
+            if queues:
+                queues.discard(q)
+                if not queues:
+                    del self.subscribers[user_id]
+
+    def connections(self):
+        with self.lock:
+            return sum(len(queues) for queues in self.subscribers.values())
+
+    def deliver(self, user_id, payload):
+        with self.lock:
+            queues = list(self.subscribers.get(user_id, ()))
+        for q in queues:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                pass  # a stalled client misses events; it re-syncs from GET /bookings on reconnect
+
+    def publish(self, user_id, payload):
+        self.deliver(user_id, payload)
+
+class RedisEventBus(EventBus):
+    """Publish through Redis; one pattern subscription per process feeds the local queues."""
+
+    prefix = "booking-events:"
+
+    def __init__(self, client, queue_size=100):
+        super().__init__(queue_size)
+        self.redis = client
+        threading.Thread(target=self._listen, name="event-listener", daemon=True).start()
+
+    def publish(self, user_id, payload):
+        try:
+            self.redis.publish(f"{self.prefix}{user_id}", json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"Event publish failed, delivering locally only: {e}")
+            self.deliver(user_id, payload)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self.prefix}*")
+                for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        user_id = int(message["channel"].decode().rsplit(":", 1)[1])
+                        self.deliver(user_id, json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"Event listener lost Redis connection, retrying: {e}")
+                time.sleep(5)
+
+def publish(user_id, payload):
+    """Publish outside the ORM hooks, e.g. for rows written with a bulk insert."""
+    bus = current_app.extensions.get("events")
+    if bus is not None:
+        bus.publish(user_id, payload)
+
+def booking_event(b):
+    return {
+        "id": b.id,
+        "status": b.status,
+        "url": b.access_url,
+        "start": b.start_time.isoformat() if b.start_time else None,
+        "end": b.end_time.isoformat() if b.end_time else None,
+        "end_reason": b.end_reason,
+        "idle_warning": b.idle_warned_at is not None
+    }
+
+def _collect(session, flush_context):
+    from controller.models import Booking
+    events = session.info.setdefault("booking_events", {})
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Booking):
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(state.attrs[name].history.has_changes() for name in TRACKED):
+            events[obj.id] = (obj.user_id, booking_event(obj))
+
+def _publish(session):
+    events = session.info.pop("booking_events", None)
+    if not events or not has_app_context():
+        return
+    bus = current_app.extensions.get("events")
+    if bus is None:
+        return
+    for user_id, payload in events.values():
+        bus.publish(user_id, payload)
+
+def _discard(session):
+    session.info.pop("booking_events", None)
+
+def init_app(app):
+    bus = None
+    if app.config['REDIS_URL']:
+        try:
+            import redis
+            bus = RedisEventBus(redis.Redis.from_url(app.config['REDIS_URL']), app.config['EVENT_QUEUE_SIZE'])
+        except ImportError:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using in-process events")
+    app.extensions["events"] = bus or EventBus(app.config['EVENT_QUEUE_SIZE'])
+
+    if not event.contains(Session, "after_flush", _collect):
+        event.listen(Session, "after_flush", _collect)
+        event.listen(Session, "after_commit", _publish)
+        event.listen(Session, "after_rollback", _discard)
@@ -0,0 +1,155 @@
+import datetime
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latest heartbeat per agent id, applied to the DB in one batch by flush_heartbeats().
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+# Workspace user ids last stored per agent; reports only touch the DB when they change
+_workspaces = {}
+
+def record_heartbeat(agent_id, payload):
+    """Buffer a heartbeat; a newer heartbeat from the same agent replaces the older one."""
+    with _lock:
+        _pending[agent_id] = (datetime.datetime.utcnow(), payload)
+
+def flush_due(interval):
+    return time.monotonic() - _last_flush >= interval
+
+def flush_heartbeats(db, Agent, Booking):
+    """Apply buffered heartbeats with one bulk UPDATE and return how many were applied."""
+    global _pending, _last_flush
+    with _lock:
+        batch, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+
+    rows = [{
+        "id": agent_id,
+        "last_seen": seen,
+        "heartbeat_at": seen,
+        "cpu_percent": payload.get("cpu"),
+        "mem_percent": payload.get("mem"),
+        "running_containers": len(payload.get("containers") or []),
+        "node_free_cpu": payload.get("node_free_cpu")
+    } for agent_id, (seen, payload) in batch.items()]
+
+    try:
+        db.session.execute(db.update(Agent), rows)
+        for agent in Agent.query.filter(Agent.id.in_(list(batch)), Agent.status == "sleeping"):
+            mark_awake(agent, batch[agent.id][0])
+        # Only agents that were marked offline come back; maintenance is left alone.
+        db.session.execute(
+            db.update(Agent)
+            .where(Agent.id.in_(list(batch)), Agent.status == "offline")
+            .values(status="online", state_changed_at=datetime.datetime.utcnow())
+        )
+        apply_idle_reports(db, Booking, batch)
+        changed = apply_workspace_reports(db, batch)
+        db.session.commit()
+        _workspaces.update(changed)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to apply {len(rows)} heartbeats: {e}")
+        return 0
+    return len(rows)
+
+def mark_awake(agent, seen, settle=60, alpha=0.3):
+    """Bring a sleeping agent back online and fold the measured boot time into its average.
+
+    Contact within `settle` seconds of suspending, without a wake sent since, is the
+    agent finishing up before it goes down rather than coming back.
+    """
+    if agent.wake_sent_at is None and agent.suspended_at and \
+            seen < agent.suspended_at + datetime.timedelta(seconds=settle):
+        return False
+    if agent.wake_sent_at is not None:
+        boot = max(0.0, (seen - agent.wake_sent_at).total_seconds())
+        agent.boot_seconds = boot if agent.boot_seconds is None else \
+            (1 - alpha) * agent.boot_seconds + alpha * boot
+        logger.info(f"Agent {agent.id} woke after {boot:.0f}s")
+    agent.status = "online"
+    agent.wake_sent_at = None
+    agent.last_seen = seen
+    return True
+
+def apply_idle_reports(db, Booking, batch):
+    """Update idle_since of active bookings from the agents' idle reports.
+
+    idle_since isn't a tracked event field, so most rows go through a bulk
+    update. Clearing an idle warning does change what the student sees, so
+    those bookings are updated through the ORM and their event is published.
+    """
+    reports = {agent_id: (seen, payload["idle"]) for agent_id, (seen, payload) in batch.items()
+               if payload.get("idle") is not None}
+    if not reports:
+        return
+    active = db.session.query(Booking.id, Booking.agent_id, Booking.container_name, Booking.idle_since,
+                              Booking.idle_warned_at).filter(
+        Booking.agent_id.in_(list(reports)),
+        Booking.status == "active"
+    ).all()
+
+    rows, resumed = [], []
+    for booking_id, agent_id, container_name, idle_since, idle_warned_at in active:
+        seen, idle = reports[agent_id]
+        seconds = idle.get(container_name)
+        if seconds:
+            since = seen - datetime.timedelta(seconds=seconds)
+            # Idle time is only as precise as the sample interval; skip rewrites for small drift
+            if idle_since is None or abs((since - idle_since).total_seconds()) > 60:
+                rows.append({"id": booking_id, "idle_since": since})
+        elif idle_warned_at is not None:
+            resumed.append(booking_id)
+        elif idle_since is not None:
+            rows.append({"id": booking_id, "idle_since": None})
+    if rows:
+        db.session.execute(db.update(Booking), rows)
+    for booking in Booking.query.filter(Booking.id.in_(resumed)) if resumed else ():
+        booking.idle_since = None
+        booking.idle_warned_at = None
+
+def apply_workspace_reports(db, batch):
+    """Sync WorkspaceLocation rows with the agents' reported workspaces; returns the new sets."""
+    from controller.models import WorkspaceLocation
+    changed = {}
+    for agent_id, (seen, payload) in batch.items():
+        users = payload.get("workspaces")
+        if users is None or _workspaces.get(agent_id) == frozenset(users):
+            continue
+        changed[agent_id] = frozenset(users)
+        db.session.execute(db.delete(WorkspaceLocation).where(
+            WorkspaceLocation.agent_id == agent_id,
+            WorkspaceLocation.user_id.notin_(users)
+        ))
+        known = {u for u, in db.session.query(WorkspaceLocation.user_id).filter_by(agent_id=agent_id)}
+        db.session.add_all([WorkspaceLocation(user_id=u, agent_id=agent_id, seen_at=seen)
+                            for u in set(users) - known])
+    return changed
+
+def mark_stale_agents(db, Agent, timeout):
+    """Mark push-mode agents offline when no heartbeat arrived within `timeout` seconds."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout)
+    try:
+        result = db.session.execute(
+            db.update(Agent)
+            .where(
+                Agent.heartbeat_at.isnot(None),
+                Agent.status == "online",
+                Agent.last_seen < cutoff
+            )
+            .values(status="offline", state_changed_at=datetime.datetime.utcnow())
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to mark stale agents: {e}")
+        return 0
+    if result.rowcount:
+        logger.warning(f"{result.rowcount} agent(s) missed heartbeats, marked offline")
+    return result.rowcount
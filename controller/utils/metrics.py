@@ -0,0 +1,59 @@
+import os
+import time
+from flask import request, g, has_app_context, Response
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HTTP_REQUESTS = Counter(
+    'controller_http_requests_total', 'HTTP requests handled', ['endpoint', 'method', 'status'])
+HTTP_LATENCY = Histogram(
+    'controller_http_request_duration_seconds', 'HTTP request latency', ['endpoint'])
+DB_QUERIES_PER_REQUEST = Histogram(
+    'controller_db_queries_per_request', 'SQL statements issued per HTTP request', ['endpoint'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+DB_QUERIES = Counter('controller_db_queries_total', 'SQL statements executed')
+SCHEDULER_TICK = Histogram(
+    'controller_scheduler_tick_seconds', 'Duration of scheduler jobs', ['job'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+SCHEDULER_ERRORS = Counter('controller_scheduler_errors_total', 'Failed scheduler jobs', ['job'])
+AGENT_REQUEST_LATENCY = Histogram(
+    'controller_agent_request_seconds', 'Latency of controller -> agent HTTP calls', ['agent', 'call'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15))
+AGENT_REQUEST_FAILURES = Counter(
+    'controller_agent_request_failures_total', 'Failed controller -> agent HTTP calls', ['agent', 'call'])
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.inc()
+    if has_app_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+
+def _after_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    HTTP_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    DB_QUERIES_PER_REQUEST.labels(endpoint).observe(g.get("db_queries", 0))
+    return response
+
+def metrics_view():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # gunicorn workers (see gunicorn.conf.py): merge what every worker wrote
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+    """Time every request and expose all metrics on /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,66 @@
+import math
+from sqlalchemy import case, func
+
+def memory_size_gb(memory):
+    """Booking memory strings ("4g", "512m") in GB, fractional for megabytes."""
+    value = int(memory[:-1])
+    return value / 1024 if memory.endswith('m') else value
+
+def memory_gb(memory):
+    """Booking memory as whole GB, rounded up: the unit agents track capacity in."""
+    return math.ceil(memory_size_gb(memory))
+
+def find_agent(Agent, cpu, mem, statuses=("online",), reclaim_backfill=False, best_fit=False, prefer=(), exclude=()):
+    """Pick an agent with room for `cpu` cores and `mem` GB, awake agents first.
+
+    With `reclaim_backfill`, capacity held by backfill sessions counts as free since
+    they can be preempted. Among awake agents, those that can pin all `cpu` cores on
+    one NUMA node come before those that would split the session across nodes,
+    and agents in `prefer` (holding the user's workspace) come before both.
+    Agents in `exclude` are never picked.
+    Guaranteed bookings spread over the emptiest agents; backfill packs with
+    `best_fit` to keep large holes open for them.
+    """
+    free_cpu, free_mem = Agent.available_cpu, Agent.available_mem
+    if reclaim_backfill:
+        free_cpu, free_mem = free_cpu + Agent.backfill_cpu, free_mem + Agent.backfill_mem
+    return Agent.query.filter(
+        Agent.status.in_(list(statuses)),
+        free_cpu >= cpu,
+        free_mem >= mem,
+        Agent.id.notin_(list(exclude))
+    ).order_by(
+        case((Agent.status == "online", 0), else_=1),
+        case((Agent.id.in_(list(prefer)), 0), else_=1),
+        # agents that don't report core topology rank between node-local and split
+        case((Agent.node_free_cpu >= cpu, 0), (Agent.node_free_cpu.is_(None), 1), else_=2),
+        free_cpu.asc() if best_fit else free_cpu.desc()
+    ).first()
+
+def free_capacity(db, Booking, Agent, start, end, statuses=("online", "sleeping")):
+    """Capacity left on each agent over [start, end) by guaranteed reservations.
+
+    Returns ({agent_id: [cpu, mem]}, ids of online agents). Backfill is ignored
+    since it is preempted when guaranteed sessions need the room.
+    """
+    agents = Agent.query.filter(Agent.status.in_(list(statuses))).all()
+    free = {a.id: [a.total_cpu, a.total_mem] for a in agents}
+    claimed = db.session.query(Booking.agent_id, Booking.cpu, Booking.memory).filter(
+        Booking.agent_id.in_(list(free)),
+        Booking.status.in_(["approved", "active"]),
+        func.coalesce(Booking.priority_class, "guaranteed") != "backfill",
+        Booking.start_time < end,
+        Booking.end_time > start
+    ).all()
+    for agent_id, cpu, memory in claimed:
+        free[agent_id][0] -= cpu
+        free[agent_id][1] -= memory_gb(memory)
+    return free, {a.id for a in agents if a.status == "online"}
+
+def workspace_agents(db, WorkspaceLocation, user_ids):
+    """{user id: set of agent ids holding a cached copy of that user's workspace}."""
+    held = {}
+    for user_id, agent_id in db.session.query(WorkspaceLocation.user_id, WorkspaceLocation.agent_id).filter(
+            WorkspaceLocation.user_id.in_(list(user_ids))):
+        held.setdefault(user_id, set()).add(agent_id)
+    return held
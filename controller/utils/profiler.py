@@ -0,0 +1,127 @@
+import re
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Profiles currently collecting on this thread (a request, a scheduler tick, a test block)
+_local = threading.local()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMS = re.compile(r"%\(\w+\)s|%s")
+_IN_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_SPACES = re.compile(r"\s+")
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def fingerprint(statement):
+    """Normalize a SQL statement so repeats with different values compare equal."""
+    statement = _LITERALS.sub("?", statement)
+    statement = _PARAMS.sub("?", statement)
+    statement = _IN_LISTS.sub("(?...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+class QueryProfile:
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """Statements issued at least `threshold` times, the usual signature of an N+1."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def summary(self):
+        return f"{self.label}: {self.count} queries in {self.seconds * 1000:.1f} ms"
+
+def _stack():
+    if not hasattr(_local, "profiles"):
+        _local.profiles = []
+    return _local.profiles
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if _stack():
+        conn.info["query_started"] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    profiles = _stack()
+    if not profiles or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for profile in profiles:
+        profile.record(statement, elapsed)
+
+@contextmanager
+def profile_queries(label="block"):
+    """Collect every SQL statement run on this thread inside the block."""
+    profile = QueryProfile(label)
+    _stack().append(profile)
+    try:
+        yield profile
+    finally:
+        _stack().remove(profile)
+
+def report(profile, config):
+    """Log repeated statements and enforce SQL_QUERY_BUDGET for a finished profile."""
+    for sql, n in profile.repeated(config["SQL_REPEAT_THRESHOLD"]):
+        logger.warning(f"[N+1?] {profile.label}: {n}x {sql[:200]}")
+    budget = config["SQL_QUERY_BUDGET"]
+    if budget and profile.count > budget:
+        message = f"{profile.summary()}, over budget of {budget}"
+        if config["SQL_BUDGET_STRICT"]:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    else:
+        logger.debug(profile.summary())
+
+@contextmanager
+def profile_block(label, config):
+    """Profile a scheduler tick (or any non-request block) when SQL_PROFILING is on."""
+    if not config["SQL_PROFILING"]:
+        yield None
+        return
+    with profile_queries(label) as profile:
+        yield profile
+    report(profile, config)
+
+def _before_request():
+    if current_app.config["SQL_PROFILING"]:
+        g.sql_profile = QueryProfile(f"{request.method} {request.endpoint}")
+        _stack().append(g.sql_profile)
+
+def _after_request(response):
+    profile = g.pop("sql_profile", None)
+    if profile is None:
+        return response
+    _stack().remove(profile)
+    response.headers["X-DB-Queries"] = str(profile.count)
+    response.headers["X-DB-Time-ms"] = f"{profile.seconds * 1000:.1f}"
+    report(profile, current_app.config)
+    return response
+
+def _teardown_request(exc):
+    # after_request is skipped when the view raised; don't leak the profile
+    profile = g.pop("sql_profile", None)
+    if profile is not None and profile in _stack():
+        _stack().remove(profile)
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,150 @@
+import datetime
+import logging
+from sqlalchemy.dialects import postgresql, sqlite
+from controller.utils.placement import memory_size_gb
+
+logger = logging.getLogger(__name__)
+
+def period_start(when):
+    """Start of the accounting week (Monday 00:00) containing `when`."""
+    day = datetime.datetime(when.year, when.month, when.day)
+    return day - datetime.timedelta(days=day.weekday())
+
+def booking_usage(cpu, memory, hours):
+    return cpu * hours, memory_size_gb(memory) * hours
+
+def booking_hours(b):
+    return (b.end_time - b.start_time).total_seconds() / 3600.0
+
+def _upsert(db, rows):
+    """Add each row's cpu/mem hours to its (scope, key, period_start) ledger entry."""
+    from controller.models import UsageLedger
+    # Increment in place so concurrent bookings never lose each other's deltas
+    insert = (postgresql if db.engine.dialect.name == "postgresql" else sqlite).insert
+    stmt = insert(UsageLedger)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=["scope", "key", "period_start"],
+        set_={"cpu_hours": UsageLedger.cpu_hours + stmt.excluded.cpu_hours,
+              "mem_gb_hours": UsageLedger.mem_gb_hours + stmt.excluded.mem_gb_hours}
+    ), rows)
+
+def charge(db, b, department, hours=None, sign=1):
+    """Add (or with sign=-1 refund) a booking's reservation to its user's and department's week.
+
+    `hours` defaults to the whole booking; pass a part for extensions and early ends.
+    Runs in the caller's transaction.
+    """
+    hours = booking_hours(b) if hours is None else hours
+    if hours <= 0:
+        return
+    cpu_hours, mem_gb_hours = booking_usage(b.cpu, b.memory, hours * sign)
+    period = period_start(b.start_time)
+    _upsert(db, [
+        {"scope": "user", "key": str(b.user_id), "period_start": period,
+         "cpu_hours": cpu_hours, "mem_gb_hours": mem_gb_hours},
+        {"scope": "department", "key": department or "General", "period_start": period,
+         "cpu_hours": cpu_hours, "mem_gb_hours": mem_gb_hours}
+    ])
+
+def charge_many(db, bookings, departments):
+    """charge() for a batch of booking rows (dicts), merged into one statement per ledger key."""
+    totals = {}
+    for b in bookings:
+        hours = (b["end_time"] - b["start_time"]).total_seconds() / 3600.0
+        cpu_hours, mem_gb_hours = booking_usage(b["cpu"], b["memory"], hours)
+        period = period_start(b["start_time"])
+        for key in (("user", str(b["user_id"]), period),
+                    ("department", departments.get(b["user_id"]) or "General", period)):
+            cpu, mem = totals.get(key, (0.0, 0.0))
+            totals[key] = (cpu + cpu_hours, mem + mem_gb_hours)
+    if totals:
+        _upsert(db, [{"scope": scope, "key": key, "period_start": period, "cpu_hours": cpu, "mem_gb_hours": mem}
+                     for (scope, key, period), (cpu, mem) in totals.items()])
+
+def refund(db, b, department, hours=None):
+    charge(db, b, department, hours, sign=-1)
+
+def usage(db, user_id, department, period):
+    """{scope: (cpu_hours, mem_gb_hours)} for a user and their department in one query."""
+    from controller.models import UsageLedger
+    rows = db.session.query(UsageLedger.scope, UsageLedger.cpu_hours, UsageLedger.mem_gb_hours).filter(
+        UsageLedger.period_start == period,
+        db.or_(
+            db.and_(UsageLedger.scope == "user", UsageLedger.key == str(user_id)),
+            db.and_(UsageLedger.scope == "department", UsageLedger.key == (department or "General"))
+        )
+    ).all()
+    totals = {"user": (0.0, 0.0), "department": (0.0, 0.0)}
+    totals.update({scope: (cpu, mem) for scope, cpu, mem in rows})
+    return totals
+
+def check_quota(db, user_id, department, start, cpu, memory, hours, config):
+    """Return an error message if the booking would exceed a weekly limit, else None."""
+    totals = usage(db, user_id, department, period_start(start))
+    cpu_hours, mem_gb_hours = booking_usage(cpu, memory, hours)
+    limits = {
+        "user": (config['QUOTA_USER_CPU_HOURS'], config['QUOTA_USER_MEM_GB_HOURS']),
+        "department": (config['QUOTA_DEPT_CPU_HOURS'], config['QUOTA_DEPT_MEM_GB_HOURS'])
+    }
+    for scope, (cpu_limit, mem_limit) in limits.items():
+        used_cpu, used_mem = totals[scope]
+        if cpu_limit and used_cpu + cpu_hours > cpu_limit:
+            return f"Weekly {scope} CPU quota exceeded ({used_cpu:.0f}/{cpu_limit:.0f} CPU-hours used)"
+        if mem_limit and used_mem + mem_gb_hours > mem_limit:
+            return f"Weekly {scope} memory quota exceeded ({used_mem:.0f}/{mem_limit:.0f} GB-hours used)"
+    return None
+
+def over_quota(db, departments, start, cpu, memory, hours, config):
+    """User ids (of `departments`, {user id: department}) whose copy of a booking would exceed a weekly limit.
+
+    check_quota() for a batch in one ledger read. Users are taken in id order
+    and each accepted one counts toward their department's total, so a
+    department limit cuts off the users that would cross it.
+    """
+    from controller.models import UsageLedger
+    cpu_hours, mem_gb_hours = booking_usage(cpu, memory, hours)
+    depts = {d or "General" for d in departments.values()}
+    rows = db.session.query(UsageLedger.scope, UsageLedger.key, UsageLedger.cpu_hours,
+                            UsageLedger.mem_gb_hours).filter(
+        UsageLedger.period_start == period_start(start),
+        db.or_(
+            db.and_(UsageLedger.scope == "user", UsageLedger.key.in_([str(u) for u in departments])),
+            db.and_(UsageLedger.scope == "department", UsageLedger.key.in_(depts))
+        )
+    ).all()
+    used = {(scope, key): [cpu_used, mem_used] for scope, key, cpu_used, mem_used in rows}
+    limits = {
+        "user": (config['QUOTA_USER_CPU_HOURS'], config['QUOTA_USER_MEM_GB_HOURS']),
+        "department": (config['QUOTA_DEPT_CPU_HOURS'], config['QUOTA_DEPT_MEM_GB_HOURS'])
+    }
+    over = []
+    for user_id in sorted(departments):
+        keys = {"user": str(user_id), "department": departments[user_id] or "General"}
+        totals = {scope: used.setdefault((scope, key), [0.0, 0.0]) for scope, key in keys.items()}
+        after = {scope: (total[0] + cpu_hours, total[1] + mem_gb_hours) for scope, total in totals.items()}
+        if any(limit and value > limit for scope in limits for value, limit in zip(after[scope], limits[scope])):
+            over.append(user_id)
+            continue
+        for total in totals.values():
+            total[0] += cpu_hours
+            total[1] += mem_gb_hours
+    return over
+
+def fair_share_order(db, bookings, departments, period):
+    """Order bookings so users, then departments, with the least usage this week go first."""
+    from controller.models import UsageLedger
+    keys = {str(b.user_id) for b in bookings}
+    depts = {d or "General" for d in departments.values()}
+    rows = db.session.query(UsageLedger.scope, UsageLedger.key, UsageLedger.cpu_hours).filter(
+        UsageLedger.period_start == period,
+        db.or_(
+            db.and_(UsageLedger.scope == "user", UsageLedger.key.in_(keys)),
+            db.and_(UsageLedger.scope == "department", UsageLedger.key.in_(depts))
+        )
+    ).all()
+    used = {(scope, key): cpu for scope, key, cpu in rows}
+    return sorted(bookings, key=lambda b: (
+        used.get(("user", str(b.user_id)), 0.0),
+        used.get(("department", departments.get(b.user_id) or "General"), 0.0),
+        b.created_at or b.start_time
+    ))
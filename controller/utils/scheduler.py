@@ -1,119 +1,504 @@
-from controller.utils.wol import wake_on_lan
+from controller.utils.wol import wake_many
+from controller.utils.heartbeat import flush_heartbeats, mark_stale_agents, mark_awake
+from controller.utils.telemetry import run_rollups
+from controller.utils.archive import archive_bookings
+from controller.utils.profiler import profile_block
+from controller.utils.placement import find_agent, memory_gb, workspace_agents
+from controller.utils.quota import refund, fair_share_order, period_start
+from controller.utils.metrics import (
+    SCHEDULER_TICK, SCHEDULER_ERRORS, AGENT_REQUEST_LATENCY, AGENT_REQUEST_FAILURES
+)
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import threading
+import time
 import requests
 import logging
 
 logger = logging.getLogger(__name__)
 
+# job_checker and the reconciler both move bookings and capacity; never run them at once
+_cycle_lock = threading.Lock()
+
 def schedule_jobs(scheduler, app):
     @scheduler.scheduled_job('interval', minutes=1)
     def job_checker():
         # import models inside job to avoid circular import during module import time
         from controller.models import db, Booking, Agent
-        with app.app_context():
+        with _cycle_lock, app.app_context(), SCHEDULER_TICK.labels('job_checker').time(), \
+                profile_block('job_checker', app.config):
             try:
-                now = datetime.datetime.utcnow()
-
-                # Check agent health every minute
-                check_agent_health(db, Agent)
-
-                # Wake machines 10 min early
-                wake_time = now + datetime.timedelta(minutes=10)
-                wake_list = Booking.query.filter(
-                    Booking.start_time <= wake_time,
-                    Booking.start_time > now,
-                    Booking.status == "approved"
-                ).all()
-
-                for b in wake_list:
-                    agent = Agent.query.get(b.agent_id)
-                    if agent and agent.wol_enabled:
-                        try:
-                            wake_on_lan(agent.mac)
-                            logger.info(f"[Wake-on-LAN] {agent.ip}")
-                        except Exception as e:
-                            logger.error(f"WoL failed for {agent.id}: {e}")
-
-                # Start sessions
-                start_list = Booking.query.filter(
-                    Booking.start_time <= now,
-                    Booking.status == "approved"
-                ).all()
-
-                for b in start_list:
-                    agent = Agent.query.get(b.agent_id)
-                    if not agent or agent.status != "online":
-                        continue
-                    try:
-                        # Allocate resources
-                        port = 8000 + b.id % 1000
-                        res = requests.post(
-                            f"http://{agent.ip}:{agent.port}/start_container",
-                            json={
-                                "user_id": b.user_id,
-                                "image": b.image,
-                                "cpu": b.cpu,
-                                "memory": b.memory,
-                                "port": port
-                            },
-                            timeout=15
-                        )
-                        if res.status_code == 200:
-                            res_json = res.json()
-                            b.status = "active"
-                            b.access_url = res_json.get("url")
-                            b.container_name = res_json.get("container_name")
-                            
-                            # Update agent resources
-                            agent.available_cpu -= b.cpu
-                            agent.available_mem -= int(b.memory.rstrip('gm'))
-                            
-                            db.session.commit()
-                            logger.info(f"[STARTED] Booking {b.id} on {agent.ip}")
-                        else:
-                            logger.error(f"Failed to start booking {b.id}: {res.status_code}")
-                    except requests.Timeout:
-                        logger.warning(f"Timeout starting booking {b.id} on agent {agent.id}")
-                    except Exception as e:
-                        logger.error(f"Failed to start booking {b.id}: {e}")
-
-                # Stop expired sessions
-                stop_list = Booking.query.filter(
-                    Booking.end_time <= now,
-                    Booking.status == "active"
-                ).all()
-
-                for b in stop_list:
-                    agent = Agent.query.get(b.agent_id)
-                    if not agent:
-                        continue
-                    try:
-                        requests.post(
-                            f"http://{agent.ip}:{agent.port}/stop_container/{b.container_name}",
-                            timeout=15
-                        )
-                        b.status = "completed"
-                        
-                        # Free up resources
-                        agent.available_cpu += b.cpu
-                        agent.available_mem += int(b.memory.rstrip('gm'))
-                        
-                        db.session.commit()
-                        logger.info(f"[STOPPED] Booking {b.id}")
-                    except Exception as e:
-                        logger.error(f"Failed to stop booking {b.id}: {e}")
+                run_booking_cycle(db, Booking, Agent, app.config)
             except Exception as e:
+                SCHEDULER_ERRORS.labels('job_checker').inc()
                 logger.error(f"Scheduler job failed: {e}")
 
+    @scheduler.scheduled_job('interval', seconds=app.config['AGENT_HEARTBEAT_INTERVAL'])
+    def heartbeat_checker():
+        from controller.models import db, Agent, Booking
+        with app.app_context(), SCHEDULER_TICK.labels('heartbeat_checker').time(), \
+                profile_block('heartbeat_checker', app.config):
+            try:
+                flush_heartbeats(db, Agent, Booking)
+                mark_stale_agents(db, Agent, app.config['AGENT_HEARTBEAT_TIMEOUT'])
+            except Exception as e:
+                SCHEDULER_ERRORS.labels('heartbeat_checker').inc()
+                logger.error(f"Heartbeat check failed: {e}")
+
+    @scheduler.scheduled_job('interval', minutes=1)
+    def telemetry_rollup():
+        from controller.models import db, UsageSample, RollupWatermark
+        with app.app_context(), SCHEDULER_TICK.labels('telemetry_rollup').time(), \
+                profile_block('telemetry_rollup', app.config):
+            run_rollups(db, UsageSample, RollupWatermark, app.config)
+
+    @scheduler.scheduled_job('interval', seconds=app.config['RECONCILE_INTERVAL_SECONDS'])
+    def reconciler():
+        from controller.models import db, Booking, Agent
+        with _cycle_lock, app.app_context(), SCHEDULER_TICK.labels('reconciler').time(), \
+                profile_block('reconciler', app.config):
+            try:
+                reconcile_agents(db, Booking, Agent, app.config)
+            except Exception as e:
+                db.session.rollback()
+                SCHEDULER_ERRORS.labels('reconciler').inc()
+                logger.error(f"Reconciliation failed: {e}")
+
+    @scheduler.scheduled_job('interval', hours=1)
+    def booking_archiver():
+        from controller.models import db, Booking, BookingArchive
+        if not app.config['ARCHIVE_AFTER_DAYS']:
+            return
+        with app.app_context(), SCHEDULER_TICK.labels('booking_archiver').time(), \
+                profile_block('booking_archiver', app.config):
+            try:
+                archive_bookings(db, Booking, BookingArchive, app.config)
+            except Exception as e:
+                SCHEDULER_ERRORS.labels('booking_archiver').inc()
+                logger.error(f"Booking archiving failed: {e}")
+
+def run_booking_cycle(db, Booking, Agent, config, now=None):
+    """One job_checker pass: health, wake-up, start, stop, idle reclamation, backfill and power."""
+    now = now or datetime.datetime.utcnow()
+
+    # Check agent health every minute
+    check_agent_health(db, Agent)
+
+    # Wake machines early enough to be up by their next booking
+    wake_for_bookings(db, Booking, Agent, config, now)
+
+    # Approve pending bookings that fit, least-used users and departments first
+    if config['AUTO_APPROVE']:
+        auto_approve(db, Booking, Agent, config, now)
+
+    # Have agents restore workspaces from the store before their sessions start
+    if config['WORKSPACE_PREPARE_MINUTES']:
+        prepare_workspaces(db, Booking, Agent, config, now)
+
+    # Start sessions
+    start_list = Booking.query.options(joinedload(Booking.agent)).filter(
+        Booking.start_time <= now,
+        Booking.status == "approved"
+    ).all()
+
+    draining = set()  # agents whose preempted backfill is still in its grace period
+    for b in start_list:
+        agent = b.agent
+        if not agent or agent.status != "online":
+            continue
+        # Make room by preempting backfill sessions if the reservation no longer fits
+        if agent.available_cpu < b.cpu or agent.available_mem < memory_gb(b.memory):
+            if preempt_backfill(db, Booking, agent, b.cpu, memory_gb(b.memory), config, now):
+                draining.add(agent.id)
+        start_session(db, b, agent)
+
+    # Stop expired sessions
+    stop_list = Booking.query.options(joinedload(Booking.agent)).filter(
+        Booking.end_time <= now,
+        Booking.status == "active"
+    ).all()
+
+    for b in stop_list:
+        agent = b.agent
+        if not agent:
+            continue
+        try:
+            stop_session(db, b, agent, "expired")
+        except Exception as e:
+            logger.error(f"Failed to stop booking {b.id}: {e}")
+
+    # Warn about and reclaim idle sessions
+    reclaim_idle_sessions(db, Booking, config, now)
+
+    # Fill the remaining capacity with queued backfill sessions, elsewhere than what was just preempted
+    start_backfill(db, Booking, Agent, config, now, draining)
+
+    # Put machines with nothing coming up to sleep
+    if config['POWER_MANAGEMENT']:
+        suspend_idle_agents(db, Booking, Agent, config, now)
+
+def start_session(db, b, agent):
+    """Start a booking's container on `agent` and take its resources; returns True on success."""
+    try:
+        # Allocate resources
+        port = 8000 + b.id % 1000
+        res = agent_request(
+            "post", agent, "start_container", "/start_container",
+            json={
+                "user_id": b.user_id,
+                "image": b.image,
+                "cpu": b.cpu,
+                "memory": b.memory,
+                "port": port,
+                # backfill can't take the cores of a container still stopping after preemption
+                "preemptible": b.priority_class == "backfill"
+            },
+            timeout=15
+        )
+        if res.status_code == 200:
+            res_json = res.json()
+            b.status = "active"
+            b.agent_id = agent.id
+            b.access_url = res_json.get("url")
+            b.container_name = res_json.get("container_name")
+
+            # Update agent resources
+            agent.available_cpu -= b.cpu
+            agent.available_mem -= memory_gb(b.memory)
+            if b.priority_class == "backfill":
+                agent.backfill_cpu += b.cpu
+                agent.backfill_mem += memory_gb(b.memory)
+
+            db.session.commit()
+            logger.info(f"[STARTED] Booking {b.id} on {agent.ip}")
+            return True
+        if res.status_code == 503:
+            # Busy or restoring the user's workspace; the booking stays put and is retried next tick
+            logger.info(f"Agent {agent.id} not ready for booking {b.id}, retrying")
+            return False
+        logger.error(f"Failed to start booking {b.id}: {res.status_code}")
+    except requests.Timeout:
+        logger.warning(f"Timeout starting booking {b.id} on agent {agent.id}")
+    except Exception as e:
+        logger.error(f"Failed to start booking {b.id}: {e}")
+    return False
+
+def prepare_workspaces(db, Booking, Agent, config, now):
+    """Ask agents to restore the workspaces of sessions starting within WORKSPACE_PREPARE_MINUTES.
+
+    Restores run in the background on the agent and repeat requests are cheap,
+    so this is sent every tick until the session starts.
+    """
+    soon = Booking.query.options(joinedload(Booking.agent)).filter(
+        Booking.status == "approved",
+        Booking.start_time > now,
+        Booking.start_time <= now + datetime.timedelta(minutes=config['WORKSPACE_PREPARE_MINUTES'])
+    ).all()
+    for b in soon:
+        if not b.agent or b.agent.status != "online":
+            continue
+        try:
+            agent_request("post", b.agent, "prepare_workspace", f"/workspaces/{b.user_id}/prepare", timeout=5)
+        except Exception as e:
+            logger.warning(f"Workspace prepare for booking {b.id} failed: {e}")
+
+def release_resources(b, agent):
+    agent.available_cpu += b.cpu
+    agent.available_mem += memory_gb(b.memory)
+    if b.priority_class == "backfill":
+        agent.backfill_cpu -= b.cpu
+        agent.backfill_mem -= memory_gb(b.memory)
+
+def auto_approve(db, Booking, Agent, config, now):
+    """Approve guaranteed bookings starting within the lead window, in fair-share order.
+
+    Capacity is checked against the agents' free (and preemptible backfill) capacity
+    minus what approved bookings in the same window already claim.
+    """
+    window = now + datetime.timedelta(minutes=config['AUTO_APPROVE_LEAD_MINUTES'])
+    pending = Booking.query.options(joinedload(Booking.user)).filter(
+        Booking.status == "pending",
+        Booking.start_time <= window
+    ).all()
+    if not pending:
+        return []
+
+    agents = Agent.query.filter(Agent.status.in_(["online", "sleeping"])).all()
+    free = {a.id: [a.available_cpu + a.backfill_cpu, a.available_mem + a.backfill_mem] for a in agents}
+    claimed = db.session.query(Booking.agent_id, Booking.cpu, Booking.memory).filter(
+        Booking.status == "approved",
+        Booking.start_time <= window,
+        Booking.agent_id.in_(list(free))
+    ).all()
+    for agent_id, cpu, memory in claimed:
+        free[agent_id][0] -= cpu
+        free[agent_id][1] -= memory_gb(memory)
+
+    from controller.models import WorkspaceLocation
+    departments = {b.user_id: b.user.department for b in pending}
+    held = workspace_agents(db, WorkspaceLocation, departments)
+    online = {a.id for a in agents if a.status == "online"}
+    approved = []
+    for b in fair_share_order(db, pending, departments, period_start(now)):
+        fits = [a for a in free if free[a][0] >= b.cpu and free[a][1] >= memory_gb(b.memory)]
+        if not fits:
+            continue
+        # Same preference as manual approval: awake agents, the user's workspace, then the most free CPU
+        workspace = held.get(b.user_id, ())
+        agent_id = min(fits, key=lambda a: (a not in online, a not in workspace, -free[a][0]))
+        free[agent_id][0] -= b.cpu
+        free[agent_id][1] -= memory_gb(b.memory)
+        b.status = "approved"
+        b.agent_id = agent_id
+        approved.append(b)
+        logger.info(f"[AUTO-APPROVED] Booking {b.id} on agent {agent_id}")
+    if approved:
+        db.session.commit()
+    return approved
+
+def start_backfill(db, Booking, Agent, config, now, exclude=()):
+    """Expire stale backfill requests, then start queued ones on free capacity, oldest first.
+
+    Agents in `exclude` are skipped: their freed capacity belongs to sessions
+    started this cycle, and preempted containers still hold it on the agent.
+    """
+    expired = Booking.query.filter(Booking.status == "queued", Booking.end_time <= now).all()
+    for b in expired:
+        b.status = "completed"
+        b.end_reason = "expired"
+        # Refund the time it sat in the queue: everything, or since it was last preempted
+        ran_until = b.preempted_at or b.start_time
+        refund(db, b, b.user.department, hours=(b.end_time - ran_until).total_seconds() / 3600.0)
+    if expired:
+        db.session.commit()
+
+    queued = Booking.query.filter(
+        Booking.status == "queued",
+        Booking.start_time <= now
+    ).order_by(Booking.created_at).limit(config['BACKFILL_BATCH']).all()
+    from controller.models import WorkspaceLocation
+    held = workspace_agents(db, WorkspaceLocation, {b.user_id for b in queued})
+    started = []
+    for b in queued:
+        agent = find_agent(Agent, b.cpu, memory_gb(b.memory), best_fit=True, prefer=held.get(b.user_id, ()),
+                           exclude=exclude)
+        if agent and start_session(db, b, agent):
+            started.append(b)
+    return started
+
+def preempt_backfill(db, Booking, agent, cpu, mem, config, now):
+    """Preempt backfill sessions on `agent`, newest first, until `cpu`/`mem` fit.
+
+    The agent signals the container to checkpoint and stops it after a grace
+    period; the booking goes back to the queue to resume elsewhere.
+    """
+    victims = Booking.query.filter(
+        Booking.agent_id == agent.id,
+        Booking.status == "active",
+        Booking.priority_class == "backfill"
+    ).order_by(Booking.start_time.desc()).all()
+    preempted = []
+    for b in victims:
+        if agent.available_cpu >= cpu and agent.available_mem >= mem:
+            break
+        try:
+            res = agent_request("post", agent, "preempt_container", f"/preempt_container/{b.container_name}",
+                                json={"grace": config['BACKFILL_PREEMPT_GRACE_SECONDS']}, timeout=15)
+        except Exception as e:
+            logger.error(f"Failed to preempt booking {b.id}: {e}")
+            continue
+        if res.status_code not in (200, 202, 404):
+            logger.error(f"Failed to preempt booking {b.id}: {res.status_code}")
+            continue
+        release_resources(b, agent)
+        b.status = "queued"
+        b.agent_id = None
+        b.container_name = None
+        b.access_url = None
+        b.preempted_at = now
+        preempted.append(b)
+        logger.info(f"[PREEMPTED] Backfill booking {b.id} on {agent.ip}, requeued")
+    if preempted:
+        db.session.commit()
+    return preempted
+
+def wake_lead(agent, config):
+    """Seconds before a booking to send the wake: measured boot time plus margin."""
+    if agent.boot_seconds is None:
+        return config['POWER_DEFAULT_LEAD_SECONDS']
+    return agent.boot_seconds * config['POWER_WAKE_MARGIN'] + config['POWER_WAKE_SLACK_SECONDS']
+
+def wake_for_bookings(db, Booking, Agent, config, now):
+    """Wake down agents whose next approved booking is within their wake lead time."""
+    asleep = Agent.query.filter(
+        Agent.status.in_(["offline", "sleeping"]),
+        Agent.wol_enabled.is_(True),
+        Agent.mac.isnot(None)
+    ).all()
+    if not asleep:
+        return []
+    leads = {a.id: wake_lead(a, config) for a in asleep}
+    horizon = now + datetime.timedelta(seconds=max(leads.values()))
+    next_start = dict(db.session.query(Booking.agent_id, func.min(Booking.start_time)).filter(
+        Booking.status == "approved",
+        Booking.start_time <= horizon,
+        Booking.agent_id.in_(list(leads))
+    ).group_by(Booking.agent_id).all())
+
+    retry = datetime.timedelta(seconds=config['POWER_WAKE_RETRY_SECONDS'])
+    # One wake per machine per tick, however many bookings it has coming up
+    to_wake = [a for a in asleep if a.id in next_start
+               and next_start[a.id] <= now + datetime.timedelta(seconds=leads[a.id])
+               and (a.wake_sent_at is None or a.wake_sent_at <= now - retry)]
+    if to_wake:
+        wake_agents(to_wake, config)
+        for agent in to_wake:
+            agent.wake_sent_at = now
+        db.session.commit()
+    return to_wake
+
+def suspend_idle_agents(db, Booking, Agent, config, now):
+    """Suspend wakeable agents with no session running or due within the sleep horizon.
+
+    Only agents that reported suspend support are asked; one answering 501
+    (e.g. running in a container) is left alone until it re-registers.
+    """
+    horizon = now + datetime.timedelta(minutes=config['POWER_SLEEP_HORIZON_MINUTES'])
+    busy = {agent_id for (agent_id,) in db.session.query(Booking.agent_id).filter(
+        Booking.agent_id.isnot(None),
+        db.or_(
+            Booking.status == "active",
+            db.and_(Booking.status == "approved", Booking.start_time <= horizon)
+        )
+    ).distinct()}
+    idle = [a for a in Agent.query.filter(Agent.status == "online").order_by(Agent.total_cpu.desc())
+            if a.id not in busy and a.wol_enabled and a.mac and a.can_suspend]
+    # The largest idle machines stay up as spare capacity for immediate approvals
+    suspended = []
+    for agent in idle[config['POWER_KEEP_AWAKE']:]:
+        try:
+            res = agent_request("post", agent, "suspend", "/suspend", timeout=5)
+        except Exception as e:
+            logger.warning(f"Suspend request to agent {agent.id} failed: {e}")
+            continue
+        if res.status_code == 501:
+            logger.warning(f"Agent {agent.id} can't suspend, no longer asking it")
+            agent.can_suspend = False
+            db.session.commit()
+            continue
+        if res.status_code != 202:
+            logger.info(f"Agent {agent.id} declined to suspend: {res.status_code}")
+            continue
+        agent.status = "sleeping"
+        agent.suspended_at = now
+        agent.wake_sent_at = None
+        suspended.append(agent)
+        logger.info(f"[SUSPEND] Agent {agent.id} ({agent.ip})")
+    if suspended:
+        db.session.commit()
+    return suspended
+
+def wake_agents(agents, config):
+    failed = wake_many(
+        [a.mac for a in agents],
+        broadcast=config.get('WOL_BROADCAST', ('<broadcast>',)),
+        port=config.get('WOL_PORT', 9),
+        repeat=config.get('WOL_REPEAT', 1)
+    )
+    for agent in agents:
+        if agent.mac in failed:
+            logger.error(f"WoL failed for {agent.id}: {failed[agent.mac]}")
+        else:
+            logger.info(f"[Wake-on-LAN] {agent.ip}")
+
+def agent_request(method, agent, call, path, **kwargs):
+    """HTTP call to an agent, timed per agent and call for /metrics."""
+    started = time.perf_counter()
+    try:
+        return getattr(requests, method)(f"http://{agent.ip}:{agent.port}{path}", **kwargs)
+    except Exception:
+        AGENT_REQUEST_FAILURES.labels(agent.id, call).inc()
+        raise
+    finally:
+        AGENT_REQUEST_LATENCY.labels(agent.id, call).observe(time.perf_counter() - started)
+
+def stop_session(db, b, agent, reason):
+    """Stop a booking's container and give its resources back to the agent."""
+    res = agent_request("post", agent, "stop_container", f"/stop_container/{b.container_name}", timeout=15)
+    # A container that is already gone counts as stopped; other failures leave the
+    # booking active so the next tick (or the reconciler) tries again
+    if res.status_code not in (200, 404):
+        raise RuntimeError(f"agent {agent.id} answered {res.status_code}")
+    b.status = "completed"
+    b.end_reason = reason
+    now = datetime.datetime.utcnow()
+    if b.end_time > now:
+        # Hand back the part of the reservation that won't be used
+        refund(db, b, b.user.department, hours=(b.end_time - now).total_seconds() / 3600.0)
+        b.end_time = now
+
+    # Free up resources
+    release_resources(b, agent)
+
+    db.session.commit()
+    logger.info(f"[STOPPED] Booking {b.id} ({reason})")
+
+def reclaim_idle_sessions(db, Booking, config, now):
+    """Warn owners of idle sessions, then stop them once they stay idle past the limit."""
+    warn_after = config['IDLE_WARN_MINUTES']
+    stop_after = config['IDLE_STOP_MINUTES']
+    if not stop_after:
+        return
+
+    warn_list = Booking.query.filter(
+        Booking.status == "active",
+        Booking.idle_warned_at.is_(None),
+        Booking.idle_since <= now - datetime.timedelta(minutes=warn_after)
+    ).all()
+    for b in warn_list:
+        b.idle_warned_at = now
+        logger.warning(f"[IDLE] Booking {b.id} idle since {b.idle_since.isoformat()}, "
+                       f"will be stopped after {stop_after} idle minutes")
+    if warn_list:
+        db.session.commit()
+
+    # The grace period guarantees a warning was visible for a while before stopping
+    reclaim_list = Booking.query.options(joinedload(Booking.agent)).filter(
+        Booking.status == "active",
+        Booking.idle_since <= now - datetime.timedelta(minutes=stop_after),
+        Booking.idle_warned_at <= now - datetime.timedelta(minutes=config['IDLE_GRACE_MINUTES'])
+    ).all()
+    for b in reclaim_list:
+        agent = b.agent
+        if not agent:
+            continue
+        try:
+            stop_session(db, b, agent, "idle")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to reclaim idle booking {b.id}: {e}")
+
 def check_agent_health(db, Agent):
-    """Poll all agents for health status every minute."""
-    agents = Agent.query.all()
+    """Poll agents that don't push heartbeats; push-mode agents are handled by heartbeat_checker."""
+    # Sleeping agents are only polled once a wake has been sent to them
+    agents = Agent.query.filter(
+        Agent.heartbeat_at.is_(None),
+        db.or_(Agent.status != "sleeping", Agent.wake_sent_at.isnot(None))
+    ).all()
     for agent in agents:
+        if agent.status == "sleeping":
+            try:
+                res = agent_request("get", agent, "health", "/health", timeout=2)
+                if res.status_code == 200:
+                    mark_awake(agent, datetime.datetime.utcnow())
+            except Exception:
+                pass  # still booting
+            continue
         try:
-            res = requests.get(
-                f"http://{agent.ip}:{agent.port}/health",
-                timeout=5
-            )
+            res = agent_request("get", agent, "health", "/health", timeout=5)
             if res.status_code == 200:
                 agent.status = "online"
                 agent.last_seen = datetime.datetime.utcnow()
@@ -131,3 +516,98 @@ def check_agent_health(db, Agent):
     except Exception as e:
         logger.error(f"Failed to update agent health: {e}")
         db.session.rollback()
+
+# Agent address detached from the session, safe to use from worker threads
+AgentAddress = namedtuple("AgentAddress", "id ip port")
+
+# Discrepancies seen on the previous pass; only those seen twice are acted on, so a
+# session starting or a preemption grace period in between isn't mistaken for one
+_suspects = set()
+
+def fetch_containers(agents, config):
+    """{agent id: running managed container names} for every agent that answered."""
+    def fetch(agent):
+        res = agent_request("get", agent, "containers", "/containers", timeout=config['RECONCILE_TIMEOUT'])
+        res.raise_for_status()
+        return {c["name"] for c in res.json()}
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(config['RECONCILE_WORKERS'], len(agents)))) as pool:
+        futures = {agent.id: pool.submit(fetch, agent) for agent in agents}
+        for agent_id, future in futures.items():
+            try:
+                found[agent_id] = future.result()
+            except Exception as e:
+                logger.warning(f"Reconciler could not list containers on agent {agent_id}: {e}")
+    return found
+
+def reconcile_agents(db, Booking, Agent, config, now=None):
+    """Diff agents' running containers against active bookings and repair both sides.
+
+    Containers without an active booking are stopped, active bookings whose
+    container is gone are completed, and each agent's free capacity is recomputed
+    from its active bookings. Returns (orphans stopped, sessions ended, agents fixed).
+    """
+    global _suspects
+    now = now or datetime.datetime.utcnow()
+    agents = {a.id: a for a in Agent.query.filter(Agent.status == "online")}
+    found = fetch_containers([AgentAddress(a.id, a.ip, a.port) for a in agents.values()], config)
+    if not found:
+        return [], [], []
+
+    active = Booking.query.options(joinedload(Booking.user)).filter(
+        Booking.agent_id.in_(list(found)),
+        Booking.status == "active"
+    ).all()
+    expected = {(b.agent_id, b.container_name) for b in active}
+    running = {(agent_id, name) for agent_id, names in found.items() for name in names}
+
+    suspects = {("orphan",) + key for key in running - expected} | \
+        {("vanished", b.id) for b in active if (b.agent_id, b.container_name) not in running}
+    confirmed, _suspects = suspects & _suspects, suspects
+
+    orphans = []
+    for _, agent_id, name in sorted(s for s in confirmed if s[0] == "orphan"):
+        try:
+            res = agent_request("post", agents[agent_id], "stop_container", f"/stop_container/{name}",
+                                timeout=15)
+            if res.status_code in (200, 404):
+                orphans.append((agent_id, name))
+                logger.warning(f"[RECONCILE] Stopped orphaned container {name} on agent {agent_id}")
+        except Exception as e:
+            logger.warning(f"Could not stop orphaned container {name} on agent {agent_id}: {e}")
+
+    vanished = [b for b in active if ("vanished", b.id) in confirmed]
+    for b in vanished:
+        b.status = "completed"
+        b.end_reason = "vanished"
+        if b.end_time > now:
+            refund(db, b, b.user.department, hours=(b.end_time - now).total_seconds() / 3600.0)
+            b.end_time = now
+        logger.warning(f"[RECONCILE] Booking {b.id} lost its container on agent {b.agent_id}")
+
+    # Ground truth for capacity: total minus what the remaining active sessions hold
+    held = {agent_id: [0, 0, 0, 0] for agent_id in found}
+    for b in active:
+        if b.status != "active":
+            continue
+        use = held[b.agent_id]
+        use[0] += b.cpu
+        use[1] += memory_gb(b.memory)
+        if b.priority_class == "backfill":
+            use[2] += b.cpu
+            use[3] += memory_gb(b.memory)
+    fixed = []
+    for agent_id, (cpu, mem, backfill_cpu, backfill_mem) in held.items():
+        agent = agents[agent_id]
+        actual = (agent.total_cpu - cpu, agent.total_mem - mem, backfill_cpu, backfill_mem)
+        if (agent.available_cpu, agent.available_mem, agent.backfill_cpu, agent.backfill_mem) != actual:
+            logger.warning(f"[RECONCILE] Agent {agent_id} capacity was "
+                           f"{agent.available_cpu} CPU / {agent.available_mem} GB free, now "
+                           f"{actual[0]} CPU / {actual[1]} GB")
+            agent.available_cpu, agent.available_mem, agent.backfill_cpu, agent.backfill_mem = actual
+            fixed.append(agent)
+
+    if vanished or fixed:
+        db.session.commit()
+    return orphans, vanished, fixed
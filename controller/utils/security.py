@@ -0,0 +1,184 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from flask import current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+class HashingBusy(Exception):
+    """Raised when the password hashing pool and its queue are full, or a queued hash times out."""
+
+def _hash_pool(workers):
+    """Thread pool for hashing that runs on OS threads, also in gevent workers.
+
+    gevent's monkey patching turns `threading` into greenlets, where scrypt
+    would hold the worker's hub (and every other request on it) for each hash.
+    """
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+    except ImportError:
+        pass
+    else:
+        if monkey.is_module_patched("threading"):
+            return NativeThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+
+class HashExecutor:
+    """Bounded pool for password hashing so login bursts can't take every CPU.
+
+    At most `workers` hashes run at once and `queue` more may wait; anything
+    beyond that is rejected immediately instead of piling up request threads.
+    """
+
+    def __init__(self, workers, queue, timeout):
+        self.pool = _hash_pool(workers)
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The hash still finishes in the background and frees its slot then
+            raise HashingBusy() from None
+
+class RateLimiter:
+    """Token bucket per key: `limit` attempts per `window` seconds."""
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        """Take one token for `key`; returns 0 if allowed, else seconds until retry."""
+        if not self.limit:
+            return 0
+        rate = self.limit / self.window
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (self.limit, now))
+            tokens = min(self.limit, tokens + (now - last) * rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return max(1, int((1 - tokens) / rate + 0.999))
+            self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now, rate)
+        return 0
+
+    def _prune(self, now, rate):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key, (tokens, last) in list(self.buckets.items()):
+            if tokens + (now - last) * rate >= self.limit:
+                del self.buckets[key]
+
+class UserStatusCache:
+    """LRU of user_id -> (active, role) entries that expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                return entry[1]
+        status = loader(user_id)
+        with self.lock:
+            self.entries[user_id] = (now + self.ttl, status)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return status
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+def _load_user_status(user_id):
+    from controller.models import db, User
+    row = db.session.query(User.active, User.role).filter(User.id == user_id).first()
+    return (row.active, row.role) if row else None
+
+def token_revoked(jwt_header, jwt_payload):
+    """Reject tokens of missing or disabled users, or whose role has since changed."""
+    try:
+        user_id = int(jwt_payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        return True  # pre-compact token format; the user just logs in again
+    status = current_app.extensions["user_status"].get(user_id, _load_user_status)
+    return status is None or not status[0] or status[1] != jwt_payload.get("role")
+
+def token_claims(user):
+    """Keyword arguments for create_access_token: id as subject, role as a claim."""
+    return {"identity": str(user.id), "additional_claims": {"role": user.role}}
+
+def current_user_id():
+    return int(get_jwt_identity())
+
+def current_role():
+    return get_jwt().get("role")
+
+@lru_cache(maxsize=16)
+def _stored_method(method):
+    """The method prefix werkzeug writes for `method`, with its defaults filled in."""
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+def needs_rehash(pwhash, method):
+    return pwhash.split("$", 1)[0] != _stored_method(method)
+
+def hash_password(app, password):
+    return app.extensions["pwhash"].run(generate_password_hash, password, app.config["PASSWORD_HASH_METHOD"])
+
+def verify_password(app, pwhash, password):
+    return app.extensions["pwhash"].run(check_password_hash, pwhash, password)
+
+def trust_proxies(app):
+    """Take the client address from X-Forwarded-For when TRUSTED_PROXY_HOPS proxies are in front.
+
+    Without this every request seems to come from the proxy, so all logins
+    share one per-IP bucket. Only trust hops that really exist: a client that
+    can reach the controller directly could otherwise spoof its address.
+    """
+    hops = app.config["TRUSTED_PROXY_HOPS"]
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+def init_app(app, jwt):
+    trust_proxies(app)
+    app.extensions["user_status"] = UserStatusCache(app.config["USER_STATUS_CACHE_SIZE"],
+                                                    app.config["USER_STATUS_TTL"])
+    jwt.token_in_blocklist_loader(token_revoked)
+    app.extensions["pwhash"] = HashExecutor(
+        app.config["PASSWORD_HASH_WORKERS"],
+        app.config["PASSWORD_HASH_QUEUE"],
+        app.config["PASSWORD_HASH_TIMEOUT"]
+    )
+    window = app.config["LOGIN_RATE_WINDOW"]
+    app.extensions["login_limits"] = {
+        "ip": RateLimiter(app.config["LOGIN_RATE_PER_IP"], window),
+        "account": RateLimiter(app.config["LOGIN_RATE_PER_ACCOUNT"], window)
+    }
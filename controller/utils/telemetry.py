@@ -0,0 +1,194 @@
+import time
+import logging
+from sqlalchemy import func, literal
+
+logger = logging.getLogger(__name__)
+
+RAW, MINUTE, HOUR = 0, 60, 3600
+
+def ingest_samples(db, UsageSample, RollupWatermark, Booking, agent_id, samples):
+    """Store raw samples from one agent batch; returns the number of rows written.
+
+    Holds a shared lock on the raw watermark until the commit, see run_rollups().
+    """
+    names = {s.get("c") for s in samples if s.get("c")}
+    if not names:
+        return 0
+    bookings = dict(db.session.query(Booking.container_name, Booking.id).filter(
+        Booking.agent_id == agent_id,
+        Booking.container_name.in_(names)
+    ).all())
+
+    rows = []
+    for s in samples:
+        booking_id = bookings.get(s.get("c"))
+        if booking_id is None:
+            continue
+        try:
+            cpu = float(s["cpu"])
+            mem = float(s["mem"])
+            rows.append({
+                "booking_id": booking_id,
+                "agent_id": agent_id,
+                "resolution": RAW,
+                "ts": int(s["t"]),
+                "cpu": cpu,
+                "cpu_max": cpu,
+                "mem": mem,
+                "mem_max": mem,
+                "samples": 1
+            })
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    if rows:
+        db.session.execute(db.select(RollupWatermark.last_id).where(
+            RollupWatermark.resolution == RAW).with_for_update(read=True))
+        db.session.execute(db.insert(UsageSample), rows)
+        db.session.commit()
+    return len(rows)
+
+def next_bucket(db, UsageSample, resolution):
+    """Start of the first `resolution` bucket not rolled up yet."""
+    last = db.session.query(func.max(UsageSample.ts)).filter(UsageSample.resolution == resolution).scalar()
+    return last + resolution if last is not None else 0
+
+def rollup(db, UsageSample, source, target, upto, max_id=None):
+    """Aggregate `source` rows into `target`-second buckets that end at or before `upto`.
+
+    The newest existing `target` bucket is the watermark, so every bucket is written once.
+    Rows with an id above `max_id` are left to merge_late() on the next run.
+    """
+    start = next_bucket(db, UsageSample, target)
+    end = upto - upto % target
+    if end <= start:
+        return 0
+
+    bucket = (UsageSample.ts // target) * target
+    weight = func.sum(UsageSample.samples)
+    select = db.select(
+        UsageSample.booking_id,
+        func.max(UsageSample.agent_id),
+        literal(target),
+        bucket,
+        func.sum(UsageSample.cpu * UsageSample.samples) / weight,
+        func.max(UsageSample.cpu_max),
+        func.sum(UsageSample.mem * UsageSample.samples) / weight,
+        func.max(UsageSample.mem_max),
+        weight
+    ).where(
+        UsageSample.resolution == source,
+        UsageSample.ts >= start,
+        UsageSample.ts < end,
+        *([UsageSample.id <= max_id] if max_id is not None else [])
+    ).group_by(UsageSample.booking_id, bucket)
+
+    result = db.session.execute(db.insert(UsageSample).from_select(
+        ["booking_id", "agent_id", "resolution", "ts", "cpu", "cpu_max", "mem", "mem_max", "samples"],
+        select
+    ))
+    return result.rowcount
+
+def _merge(db, UsageSample, resolution, partials):
+    """Fold partial aggregates {(booking_id, bucket): [agent, cpu_sum, cpu_max, mem_sum, mem_max, weight]}
+    into existing `resolution` rows, creating the rows that are missing."""
+    existing = {(r.booking_id, r.ts): r for r in UsageSample.query.filter(
+        UsageSample.resolution == resolution,
+        UsageSample.booking_id.in_({b for b, _ in partials}),
+        UsageSample.ts.in_({ts for _, ts in partials})
+    )}
+    for (booking_id, ts), (agent_id, cpu_sum, cpu_max, mem_sum, mem_max, weight) in partials.items():
+        row = existing.get((booking_id, ts))
+        if row is None:
+            db.session.add(UsageSample(booking_id=booking_id, agent_id=agent_id, resolution=resolution, ts=ts,
+                                       cpu=cpu_sum / weight, cpu_max=cpu_max, mem=mem_sum / weight,
+                                       mem_max=mem_max, samples=weight))
+            continue
+        total = row.samples + weight
+        row.cpu = (row.cpu * row.samples + cpu_sum) / total
+        row.mem = (row.mem * row.samples + mem_sum) / total
+        row.cpu_max = max(row.cpu_max, cpu_max)
+        row.mem_max = max(row.mem_max, mem_max)
+        row.samples = total
+
+def merge_late(db, UsageSample, since_id, upto_id):
+    """Merge raw samples with ids in (since_id, upto_id] whose minute was already rolled up.
+
+    Agents buffer samples while the controller is unreachable and send them with
+    their original timestamps, behind the rollup watermark. Their aggregate is
+    added to the minute rows and, for hours already rolled up, to the hour rows.
+    """
+    minute_start = next_bucket(db, UsageSample, MINUTE)
+    hour_start = next_bucket(db, UsageSample, HOUR)
+    late = db.session.query(UsageSample).filter(
+        UsageSample.resolution == RAW,
+        UsageSample.id > since_id,
+        UsageSample.id <= upto_id,
+        UsageSample.ts < minute_start
+    ).all()
+
+    minutes, hours = {}, {}
+    for s in late:
+        buckets = [(minutes, s.ts - s.ts % MINUTE)]
+        if s.ts < hour_start:  # later hours are rolled from the merged minutes
+            buckets.append((hours, s.ts - s.ts % HOUR))
+        for partials, ts in buckets:
+            p = partials.setdefault((s.booking_id, ts), [s.agent_id, 0.0, s.cpu_max, 0.0, s.mem_max, 0])
+            p[1] += s.cpu * s.samples
+            p[2] = max(p[2], s.cpu_max)
+            p[3] += s.mem * s.samples
+            p[4] = max(p[4], s.mem_max)
+            p[5] += s.samples
+    if minutes:
+        _merge(db, UsageSample, MINUTE, minutes)
+    if hours:
+        _merge(db, UsageSample, HOUR, hours)
+    db.session.flush()
+    return len(late)
+
+def prune(db, UsageSample, resolution, older_than):
+    result = db.session.execute(db.delete(UsageSample).where(
+        UsageSample.resolution == resolution,
+        UsageSample.ts < older_than
+    ))
+    return result.rowcount
+
+def run_rollups(db, UsageSample, RollupWatermark, config, now=None):
+    """Merge late raw samples, roll raw samples up to minutes and minutes up to hours, then apply retention.
+
+    Raw rows are tracked by id as well as timestamp: rows up to the watermark
+    id have been counted, so a sample that arrives late is merged exactly once.
+    That needs every id below the newest to be committed when it's read, which
+    Postgres doesn't promise: an ingest can take a lower id and commit after a
+    higher one. So ingest and rollup are serialised on the watermark row:
+    ingests hold it shared (they don't wait for each other) and this takes it
+    exclusively before reading the newest id, waiting for open ingests and
+    holding new ones back until the rollup commits. SQLite has one writer at a
+    time and needs no lock. Only the very first run, which creates the row,
+    can't wait for ingests that are already open.
+    """
+    now = int(now if now is not None else time.time())
+    upto = now - config["TELEMETRY_ROLLUP_LAG"]
+    try:
+        watermark = db.session.get(RollupWatermark, RAW, with_for_update=True)
+        newest = db.session.query(func.max(UsageSample.id)).scalar() or 0
+        late = 0
+        if watermark is None:
+            # First run: everything stored so far is covered by the timestamp watermarks
+            db.session.add(RollupWatermark(resolution=RAW, last_id=newest))
+        else:
+            late = merge_late(db, UsageSample, watermark.last_id, newest)
+            watermark.last_id = newest
+        minutes = rollup(db, UsageSample, RAW, MINUTE, upto, max_id=newest)
+        hours = rollup(db, UsageSample, MINUTE, HOUR, upto)
+        pruned = prune(db, UsageSample, RAW, now - config["TELEMETRY_RAW_RETENTION_HOURS"] * 3600)
+        pruned += prune(db, UsageSample, MINUTE, now - config["TELEMETRY_MINUTE_RETENTION_DAYS"] * 86400)
+        pruned += prune(db, UsageSample, HOUR, now - config["TELEMETRY_HOUR_RETENTION_DAYS"] * 86400)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Telemetry rollup failed: {e}")
+        return
+    if minutes or hours or late or pruned:
+        logger.info(f"Telemetry rollup: {minutes} minute rows, {hours} hour rows, "
+                    f"{late} late samples merged, {pruned} pruned")
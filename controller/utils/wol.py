@@ -1,14 +1,59 @@
-import socket, struct
+import socket
+import threading
+from functools import lru_cache
 
-def wake_on_lan(mac):
-    mac = mac.replace(":", "").replace("-", "")
-    if len(mac) != 12:
+_sock = None
+_sock_lock = threading.Lock()
+
+@lru_cache(maxsize=4096)
+def magic_packet(mac):
+    """6 x 0xFF followed by the MAC 16 times, built once per MAC."""
+    digits = mac.replace(":", "").replace("-", "").replace(".", "")
+    if len(digits) != 12:
+        raise ValueError("Invalid MAC")
+    try:
+        return bytes.fromhex("FF" * 6 + digits * 16)
+    except ValueError:
         raise ValueError("Invalid MAC")
-    data = b'FF' * 6 + (mac.encode() * 16)
-    send_data = b''
-    for i in range(0, len(data), 2):
-        send_data += struct.pack('B', int(data[i:i+2], 16))
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.sendto(send_data, ('<broadcast>', 9))
-    sock.close()
+
+def _socket():
+    global _sock
+    with _sock_lock:
+        if _sock is None:
+            _sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return _sock
+
+def _reset_socket():
+    global _sock
+    with _sock_lock:
+        if _sock is not None:
+            _sock.close()
+            _sock = None
+
+def wake_many(macs, broadcast=("<broadcast>",), port=9, repeat=1):
+    """Send magic packets for every distinct MAC over one shared socket.
+
+    Each packet goes to every broadcast address `repeat` times, since UDP
+    broadcasts are occasionally dropped. Returns {mac: error} for failures.
+    """
+    failed = {}
+    sock = _socket()
+    for mac in dict.fromkeys(macs):
+        try:
+            packet = magic_packet(mac)
+            for _ in range(repeat):
+                for address in broadcast:
+                    sock.sendto(packet, (address, port))
+        except ValueError as e:
+            failed[mac] = e
+        except OSError as e:
+            failed[mac] = e
+            _reset_socket()
+            sock = _socket()
+    return failed
+
+def wake_on_lan(mac, broadcast=("<broadcast>",), port=9, repeat=1):
+    error = wake_many([mac], broadcast, port, repeat).get(mac)
+    if error:
+        raise error
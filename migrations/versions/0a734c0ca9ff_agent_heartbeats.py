@@ -0,0 +1,37 @@
+"""agent heartbeat columns
+
+Revision ID: 0a734c0ca9ff
+Revises: b772ac06260e
+Create Date: 2026-10-19 08:01:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a734c0ca9ff'
+down_revision = 'b772ac06260e'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('cpu_percent', sa.Float(), nullable=True),
+    sa.Column('mem_percent', sa.Float(), nullable=True),
+    sa.Column('running_containers', sa.Integer(), nullable=True, server_default='0'),
+]
+
+
+def upgrade():
+    present = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('agent')}
+    with op.batch_alter_table('agent') as batch_op:
+        for column in COLUMNS:
+            if column.name not in present:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('agent') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,46 @@
+"""preemptible backfill: agent backfill capacity, booking priority class
+
+Revision ID: 1591b2e9e626
+Revises: 26f9b6d3b6a1
+Create Date: 2026-10-19 08:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1591b2e9e626'
+down_revision = '26f9b6d3b6a1'
+branch_labels = None
+depends_on = None
+
+# Server defaults so existing rows get the values the models default to
+AGENT_COLUMNS = [
+    sa.Column('backfill_cpu', sa.Integer(), nullable=True, server_default='0'),
+    sa.Column('backfill_mem', sa.Integer(), nullable=True, server_default='0'),
+]
+BOOKING_COLUMNS = [
+    sa.Column('priority_class', sa.String(length=20), nullable=True, server_default='guaranteed'),
+    sa.Column('preempted_at', sa.DateTime(), nullable=True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, columns in (('agent', AGENT_COLUMNS), ('booking', BOOKING_COLUMNS)):
+        present = {c['name'] for c in inspector.get_columns(table)}
+        with op.batch_alter_table(table) as batch_op:
+            for column in columns:
+                if column.name not in present:
+                    batch_op.add_column(column)
+    if 'ix_agent_status_capacity' not in {i['name'] for i in inspector.get_indexes('agent')}:
+        op.create_index('ix_agent_status_capacity', 'agent', ['status', 'available_cpu', 'available_mem'])
+
+
+def downgrade():
+    op.drop_index('ix_agent_status_capacity', table_name='agent')
+    for table, columns in (('booking', BOOKING_COLUMNS), ('agent', AGENT_COLUMNS)):
+        with op.batch_alter_table(table) as batch_op:
+            for column in reversed(columns):
+                batch_op.drop_column(column.name)
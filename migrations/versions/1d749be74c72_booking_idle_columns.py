@@ -0,0 +1,36 @@
+"""booking idle tracking and end reason
+
+Revision ID: 1d749be74c72
+Revises: 24f6481525f5
+Create Date: 2026-10-19 08:03:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d749be74c72'
+down_revision = '24f6481525f5'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('idle_since', sa.DateTime(), nullable=True),
+    sa.Column('idle_warned_at', sa.DateTime(), nullable=True),
+    sa.Column('end_reason', sa.String(length=20), nullable=True),
+]
+
+
+def upgrade():
+    present = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('booking')}
+    with op.batch_alter_table('booking') as batch_op:
+        for column in COLUMNS:
+            if column.name not in present:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('booking') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
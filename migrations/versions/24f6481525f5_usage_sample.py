@@ -0,0 +1,43 @@
+"""usage_sample table for container telemetry and its rollups
+
+Revision ID: 24f6481525f5
+Revises: 0a734c0ca9ff
+Create Date: 2026-10-19 08:02:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '24f6481525f5'
+down_revision = '0a734c0ca9ff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('usage_sample'):
+        return  # already created by db.create_all()
+    op.create_table(
+        'usage_sample',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('agent_id', sa.Integer(), nullable=True),
+        sa.Column('resolution', sa.Integer(), nullable=False),
+        sa.Column('ts', sa.Integer(), nullable=False),
+        sa.Column('cpu', sa.Float(), nullable=True),
+        sa.Column('cpu_max', sa.Float(), nullable=True),
+        sa.Column('mem', sa.Float(), nullable=True),
+        sa.Column('mem_max', sa.Float(), nullable=True),
+        sa.Column('samples', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_usage_booking_res_ts', 'usage_sample', ['booking_id', 'resolution', 'ts'])
+    op.create_index('ix_usage_res_ts', 'usage_sample', ['resolution', 'ts'])
+
+
+def downgrade():
+    op.drop_index('ix_usage_res_ts', table_name='usage_sample')
+    op.drop_index('ix_usage_booking_res_ts', table_name='usage_sample')
+    op.drop_table('usage_sample')
@@ -0,0 +1,36 @@
+"""usage_ledger table for weekly quotas
+
+Revision ID: 257ac886ced2
+Revises: 1591b2e9e626
+Create Date: 2026-10-19 08:06:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '257ac886ced2'
+down_revision = '1591b2e9e626'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('usage_ledger'):
+        return  # already created by db.create_all()
+    op.create_table(
+        'usage_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('scope', sa.String(length=20), nullable=False),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('cpu_hours', sa.Float(), nullable=False),
+        sa.Column('mem_gb_hours', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('scope', 'key', 'period_start', name='uq_ledger_scope_key_period')
+    )
+
+
+def downgrade():
+    op.drop_table('usage_ledger')
@@ -0,0 +1,40 @@
+"""agent suspend/wake columns and the booking status/start index
+
+Revision ID: 26f9b6d3b6a1
+Revises: 1d749be74c72
+Create Date: 2026-10-19 08:04:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '26f9b6d3b6a1'
+down_revision = '1d749be74c72'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('suspended_at', sa.DateTime(), nullable=True),
+    sa.Column('wake_sent_at', sa.DateTime(), nullable=True),
+    sa.Column('boot_seconds', sa.Float(), nullable=True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    present = {c['name'] for c in inspector.get_columns('agent')}
+    with op.batch_alter_table('agent') as batch_op:
+        for column in COLUMNS:
+            if column.name not in present:
+                batch_op.add_column(column)
+    if 'ix_booking_status_start' not in {i['name'] for i in inspector.get_indexes('booking')}:
+        op.create_index('ix_booking_status_start', 'booking', ['status', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_booking_status_start', table_name='booking')
+    with op.batch_alter_table('agent') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
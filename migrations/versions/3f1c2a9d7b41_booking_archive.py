@@ -0,0 +1,55 @@
+"""booking archive table, range-partitioned by month on PostgreSQL
+
+Revision ID: 3f1c2a9d7b41
+Revises: 257ac886ced2
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b41'
+down_revision = '257ac886ced2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if sa.inspect(bind).has_table('booking_archive'):
+        return  # already created by db.create_all()
+    op.create_table(
+        'booking_archive',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('agent_id', sa.Integer(), nullable=True),
+        sa.Column('cpu', sa.Integer(), nullable=False),
+        sa.Column('memory', sa.String(length=20), nullable=False),
+        sa.Column('image', sa.String(length=100), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('container_name', sa.String(length=100), nullable=True),
+        sa.Column('access_url', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('notes', sa.String(length=500), nullable=True),
+        sa.Column('rejection_reason', sa.String(length=500), nullable=True),
+        sa.Column('idle_since', sa.DateTime(), nullable=True),
+        sa.Column('idle_warned_at', sa.DateTime(), nullable=True),
+        sa.Column('end_reason', sa.String(length=20), nullable=True),
+        sa.Column('priority_class', sa.String(length=20), nullable=True),
+        sa.Column('preempted_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id', 'end_time'),
+        # Monthly partitions are created on demand by the archiver
+        postgresql_partition_by='RANGE (end_time)'
+    )
+    op.create_index('ix_booking_archive_user_created', 'booking_archive', ['user_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_booking_archive_user_created', table_name='booking_archive')
+    op.drop_table('booking_archive')
@@ -0,0 +1,35 @@
+"""workspace_location table: agents caching a user's workspace
+
+Revision ID: 83f506ae8d60
+Revises: df008a46a084
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '83f506ae8d60'
+down_revision = 'df008a46a084'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('workspace_location'):
+        return  # already created by db.create_all()
+    op.create_table(
+        'workspace_location',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('agent_id', sa.Integer(), nullable=False),
+        sa.Column('seen_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['agent_id'], ['agent.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'agent_id', name='uq_workspace_user_agent')
+    )
+
+
+def downgrade():
+    op.drop_table('workspace_location')
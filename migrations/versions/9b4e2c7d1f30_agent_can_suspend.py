@@ -0,0 +1,29 @@
+"""agent can_suspend flag reported at registration
+
+Revision ID: 9b4e2c7d1f30
+Revises: e5c0a8f3b217
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e2c7d1f30'
+down_revision = 'e5c0a8f3b217'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    present = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('agent')}
+    if 'can_suspend' in present:
+        return
+    with op.batch_alter_table('agent') as batch_op:
+        batch_op.add_column(sa.Column('can_suspend', sa.Boolean(), nullable=True, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('agent') as batch_op:
+        batch_op.drop_column('can_suspend')
@@ -0,0 +1,28 @@
+"""agent state_changed_at for conditional GET on the agent list
+
+Revision ID: aecb0a54e553
+Revises: 3f1c2a9d7b41
+Create Date: 2026-10-19 09:08:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aecb0a54e553'
+down_revision = '3f1c2a9d7b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'state_changed_at' in {c['name'] for c in sa.inspect(op.get_bind()).get_columns('agent')}:
+        return
+    with op.batch_alter_table('agent') as batch_op:
+        batch_op.add_column(sa.Column('state_changed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('agent') as batch_op:
+        batch_op.drop_column('state_changed_at')
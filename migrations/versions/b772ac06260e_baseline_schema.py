@@ -0,0 +1,84 @@
+"""baseline schema: user, agent and booking as first released
+
+Revision ID: b772ac06260e
+Revises: 
+Create Date: 2026-10-19 08:00:00.000000
+
+Databases created by db.create_all() before migrations were tracked already
+have these tables; they are left as they are and only the later revisions
+add what is missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b772ac06260e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'user' not in existing:
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=256), nullable=False),
+            sa.Column('role', sa.String(length=20), nullable=True),
+            sa.Column('department', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'agent' not in existing:
+        op.create_table(
+            'agent',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('ip', sa.String(length=100), nullable=False),
+            sa.Column('mac', sa.String(length=32), nullable=True),
+            sa.Column('port', sa.Integer(), nullable=True),
+            sa.Column('wol_enabled', sa.Boolean(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+            sa.Column('total_cpu', sa.Integer(), nullable=True),
+            sa.Column('total_mem', sa.Integer(), nullable=True),
+            sa.Column('available_cpu', sa.Integer(), nullable=True),
+            sa.Column('available_mem', sa.Integer(), nullable=True),
+            sa.Column('tags', sa.String(length=255), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'booking' not in existing:
+        op.create_table(
+            'booking',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('agent_id', sa.Integer(), nullable=True),
+            sa.Column('cpu', sa.Integer(), nullable=False),
+            sa.Column('memory', sa.String(length=20), nullable=False),
+            sa.Column('image', sa.String(length=100), nullable=False),
+            sa.Column('start_time', sa.DateTime(), nullable=False),
+            sa.Column('end_time', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('container_name', sa.String(length=100), nullable=True),
+            sa.Column('access_url', sa.String(length=255), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('notes', sa.String(length=500), nullable=True),
+            sa.Column('rejection_reason', sa.String(length=500), nullable=True),
+            sa.ForeignKeyConstraint(['agent_id'], ['agent.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('booking')
+    op.drop_table('agent')
+    op.drop_table('user')
@@ -0,0 +1,35 @@
+"""agent NUMA node count and free cores per node
+
+Revision ID: df008a46a084
+Revises: aecb0a54e553
+Create Date: 2026-10-19 09:09:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'df008a46a084'
+down_revision = 'aecb0a54e553'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('numa_nodes', sa.Integer(), nullable=True, server_default='1'),
+    sa.Column('node_free_cpu', sa.Integer(), nullable=True),
+]
+
+
+def upgrade():
+    present = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('agent')}
+    with op.batch_alter_table('agent') as batch_op:
+        for column in COLUMNS:
+            if column.name not in present:
+                batch_op.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('agent') as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,31 @@
+"""rollup_watermark table: ingest watermark for late telemetry samples
+
+Revision ID: e5c0a8f3b217
+Revises: 83f506ae8d60
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c0a8f3b217'
+down_revision = '83f506ae8d60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('rollup_watermark'):
+        return  # already created by db.create_all()
+    op.create_table(
+        'rollup_watermark',
+        sa.Column('resolution', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('resolution')
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_watermark')
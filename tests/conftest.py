@@ -83,6 +83,46 @@ def agent_fixture(app):
         return agent
 
 
+class StubResponse:
+    """Stands in for an agent's reply where `agent_request` or `requests` is monkeypatched."""
+
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+def make_agent(name, status='online', cpu=8, mem=16, **kwargs):
+    """Add an agent with all of its capacity free."""
+    kwargs.setdefault('ip', '10.0.0.5')
+    agent = Agent(name=name, status=status, total_cpu=cpu, available_cpu=cpu,
+                  total_mem=mem, available_mem=mem, **kwargs)
+    db.session.add(agent)
+    db.session.commit()
+    return agent
+
+
+def make_booking(agent=None, start=None, status='approved', cpu=1, hours=2, **kwargs):
+    """Add a booking for the first user (created if there is none), starting a minute ago by default."""
+    user = User.query.first() or User(name='Student', email='factory@test.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    start = start or datetime.utcnow() - timedelta(minutes=1)
+    kwargs.setdefault('memory', '4g')
+    kwargs.setdefault('image', 'img')
+    booking = Booking(user_id=user.id, agent_id=agent.id if agent else None, cpu=cpu, start_time=start,
+                      end_time=start + timedelta(hours=hours), status=status, **kwargs)
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
 class TestAuth:
     """Test authentication endpoints."""
     
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, WorkspaceLocation
+from controller.utils.heartbeat import flush_heartbeats, mark_stale_agents
+from controller.utils.placement import find_agent, workspace_agents
+from controller.utils import scheduler
+
+
+AGENT_HEADERS = {'X-Agent-Token': 'agent-secret'}
+
+
+def register(client, **overrides):
+    payload = {
+        'name': 'lab-pc-1',
+        'ip': '10.0.0.5',
+        'mac': 'aa:bb:cc:dd:ee:ff',
+        'port': 5000,
+        'total_cpu': 8,
+        'total_mem': 16,
+        'tags': 'gpu'
+    }
+    payload.update(overrides)
+    return client.post('/api/agents/register', json=payload, headers=AGENT_HEADERS)
+
+
+class TestAgentRegistration:
+    """Test agent self-registration."""
+
+    def test_register_creates_agent(self, client, app):
+        resp = register(client)
+        assert resp.status_code == 201
+        agent = db.session.get(Agent, resp.json['id'])
+        assert agent.status == 'online'
+        assert agent.available_cpu == 8
+        assert agent.tags == 'gpu'
+
+    def test_reregister_keeps_reservations(self, client, app):
+        agent_id = register(client).json['id']
+        agent = db.session.get(Agent, agent_id)
+        agent.available_cpu = 6
+        db.session.commit()
+
+        resp = register(client, total_cpu=12)
+        assert resp.status_code == 200
+        assert resp.json['id'] == agent_id
+        db.session.refresh(agent)
+        assert agent.total_cpu == 12
+        assert agent.available_cpu == 10
+
+    def test_register_requires_token(self, client):
+        resp = client.post('/api/agents/register', json={'name': 'x', 'total_cpu': 1, 'total_mem': 1},
+                           headers={'X-Agent-Token': 'wrong'})
+        assert resp.status_code == 401
+
+
+class TestHeartbeat:
+    """Test heartbeat ingest and staleness detection."""
+
+    def test_heartbeat_applied_on_flush(self, client, app):
+        agent_id = register(client).json['id']
+        resp = client.post('/api/agents/heartbeat', json={
+            'id': agent_id, 'cpu': 42.5, 'mem': 30.0, 'containers': ['compute_1_12345']
+        }, headers=AGENT_HEADERS)
+        assert resp.status_code == 204
+
+        flush_heartbeats(db, Agent, Booking)
+        agent = db.session.get(Agent, agent_id)
+        db.session.refresh(agent)
+        assert agent.cpu_percent == 42.5
+        assert agent.running_containers == 1
+
+    def test_heartbeat_unknown_agent(self, client):
+        resp = client.post('/api/agents/heartbeat', json={'id': 9999}, headers=AGENT_HEADERS)
+        assert resp.status_code == 404
+
+    def test_stale_agents_marked_offline(self, client, app):
+        agent_id = register(client).json['id']
+        agent = db.session.get(Agent, agent_id)
+        agent.last_seen = datetime.utcnow() - timedelta(minutes=5)
+        db.session.commit()
+
+        assert mark_stale_agents(db, Agent, 30) == 1
+        db.session.refresh(agent)
+        assert agent.status == 'offline'
+
+    def test_placement_prefers_node_local_cores(self, client, app):
+        split_id = register(client, name='split', ip='10.0.0.6', total_cpu=16, numa_nodes=2).json['id']
+        local_id = register(client, name='local', ip='10.0.0.7', total_cpu=8, numa_nodes=2).json['id']
+        for agent_id, node_free in ((split_id, 3), (local_id, 4)):
+            client.post('/api/agents/heartbeat', json={'id': agent_id, 'node_free_cpu': node_free},
+                        headers=AGENT_HEADERS)
+        flush_heartbeats(db, Agent, Booking)
+
+        # The emptier agent would win on free cores, but only the other keeps 4 cores on one node
+        assert find_agent(Agent, 4, 2).id == local_id
+        assert find_agent(Agent, 2, 2).id == split_id
+        assert db.session.get(Agent, local_id).numa_nodes == 2
+
+    def test_placement_prefers_workspace_holder(self, client, app, monkeypatch):
+        monkeypatch.setattr('controller.utils.heartbeat._workspaces', {})
+        big_id = register(client, name='big', ip='10.0.0.6', total_cpu=16).json['id']
+        cached_id = register(client, name='cached', ip='10.0.0.7', total_cpu=8).json['id']
+        client.post('/api/agents/heartbeat', json={'id': cached_id, 'workspaces': [7, 9]}, headers=AGENT_HEADERS)
+        flush_heartbeats(db, Agent, Booking)
+        held = workspace_agents(db, WorkspaceLocation, [7, 8])
+        assert held == {7: {cached_id}}
+
+        assert find_agent(Agent, 2, 2, prefer=held[7]).id == cached_id
+        assert find_agent(Agent, 2, 2).id == big_id
+
+        client.post('/api/agents/heartbeat', json={'id': cached_id, 'workspaces': [9]}, headers=AGENT_HEADERS)
+        flush_heartbeats(db, Agent, Booking)
+        assert workspace_agents(db, WorkspaceLocation, [7, 9]) == {9: {cached_id}}
+
+    def test_workspaces_prepared_before_sessions(self, client, app, monkeypatch):
+        agent = db.session.get(Agent, register(client).json['id'])
+        now = datetime.utcnow()
+        for user_id, start in ((7, now + timedelta(minutes=5)), (8, now + timedelta(hours=2)), (9, now)):
+            db.session.add(Booking(user_id=user_id, agent_id=agent.id, cpu=1, memory='2g', image='img',
+                                   status='approved', start_time=start, end_time=start + timedelta(hours=1)))
+        db.session.commit()
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request', lambda method, agent, call, path, **kw: calls.append(path))
+
+        scheduler.prepare_workspaces(db, Booking, Agent, app.config, now)
+        assert calls == ['/workspaces/7/prepare']
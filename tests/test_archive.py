@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Booking, BookingArchive, User
+from controller.utils.archive import archive_bookings, next_month
+
+
+def make_booking(user, status, ended_days_ago):
+    end = datetime.utcnow() - timedelta(days=ended_days_ago)
+    booking = Booking(user_id=user.id, cpu=1, memory='2g', image='img', status=status,
+                      start_time=end - timedelta(hours=1), end_time=end)
+    db.session.add(booking)
+    return booking
+
+
+class TestArchive:
+    """Test moving finished bookings to the archive table."""
+
+    def test_archives_old_terminal_bookings_in_chunks(self, app, client, student_token, admin_token):
+        user = User.query.filter_by(email='student@test.com').first()
+        old = [make_booking(user, 'completed', 120) for _ in range(5)]
+        recent = make_booking(user, 'completed', 10)
+        stuck = make_booking(user, 'approved', 120)  # never archived while not terminal
+        db.session.commit()
+        old_ids = sorted(b.id for b in old)
+        kept_ids = {recent.id, stuck.id}
+
+        config = dict(app.config, ARCHIVE_AFTER_DAYS=90, ARCHIVE_CHUNK=2, ARCHIVE_PAUSE_SECONDS=0)
+        assert archive_bookings(db, Booking, BookingArchive, config) == 5
+        assert sorted(a.id for a in BookingArchive.query) == old_ids
+        assert {b.id for b in Booking.query} == kept_ids
+        assert archive_bookings(db, Booking, BookingArchive, config) == 0
+
+        # History endpoints read both tables
+        resp = client.get('/api/student/bookings', headers={'Authorization': f'Bearer {student_token}'})
+        assert {b['id'] for b in resp.json} == set(old_ids) | kept_ids
+        resp = client.get('/api/admin/bookings?status=completed',
+                          headers={'Authorization': f'Bearer {admin_token}'})
+        assert {b['id'] for b in resp.json} == set(old_ids) | {recent.id}
+        assert all(b['user_name'] == 'Student User' for b in resp.json)
+        resp = client.get('/api/admin/bookings?status=approved',
+                          headers={'Authorization': f'Bearer {admin_token}'})
+        assert [b['id'] for b in resp.json] == [stuck.id]
+        resp = client.get('/api/admin/stats', headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.json['completed'] == 6
+        resp = client.get(f'/api/admin/bookings/{old_ids[0]}/usage',
+                          headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.status_code == 200
+
+    def test_max_chunks_bounds_a_run(self, app, student_token):
+        user = User.query.filter_by(email='student@test.com').first()
+        for _ in range(5):
+            make_booking(user, 'cancelled', 200)
+        db.session.commit()
+        config = dict(app.config, ARCHIVE_AFTER_DAYS=90, ARCHIVE_CHUNK=2, ARCHIVE_MAX_CHUNKS=1,
+                      ARCHIVE_PAUSE_SECONDS=0)
+        assert archive_bookings(db, Booking, BookingArchive, config) == 2
+        assert Booking.query.count() == 3
+
+
+def test_next_month_wraps_year():
+    assert next_month(datetime(2024, 12, 1)) == datetime(2025, 1, 1)
+    assert next_month(datetime(2024, 3, 1)) == datetime(2024, 4, 1)
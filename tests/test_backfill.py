@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking
+from controller.utils import scheduler
+from conftest import StubResponse, make_agent, make_booking
+
+
+def fake_agent(calls):
+    def request(method, agent, call, path, **kwargs):
+        calls.append((call, agent.id))
+        if call == 'start_container':
+            return StubResponse(200, {'container_name': f"compute_{kwargs['json']['user_id']}_{len(calls)}",
+                                      'url': 'http://x'})
+        return StubResponse(202)
+    return request
+
+
+class TestBackfill:
+    """Test backfill placement, preemption and requeueing."""
+
+    def test_student_backfill_is_queued(self, client, student_token):
+        resp = client.post('/api/student/book', json={
+            'cpu': 2, 'memory': '4g', 'image': 'img', 'duration_hr': 2, 'priority_class': 'backfill',
+            'start_time': (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+        }, headers={'Authorization': f'Bearer {student_token}'})
+        assert resp.status_code == 201
+        booking = db.session.get(Booking, resp.json['id'])
+        assert booking.status == 'queued'
+        assert booking.start_time >= datetime.utcnow() - timedelta(minutes=1)
+
+    def test_backfill_starts_on_free_capacity(self, app, monkeypatch):
+        small = make_agent('small', cpu=4)
+        make_agent('big', cpu=32)
+        b = make_booking(status='queued', cpu=2, priority_class='backfill')
+        too_big = make_booking(status='queued', cpu=64, priority_class='backfill')
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request', fake_agent(calls))
+
+        started = scheduler.start_backfill(db, Booking, Agent, app.config, datetime.utcnow())
+        assert started == [b]
+        assert b.status == 'active' and b.agent_id == small.id  # best fit
+        assert small.available_cpu == 2 and small.backfill_cpu == 2
+        assert too_big.status == 'queued'
+
+    def test_guaranteed_start_preempts_backfill(self, app, monkeypatch):
+        agent = make_agent('a', cpu=8)
+        agent.available_cpu, agent.available_mem = 2, 8
+        agent.backfill_cpu, agent.backfill_mem = 6, 8
+        old = make_booking(agent, datetime.utcnow() - timedelta(hours=1), 'active', cpu=2,
+                           priority_class='backfill')
+        new = make_booking(agent, status='active', cpu=4, priority_class='backfill')
+        old.container_name, new.container_name = 'compute_old', 'compute_new'
+        guaranteed = make_booking(agent, status='approved', cpu=4)
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request', fake_agent(calls))
+        monkeypatch.setattr(scheduler, 'check_agent_health', lambda db, Agent: None)
+        monkeypatch.setattr(scheduler, 'start_backfill', lambda *args: [])
+
+        scheduler.run_booking_cycle(db, Booking, Agent, app.config)
+        assert [c for c, _ in calls] == ['preempt_container', 'start_container']
+        assert new.status == 'queued' and new.agent_id is None and new.preempted_at is not None
+        assert old.status == 'active'
+        assert guaranteed.status == 'active'
+        assert (agent.available_cpu, agent.backfill_cpu) == (2, 2)
+
+    def test_no_backfill_starts_where_preempted_cores_are_draining(self, app, monkeypatch):
+        agent = make_agent('a', cpu=8)
+        agent.available_cpu, agent.backfill_cpu = 1, 7
+        victim = make_booking(agent, status='active', cpu=4, priority_class='backfill')
+        victim.container_name = 'compute_victim'
+        make_booking(agent, datetime.utcnow() - timedelta(hours=1), 'active', cpu=3, priority_class='backfill')
+        guaranteed = make_booking(agent, status='approved', cpu=2)
+        waiting = make_booking(status='queued', cpu=2, priority_class='backfill')
+        calls, payloads = [], []
+
+        def request(method, agent, call, path, **kwargs):
+            if call == 'start_container':
+                payloads.append(kwargs['json'])
+            return fake_agent(calls)(method, agent, call, path, **kwargs)
+        monkeypatch.setattr(scheduler, 'agent_request', request)
+        monkeypatch.setattr(scheduler, 'check_agent_health', lambda db, Agent: None)
+
+        scheduler.run_booking_cycle(db, Booking, Agent, app.config)
+        assert [c for c, _ in calls] == ['preempt_container', 'start_container']
+        assert payloads[0]['preemptible'] is False
+        assert guaranteed.status == 'active' and victim.status == 'queued'
+        # The victim's container still holds its cores during the grace period
+        assert waiting.status == 'queued' and agent.available_cpu == 3
+
+    def test_approval_counts_backfill_as_reclaimable(self, app, client, admin_token):
+        agent = make_agent('a', cpu=8)
+        agent.available_cpu, agent.backfill_cpu = 0, 8
+        db.session.commit()
+        pending = make_booking(start=datetime.utcnow() + timedelta(days=1), status='pending', cpu=4)
+        resp = client.post(f'/api/admin/approve/{pending.id}', json={},
+                           headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.status_code == 200
+        assert resp.json['agent_id'] == agent.id
@@ -0,0 +1,34 @@
+from controller.app import db
+from controller.models import User, Agent, Booking
+from benchmarks.datagen import generate
+from benchmarks.fake_agent import create_fake_agent
+from benchmarks.run import percentile
+
+
+class TestBenchmarkHarness:
+    """Test the benchmark data generator and fake agent."""
+
+    def test_datagen_is_seeded(self, app):
+        _, _, first = generate(db, User, Agent, Booking, users=10, agents=2, bookings=50, seed=7)
+        statuses = [b.status for b in Booking.query.order_by(Booking.id)]
+        assert len(first) == 50
+
+        db.session.execute(db.delete(Booking))
+        db.session.execute(db.delete(Agent))
+        db.session.execute(db.delete(User))
+        db.session.commit()
+        generate(db, User, Agent, Booking, users=10, agents=2, bookings=50, seed=7)
+        assert [b.status for b in Booking.query.order_by(Booking.id)] == statuses
+
+    def test_fake_agent_lifecycle(self):
+        client = create_fake_agent().test_client()
+        started = client.post('/start_container', json={'user_id': 1, 'image': 'x', 'port': 8001})
+        name = started.json['container_name']
+        assert [c['name'] for c in client.get('/containers').json] == [name]
+        assert client.post(f'/stop_container/{name}').status_code == 200
+        assert client.post(f'/stop_container/{name}').status_code == 404
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        assert percentile(samples, 50) == 50
+        assert percentile(samples, 99) == 99
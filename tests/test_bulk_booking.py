@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, User, UsageLedger
+from controller.utils.profiler import profile_queries
+from controller.utils.quota import period_start
+
+
+def make_class(n):
+    users = [User(name=f'S{i}', email=f's{i}@class.test', password_hash='x', department='CS') for i in range(n)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [u.id for u in users]
+
+
+def bulk(client, token, **overrides):
+    payload = {'cpu': 2, 'memory': '4g', 'image': 'jupyter/scipy-notebook', 'duration_hr': 2,
+               'start_time': (datetime.utcnow() + timedelta(days=1)).isoformat()}
+    payload.update(overrides)
+    return client.post('/api/admin/bookings/bulk', json=payload, headers={'Authorization': f'Bearer {token}'})
+
+
+class TestBulkBooking:
+    """Test class-sized booking creation."""
+
+    def test_creates_all_with_constant_queries(self, client, admin_token):
+        user_ids = make_class(40)
+        client.get('/api/admin/stats', headers={'Authorization': f'Bearer {admin_token}'})  # warm caches
+        with profile_queries() as profile:
+            resp = bulk(client, admin_token, user_ids=user_ids)
+        assert resp.status_code == 201
+        assert resp.json['created'] == 40 and resp.json['placed'] == 0
+        assert profile.count <= 8
+        assert Booking.query.filter_by(status='pending').count() == 40
+        dept = UsageLedger.query.filter_by(scope='department', key='CS').one()
+        assert dept.cpu_hours == 40 * 2 * 2
+
+    def test_overlaps_rejected_or_skipped(self, client, admin_token):
+        user_ids = make_class(3)
+        start = datetime.utcnow() + timedelta(days=1)
+        db.session.add(Booking(user_id=user_ids[1], cpu=1, memory='2g', image='img', status='approved',
+                               start_time=start, end_time=start + timedelta(hours=1)))
+        db.session.commit()
+
+        resp = bulk(client, admin_token, user_ids=user_ids, start_time=start.isoformat())
+        assert resp.status_code == 409
+        assert resp.json['conflicts'] == [user_ids[1]]
+
+        resp = bulk(client, admin_token, user_ids=user_ids, start_time=start.isoformat(), skip_conflicts=True)
+        assert resp.status_code == 201
+        assert resp.json['created'] == 2
+
+    def test_inactive_users_are_reported(self, client, admin_token):
+        user_ids = make_class(3)
+        db.session.get(User, user_ids[2]).active = False
+        db.session.commit()
+
+        resp = bulk(client, admin_token, user_ids=user_ids)
+        assert resp.status_code == 201
+        assert resp.json['created'] == 2 and resp.json['inactive'] == [user_ids[2]]
+
+        resp = bulk(client, admin_token, user_ids=[user_ids[2]])
+        assert resp.status_code == 409
+        assert resp.json['inactive'] == [user_ids[2]]
+
+    def test_backfill_is_rejected(self, client, admin_token):
+        resp = bulk(client, admin_token, user_ids=make_class(1), priority_class='backfill')
+        assert resp.status_code == 400
+        assert 'priority_class' in resp.json['error']
+
+    def test_weekly_quotas_apply(self, app, client, admin_token):
+        user_ids = make_class(3)
+        app.config['QUOTA_USER_CPU_HOURS'] = 6
+        app.config['QUOTA_DEPT_CPU_HOURS'] = 10
+        db.session.add(UsageLedger(scope='user', key=str(user_ids[0]), cpu_hours=4.0, mem_gb_hours=0.0,
+                                   period_start=period_start(datetime.utcnow() + timedelta(days=1))))
+        db.session.commit()
+
+        # 2 CPUs for 2 hours each: user 0 would reach 8 of 6; the department fits two more, 4 + 4 of 10
+        resp = bulk(client, admin_token, user_ids=user_ids)
+        assert resp.status_code == 403
+        assert resp.json['over_quota'] == [user_ids[0]]
+
+        app.config['QUOTA_DEPT_CPU_HOURS'] = 6
+        resp = bulk(client, admin_token, user_ids=user_ids, skip_conflicts=True)
+        assert resp.status_code == 201
+        assert resp.json['created'] == 1 and resp.json['over_quota'] == [user_ids[0], user_ids[2]]
+
+    def test_unknown_users(self, client, admin_token):
+        resp = bulk(client, admin_token, user_ids=[9999], emails=['nobody@class.test'])
+        assert resp.status_code == 400
+        assert resp.json['missing'] == [9999, 'nobody@class.test']
+
+    def test_place_spreads_over_agents_within_capacity(self, client, admin_token):
+        user_ids = make_class(5)
+        for name in ('a', 'b'):
+            db.session.add(Agent(name=name, ip='10.0.0.1', status='online', total_cpu=4, available_cpu=4,
+                                 total_mem=16, available_mem=16, backfill_cpu=0, backfill_mem=0))
+        db.session.commit()
+
+        resp = bulk(client, admin_token, user_ids=user_ids, place=True)
+        assert resp.status_code == 201
+        assert resp.json['placed'] == 4
+        placed = Booking.query.filter_by(status='approved').all()
+        assert sorted(b.agent_id for b in placed).count(placed[0].agent_id) == 2
+        assert Booking.query.filter_by(status='pending').count() == 1
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, User
+from controller.utils.profiler import profile_queries
+
+
+def make_booking():
+    user = User.query.filter_by(email='student@test.com').first()
+    start = datetime.utcnow() + timedelta(hours=1)
+    booking = Booking(user_id=user.id, cpu=1, memory='2g', image='img', status='pending',
+                      start_time=start, end_time=start + timedelta(hours=1))
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+class TestConditionalGet:
+    """Test ETag / Last-Modified handling on polled list endpoints."""
+
+    def test_unchanged_bookings_answer_304_without_loading_rows(self, client, student_token):
+        booking = make_booking()
+        headers = {'Authorization': f'Bearer {student_token}'}
+        resp = client.get('/api/student/bookings', headers=headers)
+        etag = resp.headers['ETag']
+        assert resp.last_modified is not None
+
+        with profile_queries() as profile:
+            resp = client.get('/api/student/bookings', headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.data == b''
+        assert profile.count == 1  # the version aggregate only
+
+        time.sleep(0.01)
+        booking = db.session.get(Booking, booking.id)
+        booking.status = 'approved'
+        db.session.commit()
+        resp = client.get('/api/student/bookings', headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.headers['ETag'] != etag
+
+    def test_admin_bookings_etag_depends_on_filter(self, client, admin_token, student_token):
+        make_booking()
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        etag = client.get('/api/admin/bookings', headers=headers).headers['ETag']
+        resp = client.get('/api/admin/bookings?status=pending', headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 200
+        resp = client.get('/api/admin/bookings', headers={**headers, 'If-None-Match': etag})
+        assert resp.status_code == 304
+
+    def test_agents_ignore_heartbeat_only_changes(self, client, admin_token):
+        agent = Agent(name='a1', ip='10.0.0.1', status='online', total_cpu=4, total_mem=8,
+                      available_cpu=4, available_mem=8)
+        db.session.add(agent)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        etag = client.get('/api/admin/agents', headers=headers).headers['ETag']
+
+        agent.cpu_percent = 42.0
+        agent.last_seen = datetime.utcnow()
+        db.session.commit()
+        assert client.get('/api/admin/agents', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+        time.sleep(0.01)
+        agent.available_cpu -= 1
+        db.session.commit()
+        assert client.get('/api/admin/agents', headers={**headers, 'If-None-Match': etag}).status_code == 200
+
+    def test_if_modified_since_is_not_trusted(self, client, student_token):
+        booking = make_booking()
+        headers = {'Authorization': f'Bearer {student_token}'}
+        resp = client.get('/api/student/bookings', headers=headers)
+        last_modified, etag = resp.headers['Last-Modified'], resp.headers['ETag']
+
+        # A change in the same second as the copy the client holds
+        booking.cpu = 2
+        db.session.commit()
+        resp = client.get('/api/student/bookings', headers={**headers, 'If-Modified-Since': last_modified})
+        assert resp.status_code == 200
+        resp = client.get('/api/student/bookings', headers={**headers, 'If-None-Match': etag,
+                                                            'If-Modified-Since': last_modified})
+        assert resp.status_code == 200
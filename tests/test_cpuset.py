@@ -0,0 +1,52 @@
+from agent.cpuset import CoreAllocator, format_cpulist, parse_cpulist
+
+
+class FakeContainer:
+    def __init__(self, name, cpuset):
+        self.name = name
+        self.attrs = {'HostConfig': {'CpusetCpus': cpuset}}
+
+
+class TestCoreAllocator:
+    """Test cpulist parsing and NUMA-aware core allocation."""
+
+    def test_cpulist_round_trip(self):
+        assert parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+        assert parse_cpulist('') == [] and parse_cpulist(None) == []
+        assert format_cpulist([11, 0, 1, 2, 3, 8, 10]) == '0-3,8,10-11'
+        assert format_cpulist([]) == ''
+
+    def test_allocate_prefers_fullest_node_that_fits(self):
+        cores = CoreAllocator({0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}, reserved=[0])
+        assert cores.total == 7
+        assert cores.allocate('a', 2) == ('1-2', '0')  # node 0 has 3 free, node 1 has 4
+        assert cores.allocate('b', 3) == ('4-6', '1')
+        assert cores.free_per_node() == {0: 1, 1: 1}
+        # No node fits: split across nodes, memory left unpinned
+        assert cores.allocate('c', 2) == ('3,7', None)
+        assert cores.allocate('d', 1) is None
+
+        assert cores.release('b') == [4, 5, 6]
+        assert cores.free_per_node() == {0: 0, 1: 3}
+
+    def test_preempted_cores_only_go_to_guaranteed_sessions(self):
+        cores = CoreAllocator({0: [0, 1, 2, 3]})
+        cores.allocate('backfill', 4)
+        cores.preempt('backfill')
+        assert cores.allocate('requeued', 2) is None
+        assert cores.allocate('guaranteed', 2, reclaim=True) == ('0-1', None)
+        # The guaranteed session keeps its cores once the preempted container is removed
+        cores.release('backfill')
+        assert cores.allocate('other', 4) is None
+        assert cores.allocate('other', 2) == ('2-3', None)
+
+    def test_rebuild_and_retain(self):
+        cores = CoreAllocator({0: [0, 1, 2, 3]})
+        cores.rebuild([FakeContainer('a', '0-1'), FakeContainer('b', ''), FakeContainer('c', '3,9')])
+        assert cores.owner == {'a': [0, 1], 'c': [3]}
+        cores.allocate('new', 1)
+        cores.retain(['a'])  # c is gone; new is still being created
+        assert cores.owner == {'a': [0, 1], 'new': [2]}
+        cores.confirm('new')
+        cores.retain(['a'])
+        assert cores.owner == {'a': [0, 1]}
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.pool import StaticPool
+from controller.app import db
+from controller.models import Booking, User
+from controller.utils.database import engine_options, REPLICA
+
+
+def make_replica(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    db.metadata.create_all(engine)
+    monkeypatch.setitem(db.engines, REPLICA, engine)
+    return engine
+
+
+class TestDatabaseRouting:
+    """Test engine options and read-replica routing."""
+
+    def test_engine_options(self, app):
+        config = {**app.config, 'DB_POOL_SIZE': 20, 'DB_STATEMENT_TIMEOUT_MS': 5000}
+        options = engine_options('postgresql://u:p@host/db', config)
+        assert options['pool_size'] == 20 and options['pool_pre_ping'] is True
+        assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+        assert 'pool_size' not in engine_options('sqlite://', config)
+
+    def test_reports_read_replica_writes_use_primary(self, client, admin_token, monkeypatch):
+        replica = make_replica(monkeypatch)
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        user = User.query.filter_by(email='admin@test.com').first()
+        start = datetime.utcnow() + timedelta(hours=1)
+        booking = Booking(user_id=user.id, cpu=1, memory='2g', image='img', status='pending',
+                          start_time=start, end_time=start + timedelta(hours=1))
+        db.session.add(booking)
+        db.session.commit()
+
+        # The primary's booking isn't on the (empty) replica
+        assert client.get('/api/admin/stats', headers=headers).json['total_bookings'] == 0
+        with replica.begin() as conn:
+            conn.execute(insert(Booking), [{'user_id': user.id, 'cpu': 1, 'memory': '2g', 'image': 'img',
+                                            'status': 'completed', 'start_time': start,
+                                            'end_time': start + timedelta(hours=1)}])
+        stats = client.get('/api/admin/stats', headers=headers).json
+        assert (stats['total_bookings'], stats['completed']) == (1, 1)
+
+        resp = client.post(f'/api/admin/reject/{booking.id}', json={'reason': 'full'}, headers=headers)
+        assert resp.status_code == 200
+        db.session.expire_all()
+        assert db.session.get(Booking, booking.id).status == 'rejected'
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Booking, User
+from controller.utils.events import EventBus
+
+
+def read_events(chunks, count):
+    """Parse `count` booking events from a streaming response body."""
+    events, buffer = [], ''
+    while len(events) < count:
+        chunk = next(chunks)
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            if block.startswith('event: booking'):
+                events.append(json.loads(block.split('data: ', 1)[1]))
+    return events
+
+
+def make_booking(status='pending'):
+    user = User.query.filter_by(email='student@test.com').first()
+    start = datetime.utcnow() + timedelta(hours=1)
+    booking = Booking(user_id=user.id, cpu=1, memory='2g', image='img', status=status,
+                      start_time=start, end_time=start + timedelta(hours=1))
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+class TestBookingEvents:
+    """Test the booking event bus and SSE stream."""
+
+    def test_commit_publishes_status_changes(self, app, student_token):
+        bus = app.extensions['events']
+        user_id = User.query.filter_by(email='student@test.com').first().id
+        q = bus.subscribe(user_id)
+        booking = make_booking()
+        assert q.get_nowait()['status'] == 'pending'
+
+        booking.notes = 'unrelated'
+        db.session.commit()
+        assert q.empty()
+
+        booking.status = 'approved'
+        db.session.rollback()
+        assert q.empty()
+
+        booking.status = 'active'
+        booking.access_url = 'http://agent:8001'
+        db.session.commit()
+        event = q.get_nowait()
+        assert (event['id'], event['status'], event['url']) == (booking.id, 'active', 'http://agent:8001')
+        bus.unsubscribe(user_id, q)
+        assert bus.connections() == 0
+
+    def test_stream_sends_snapshot_then_changes(self, app, client, student_token):
+        booking = make_booking()
+        resp = client.get(f'/api/student/bookings/stream?jwt={student_token}', buffered=False)
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/event-stream'
+        chunks = iter(resp.response)
+        assert read_events(chunks, 1)[0]['status'] == 'pending'
+
+        booking = db.session.get(Booking, booking.id)
+        booking.status = 'approved'
+        db.session.commit()
+        event = read_events(chunks, 1)[0]
+        assert (event['id'], event['status']) == (booking.id, 'approved')
+        resp.close()
+        assert app.extensions['events'].connections() == 0
+
+    def test_stream_requires_token(self, client):
+        assert client.get('/api/student/bookings/stream').status_code == 401
+
+
+def test_full_queue_drops_events():
+    bus = EventBus(queue_size=1)
+    q = bus.subscribe(7)
+    bus.publish(7, {'id': 1})
+    bus.publish(7, {'id': 2})
+    assert q.get_nowait() == {'id': 1}
+    assert q.empty()
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking
+from controller.utils import scheduler
+from controller.utils.heartbeat import flush_heartbeats, record_heartbeat
+from conftest import StubResponse, make_agent, make_booking
+
+
+def make_session(idle_since=None, idle_warned_at=None):
+    agent = make_agent('A', ip='10.0.0.7')
+    booking = make_booking(agent, datetime.utcnow() - timedelta(hours=1), 'active', cpu=2, hours=3,
+                           image='jupyter/notebook', container_name='compute_1_22222',
+                           idle_since=idle_since, idle_warned_at=idle_warned_at)
+    agent.available_cpu, agent.available_mem = 6, 12
+    db.session.commit()
+    return booking, agent
+
+
+class TestIdleReclamation:
+    """Test idle reporting, warning and early stop."""
+
+    def test_idle_report_sets_and_clears_idle_since(self, app):
+        booking, agent = make_session()
+        record_heartbeat(agent.id, {'idle': {'compute_1_22222': 600}})
+        flush_heartbeats(db, Agent, Booking)
+        db.session.refresh(booking)
+        assert booking.idle_since is not None
+
+        record_heartbeat(agent.id, {'idle': {}})
+        flush_heartbeats(db, Agent, Booking)
+        db.session.refresh(booking)
+        assert booking.idle_since is None
+
+    def test_activity_clears_warning_and_publishes(self, app):
+        now = datetime.utcnow()
+        booking, agent = make_session(idle_since=now - timedelta(minutes=40), idle_warned_at=now)
+        bus = app.extensions['events']
+        q = bus.subscribe(booking.user_id)
+
+        record_heartbeat(agent.id, {'idle': {}})
+        flush_heartbeats(db, Agent, Booking)
+        db.session.refresh(booking)
+        assert booking.idle_since is None and booking.idle_warned_at is None
+        event = q.get_nowait()
+        assert (event['id'], event['idle_warning']) == (booking.id, False)
+        bus.unsubscribe(booking.user_id, q)
+
+    def test_idle_session_warned_then_stopped(self, app, monkeypatch):
+        calls = []
+        monkeypatch.setattr(scheduler.requests, 'post', lambda url, **kw: calls.append(url) or StubResponse())
+        now = datetime.utcnow()
+        booking, agent = make_session(idle_since=now - timedelta(minutes=40))
+
+        scheduler.reclaim_idle_sessions(db, Booking, app.config, now)
+        assert booking.idle_warned_at == now
+        assert booking.status == 'active'
+
+        later = now + timedelta(minutes=app.config['IDLE_GRACE_MINUTES'])
+        scheduler.reclaim_idle_sessions(db, Booking, app.config, later)
+        assert booking.status == 'completed'
+        assert booking.end_reason == 'idle'
+        assert agent.available_cpu == 8
+        assert agent.available_mem == 16
+        assert calls[0].endswith('/stop_container/compute_1_22222')
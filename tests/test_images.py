@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, User
+from benchmarks.fake_agent import FakeAgentServer
+
+
+class TestImagePrefetch:
+    """Test the registry mirror handoff and image prefetching."""
+
+    def test_registration_returns_mirror(self, app, client):
+        app.config['REGISTRY_MIRROR'] = 'mirror.lab:5001'
+        resp = client.post('/api/agents/register', json={
+            'name': 'lab-pc', 'ip': '10.0.0.5', 'total_cpu': 4, 'total_mem': 8
+        }, headers={'X-Agent-Token': 'agent-secret'})
+        assert resp.json['registry_mirror'] == 'mirror.lab:5001'
+
+    def test_prefetch_upcoming_images(self, client, admin_token):
+        user = User.query.filter_by(email='admin@test.com').first()
+        start = datetime.utcnow() + timedelta(hours=2)
+        db.session.add_all([
+            Booking(user_id=user.id, cpu=1, memory='2g', image='jupyter/scipy-notebook', status='approved',
+                    start_time=start, end_time=start + timedelta(hours=1)),
+            Booking(user_id=user.id, cpu=1, memory='2g', image='jupyter/scipy-notebook', status='pending',
+                    start_time=start, end_time=start + timedelta(hours=1)),
+            Booking(user_id=user.id, cpu=1, memory='2g', image='later', status='approved',
+                    start_time=start + timedelta(days=3), end_time=start + timedelta(days=3, hours=1)),
+        ])
+        with FakeAgentServer() as server:
+            agent = Agent(name='fake', ip=server.host, port=server.port, status='online')
+            db.session.add(agent)
+            db.session.commit()
+            resp = client.post('/api/admin/images/prefetch', json={},
+                               headers={'Authorization': f'Bearer {admin_token}'})
+            assert resp.status_code == 200
+            assert resp.json['started'] == [{'agent_id': agent.id, 'image': 'jupyter/scipy-notebook'}]
+            assert server.server.app.pulls == ['jupyter/scipy-notebook']
@@ -0,0 +1,21 @@
+class TestMetrics:
+    """Test the Prometheus metrics endpoint."""
+
+    def test_metrics_exposition(self, client, admin_token):
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        client.get('/api/admin/stats', headers=headers)
+
+        resp = client.get('/metrics')
+        assert resp.status_code == 200
+        body = resp.get_data(as_text=True)
+        assert 'controller_http_requests_total{endpoint="admin.get_stats",method="GET",status="200"}' in body
+        assert 'controller_db_queries_per_request_count{endpoint="admin.get_stats"}' in body
+        assert 'controller_db_queries_total' in body
+
+    def test_multiprocess_mode_reads_the_worker_files(self, client, tmp_path, monkeypatch):
+        client.get('/api/auth/login')
+        monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+        resp = client.get('/metrics')
+        assert resp.status_code == 200
+        # No worker has written to the directory yet, so nothing from this process shows
+        assert 'controller_http_requests_total' not in resp.get_data(as_text=True)
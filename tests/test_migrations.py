@@ -0,0 +1,56 @@
+import os
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from alembic.script import ScriptDirectory
+from flask_migrate import upgrade, downgrade
+from controller.app import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+BASELINE = 'b772ac06260e'
+
+
+@pytest.fixture
+def engine(app, tmp_path, monkeypatch):
+    """A separate database the migrations run against."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    monkeypatch.setitem(db.engines, None, engine)
+    yield engine
+    engine.dispose()
+
+
+def assert_matches_models(engine):
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        assert inspector.has_table(table.name), table.name
+        columns = {c['name'] for c in inspector.get_columns(table.name)}
+        assert {c.name for c in table.columns} <= columns, table.name
+        indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        assert {i.name for i in table.indexes} <= indexes, table.name
+
+
+class TestMigrations:
+    """Test the Alembic revision chain."""
+
+    def test_upgrade_from_baseline(self, engine):
+        upgrade(directory=MIGRATIONS, revision=BASELINE)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO agent (name, ip, total_cpu, available_cpu) VALUES ('pc', '10.0.0.1', 4, 4)"))
+
+        upgrade(directory=MIGRATIONS)
+        assert_matches_models(engine)
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT backfill_cpu, backfill_mem, numa_nodes FROM agent")).one()
+        assert tuple(row) == (0, 0, 1)
+
+        downgrade(directory=MIGRATIONS, revision=BASELINE)
+        assert 'heartbeat_at' not in {c['name'] for c in inspect(engine).get_columns('agent')}
+        assert not inspect(engine).has_table('usage_sample')
+
+    def test_upgrade_after_create_all(self, engine):
+        # Tables db.create_all() already made are left alone and the database is stamped
+        db.metadata.create_all(engine)
+        upgrade(directory=MIGRATIONS)
+        assert_matches_models(engine)
+        with engine.connect() as conn:
+            version = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+        assert version == ScriptDirectory(MIGRATIONS).get_current_head()
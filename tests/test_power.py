@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from functools import partial
+from controller.app import db
+from controller.models import Agent, Booking
+from controller.utils import scheduler
+from controller.utils.heartbeat import flush_heartbeats, record_heartbeat
+from conftest import StubResponse, make_agent, make_booking
+
+
+# Power tests run on agents that can suspend unless they say otherwise
+suspendable_agent = partial(make_agent, can_suspend=True, mac='00:11:22:33:44:55')
+
+
+class TestPowerManagement:
+    """Test suspension, predictive wake and boot time measurement."""
+
+    def test_suspends_idle_agents_but_keeps_spare(self, app, monkeypatch):
+        now = datetime.utcnow()
+        big = suspendable_agent('big', cpu=32)
+        idle = suspendable_agent('idle')
+        booked = suspendable_agent('booked')
+        make_booking(booked, now + timedelta(minutes=30))
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request',
+                            lambda method, agent, call, path, **kw: calls.append(agent.id) or StubResponse(202))
+
+        suspended = scheduler.suspend_idle_agents(db, Booking, Agent, app.config, now)
+        assert [a.id for a in suspended] == [idle.id]
+        assert calls == [idle.id]
+        assert idle.status == 'sleeping' and big.status == 'online' and booked.status == 'online'
+
+    def test_declined_suspend_keeps_agent_online(self, app, monkeypatch):
+        suspendable_agent('big', cpu=32)
+        idle = suspendable_agent('idle')
+        monkeypatch.setattr(scheduler, 'agent_request', lambda *a, **kw: StubResponse(409))
+        assert scheduler.suspend_idle_agents(db, Booking, Agent, app.config, datetime.utcnow()) == []
+        assert idle.status == 'online'
+
+    def test_agents_that_cannot_suspend_are_left_alone(self, app, monkeypatch):
+        suspendable_agent('big', cpu=32)
+        container = suspendable_agent('container', can_suspend=False)
+        host = suspendable_agent('host')
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request',
+                            lambda method, agent, call, path, **kw: calls.append(agent.id) or StubResponse(501))
+
+        assert scheduler.suspend_idle_agents(db, Booking, Agent, app.config, datetime.utcnow()) == []
+        assert calls == [host.id]
+        assert host.status == 'online' and host.can_suspend is False
+        # Not asked again until it re-registers with support
+        assert scheduler.suspend_idle_agents(db, Booking, Agent, app.config, datetime.utcnow()) == []
+        assert calls == [host.id] and container.status == 'online'
+
+    def test_wake_uses_measured_boot_time(self, app, monkeypatch):
+        now = datetime.utcnow()
+        fast = suspendable_agent('fast', status='sleeping', boot_seconds=30)
+        slow = suspendable_agent('slow', status='sleeping', boot_seconds=400)
+        make_booking(fast, now + timedelta(minutes=8))
+        make_booking(slow, now + timedelta(minutes=8))
+        woken = []
+        monkeypatch.setattr(scheduler, 'wake_agents', lambda agents, config: woken.extend(agents))
+
+        scheduler.wake_for_bookings(db, Booking, Agent, app.config, now)
+        assert woken == [slow]
+        assert slow.wake_sent_at == now and fast.wake_sent_at is None
+
+        # No resend before the retry interval
+        scheduler.wake_for_bookings(db, Booking, Agent, app.config, now + timedelta(minutes=1))
+        assert woken == [slow]
+
+    def test_heartbeat_after_wake_records_boot_time(self, app):
+        agent = suspendable_agent('sleepy', status='sleeping', boot_seconds=100.0,
+                                  wake_sent_at=datetime.utcnow() - timedelta(seconds=200))
+        record_heartbeat(agent.id, {'cpu': 1.0, 'mem': 2.0, 'containers': []})
+        flush_heartbeats(db, Agent, Booking)
+        db.session.refresh(agent)
+        assert agent.status == 'online'
+        assert agent.wake_sent_at is None
+        assert 125 < agent.boot_seconds < 135
+
+    def test_late_heartbeat_while_suspending_is_ignored(self, app):
+        agent = suspendable_agent('sleepy', status='sleeping', suspended_at=datetime.utcnow())
+        record_heartbeat(agent.id, {'cpu': 1.0, 'mem': 2.0, 'containers': []})
+        flush_heartbeats(db, Agent, Booking)
+        db.session.refresh(agent)
+        assert agent.status == 'sleeping'
+
+    def test_approval_prefers_awake_agents(self, app, client, admin_token):
+        suspendable_agent('sleepy', status='sleeping', cpu=32)
+        awake = suspendable_agent('awake', cpu=4)
+        booking = make_booking(awake, datetime.utcnow() + timedelta(days=1), status='pending')
+        resp = client.post(f'/api/admin/approve/{booking.id}', json={},
+                           headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.status_code == 200
+        assert resp.json['agent_id'] == awake.id
@@ -0,0 +1,55 @@
+import pytest
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Booking, User
+from controller.utils.profiler import fingerprint, profile_queries, QueryBudgetExceeded
+
+
+def make_bookings(count):
+    for i in range(count):
+        user = User(name=f'Student {i}', email=f's{i}@test.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Booking(
+            user_id=user.id, cpu=1, memory='2g', image='jupyter/notebook',
+            start_time=datetime.utcnow() + timedelta(hours=1),
+            end_time=datetime.utcnow() + timedelta(hours=2),
+            status='pending'
+        ))
+    db.session.commit()
+
+
+class TestQueryProfiler:
+    """Test SQL profiling and query budgets."""
+
+    def test_fingerprint_normalizes_values(self):
+        assert fingerprint("SELECT * FROM agent WHERE id = 5") == fingerprint("SELECT * FROM agent WHERE id = 12")
+        assert fingerprint("SELECT 1 WHERE id IN (?, ?, ?)") == "SELECT ? WHERE id IN (?...)"
+
+    def test_list_bookings_has_no_n_plus_one(self, client, admin_token):
+        make_bookings(10)
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        client.get('/api/admin/stats', headers=headers)  # warm the user status cache
+        with profile_queries() as profile:
+            resp = client.get('/api/admin/bookings', headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.json) == 10
+        assert profile.count <= 2
+
+    def test_stats_query_budget(self, client, admin_token):
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        client.get('/api/admin/stats', headers=headers)  # warm the user status cache
+        with profile_queries() as profile:
+            client.get('/api/admin/stats', headers=headers)
+        assert profile.count <= 2
+
+    def test_profiling_headers(self, client, app, admin_token):
+        app.config['SQL_PROFILING'] = True
+        resp = client.get('/api/admin/stats', headers={'Authorization': f'Bearer {admin_token}'})
+        assert int(resp.headers['X-DB-Queries']) >= 1
+        assert 'X-DB-Time-ms' in resp.headers
+
+    def test_strict_budget_fails_request(self, client, app, admin_token):
+        app.config.update(SQL_PROFILING=True, SQL_QUERY_BUDGET=1, SQL_BUDGET_STRICT=True)
+        with pytest.raises(QueryBudgetExceeded):
+            client.get('/api/admin/stats', headers={'Authorization': f'Bearer {admin_token}'})
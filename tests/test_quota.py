@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, User, UsageLedger
+from controller.utils import scheduler
+from controller.utils.quota import fair_share_order, period_start, usage
+
+
+def book(client, token, cpu=4, hours=2, days=1, memory='4g'):
+    return client.post('/api/student/book', json={
+        'cpu': cpu, 'memory': memory, 'image': 'img', 'duration_hr': hours,
+        'start_time': (datetime.utcnow() + timedelta(days=days)).isoformat()
+    }, headers={'Authorization': f'Bearer {token}'})
+
+
+def student():
+    return User.query.filter_by(email='student@test.com').first()
+
+
+class TestQuota:
+    """Test the usage ledger, weekly limits and fair-share auto-approval."""
+
+    def test_period_start_is_monday(self):
+        assert period_start(datetime(2024, 5, 16, 13, 30)) == datetime(2024, 5, 13)
+        assert period_start(datetime(2024, 5, 13)) == datetime(2024, 5, 13)
+
+    def test_booking_and_cancel_update_ledger(self, client, student_token):
+        resp = book(client, student_token, cpu=4, hours=2)
+        assert resp.status_code == 201
+        booking = db.session.get(Booking, resp.json['id'])
+        week = period_start(booking.start_time)
+        assert usage(db, student().id, 'General', week) == {'user': (8.0, 8.0), 'department': (8.0, 8.0)}
+
+        client.post(f"/api/student/bookings/{booking.id}/cancel",
+                    headers={'Authorization': f'Bearer {student_token}'})
+        assert usage(db, student().id, 'General', week)['user'] == (0.0, 0.0)
+
+    def test_megabytes_are_charged_as_fractions_of_a_gb(self, client, student_token):
+        resp = book(client, student_token, cpu=1, hours=2, memory='512m')
+        assert resp.status_code == 201
+        week = period_start(db.session.get(Booking, resp.json['id']).start_time)
+        assert usage(db, student().id, 'General', week)['user'] == (2.0, 1.0)
+
+    def test_cancel_after_preemption_keeps_the_hours_that_ran(self, client, student_token):
+        resp = client.post('/api/student/book', json={
+            'cpu': 2, 'memory': '4g', 'image': 'img', 'duration_hr': 4, 'priority_class': 'backfill',
+            'start_time': datetime.utcnow().isoformat()
+        }, headers={'Authorization': f'Bearer {student_token}'})
+        booking = db.session.get(Booking, resp.json['id'])
+        week = period_start(booking.start_time)
+        assert usage(db, student().id, 'General', week)['user'][0] == 8.0
+        # Ran for an hour, then was preempted and requeued
+        booking.preempted_at = booking.start_time + timedelta(hours=1)
+        db.session.commit()
+
+        client.post(f"/api/student/bookings/{booking.id}/cancel",
+                    headers={'Authorization': f'Bearer {student_token}'})
+        assert usage(db, student().id, 'General', week)['user'][0] == 2.0
+
+    def test_fair_share_counts_users_without_department_as_general(self, app):
+        now = datetime.utcnow()
+        plain = User(name='Plain', email='plain@test.com', password_hash='x')
+        physics = User(name='Phys', email='phys@test.com', password_hash='x', department='Physics')
+        db.session.add_all([plain, physics])
+        db.session.flush()
+        db.session.add(UsageLedger(scope='department', key='General', period_start=period_start(now),
+                                   cpu_hours=50.0, mem_gb_hours=50.0))
+        bookings = [Booking(user_id=u.id, cpu=1, memory='2g', image='img', status='pending',
+                            start_time=now, end_time=now + timedelta(hours=1)) for u in (plain, physics)]
+        db.session.add_all(bookings)
+        db.session.commit()
+
+        ordered = fair_share_order(db, bookings, {plain.id: None, physics.id: 'Physics'}, period_start(now))
+        assert [b.user_id for b in ordered] == [physics.id, plain.id]
+
+    def test_weekly_limit_enforced(self, app, client, student_token):
+        app.config['QUOTA_USER_CPU_HOURS'] = 10
+        assert book(client, student_token, cpu=4, hours=2, days=1).status_code == 201
+        resp = book(client, student_token, cpu=2, hours=2, days=1)
+        assert resp.status_code == 403
+        assert 'quota' in resp.json['error']
+        assert book(client, student_token, cpu=1, hours=2, days=1).status_code == 201
+
+    def test_early_stop_refunds_unused_time(self, app, monkeypatch):
+        user = User(name='S', email='refund@test.com', password_hash='x', department='Physics')
+        agent = Agent(name='A', ip='10.0.0.3', status='online', total_cpu=8, available_cpu=6,
+                      total_mem=16, available_mem=12, backfill_cpu=0, backfill_mem=0)
+        db.session.add_all([user, agent])
+        db.session.flush()
+        now = datetime.utcnow()
+        b = Booking(user_id=user.id, agent_id=agent.id, cpu=2, memory='4g', image='img', status='active',
+                    start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=3),
+                    container_name='compute_x')
+        db.session.add(b)
+        db.session.add(UsageLedger(scope='department', key='Physics', period_start=period_start(b.start_time),
+                                   cpu_hours=8.0, mem_gb_hours=16.0))
+        db.session.commit()
+
+        class Ok:
+            status_code = 200
+        monkeypatch.setattr(scheduler, 'agent_request', lambda *a, **kw: Ok())
+        scheduler.stop_session(db, b, agent, 'idle')
+        cpu_hours, _ = usage(db, user.id, 'Physics', period_start(b.start_time))['department']
+        assert 1.9 < cpu_hours < 2.1
+
+    def test_auto_approve_prefers_light_users(self, app):
+        heavy = User(name='Heavy', email='heavy@test.com', password_hash='x')
+        light = User(name='Light', email='light@test.com', password_hash='x')
+        agent = Agent(name='A', ip='10.0.0.4', status='online', total_cpu=4, available_cpu=4,
+                      total_mem=16, available_mem=16, backfill_cpu=0, backfill_mem=0)
+        db.session.add_all([heavy, light, agent])
+        db.session.flush()
+        now = datetime.utcnow()
+        db.session.add(UsageLedger(scope='user', key=str(heavy.id), period_start=period_start(now),
+                                   cpu_hours=50.0, mem_gb_hours=50.0))
+        bookings = [Booking(user_id=u.id, cpu=4, memory='4g', image='img', status='pending',
+                            start_time=now + timedelta(minutes=5), end_time=now + timedelta(hours=1))
+                    for u in (heavy, light)]
+        db.session.add_all(bookings)
+        db.session.commit()
+
+        approved = scheduler.auto_approve(db, Booking, Agent, app.config, now)
+        assert [b.user_id for b in approved] == [light.id]
+        assert bookings[0].status == 'pending'
+
+    def test_admin_quota_report(self, client, admin_token, student_token):
+        book(client, student_token, cpu=2, hours=1, days=0.5)
+        resp = client.get('/api/admin/quota?scope=user&week=' + (datetime.utcnow() + timedelta(days=0.5)).isoformat(),
+                          headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.status_code == 200
+        assert resp.json['usage'] == [{'key': str(student().id), 'cpu_hours': 2.0, 'mem_gb_hours': 4.0}]
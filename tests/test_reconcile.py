@@ -0,0 +1,88 @@
+import pytest
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking
+from controller.utils import scheduler
+from conftest import StubResponse, make_agent, make_booking
+
+
+def fake_agents(containers, calls):
+    """Agents listing `containers[agent_id]`; a missing id means the agent doesn't answer."""
+    def request(method, agent, call, path, **kwargs):
+        calls.append((call, agent.id, path))
+        if agent.id not in containers:
+            raise ConnectionError("unreachable")
+        if call == 'containers':
+            return StubResponse(200, [{'name': n} for n in containers[agent.id]])
+        name = path.rsplit('/', 1)[1]
+        if name not in containers[agent.id]:
+            return StubResponse(404)
+        containers[agent.id].remove(name)
+        return StubResponse(200)
+    return request
+
+
+def setup_cluster():
+    agents = [make_agent(f'a{i}', ip=f'10.0.0.{i}') for i in (1, 2)]
+    start = datetime.utcnow() - timedelta(minutes=30)
+    bookings = [make_booking(agents[0], start, 'active', cpu=2) for _ in (1, 2)]
+    for i, booking in enumerate(bookings, 1):
+        booking.container_name = f'compute_{booking.user_id}_{i}'
+    # Capacity leaked by an earlier failed stop: only one session's worth is really in use
+    agents[0].available_cpu, agents[0].available_mem = 2, 4
+    db.session.commit()
+    return agents, bookings
+
+
+class TestReconciler:
+    """Test the agent/booking reconciliation pass."""
+
+    def test_orphans_vanished_sessions_and_capacity(self, app, monkeypatch):
+        monkeypatch.setattr(scheduler, '_suspects', set())
+        agents, bookings = setup_cluster()
+        a1, a2 = agents[0].id, agents[1].id
+        containers = {a1: {bookings[0].container_name, 'compute_9_orphan'}}  # a2 is unreachable
+        calls = []
+        monkeypatch.setattr(scheduler, 'agent_request', fake_agents(containers, calls))
+
+        # First pass only notes discrepancies, but fixes capacity from the bookings
+        orphans, vanished, fixed = scheduler.reconcile_agents(db, Booking, Agent, app.config)
+        assert (orphans, vanished) == ([], [])
+        assert [a.id for a in fixed] == [a1]
+        agent = db.session.get(Agent, a1)
+        assert (agent.available_cpu, agent.available_mem) == (4, 8)
+
+        orphans, vanished, fixed = scheduler.reconcile_agents(db, Booking, Agent, app.config)
+        assert orphans == [(a1, 'compute_9_orphan')]
+        assert [b.id for b in vanished] == [bookings[1].id]
+        assert (agent.available_cpu, agent.available_mem) == (6, 12)
+        booking = db.session.get(Booking, bookings[1].id)
+        assert (booking.status, booking.end_reason) == ('completed', 'vanished')
+        assert db.session.get(Booking, bookings[0].id).status == 'active'
+        assert containers[a1] == {bookings[0].container_name}
+        assert db.session.get(Agent, a2).available_cpu == 8
+        assert {c[1] for c in calls if c[0] == 'containers'} == {a1, a2}
+
+    def test_transient_discrepancy_is_ignored(self, app, monkeypatch):
+        monkeypatch.setattr(scheduler, '_suspects', set())
+        agents, bookings = setup_cluster()
+        a1 = agents[0].id
+        containers = {a1: {bookings[0].container_name, bookings[1].container_name, 'compute_9_new'}}
+        monkeypatch.setattr(scheduler, 'agent_request', fake_agents(containers, []))
+        scheduler.reconcile_agents(db, Booking, Agent, app.config)
+
+        containers[a1].discard('compute_9_new')  # e.g. a preempted container finished its grace period
+        orphans, vanished, _ = scheduler.reconcile_agents(db, Booking, Agent, app.config)
+        assert (orphans, vanished) == ([], [])
+
+    def test_failed_stop_keeps_session_active(self, app, monkeypatch):
+        agents, bookings = setup_cluster()
+        monkeypatch.setattr(scheduler, 'agent_request', lambda *a, **k: StubResponse(500))
+        b = db.session.get(Booking, bookings[0].id)
+        with pytest.raises(RuntimeError):
+            scheduler.stop_session(db, b, b.agent, 'expired')
+        assert b.status == 'active'
+
+        monkeypatch.setattr(scheduler, 'agent_request', lambda *a, **k: StubResponse(404))
+        scheduler.stop_session(db, b, b.agent, 'expired')
+        assert b.status == 'completed'
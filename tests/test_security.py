@@ -0,0 +1,173 @@
+import threading
+import pytest
+from controller.app import db
+from controller.models import User
+from controller.utils.security import HashExecutor, HashingBusy, RateLimiter, trust_proxies
+
+
+def register(client, email='hash@test.com'):
+    return client.post('/api/auth/register', json={
+        'name': 'Hash User', 'email': email, 'password': 'test123456', 'role': 'student'
+    })
+
+
+def login(client, email='hash@test.com', password='test123456'):
+    return client.post('/api/auth/login', json={'email': email, 'password': password})
+
+
+def hold(pool, release):
+    """Take a slot of `pool` with a task that runs until `release` is set.
+
+    Returns (started, freed) events: the task is running on a worker, and its slot is back.
+    """
+    started, freed = threading.Event(), threading.Event()
+    assert pool.slots.acquire(blocking=False)
+    future = pool.pool.submit(lambda: started.set() or release.wait())
+    future.add_done_callback(lambda _: (pool.slots.release(), freed.set()))
+    return started, freed
+
+
+class TestLoginProtection:
+    """Test hash parameters, rehash-on-login and login throttling."""
+
+    def test_rehash_on_login_when_method_changes(self, app, client):
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        register(client)
+        assert User.query.filter_by(email='hash@test.com').first().password_hash.startswith('pbkdf2:sha256:1000$')
+
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        assert login(client).status_code == 200
+        db.session.expire_all()
+        assert User.query.filter_by(email='hash@test.com').first().password_hash.startswith('pbkdf2:sha256:2000$')
+        assert login(client).status_code == 200
+
+    def test_account_rate_limit(self, app, client):
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        app.extensions['login_limits']['account'].limit = 2
+        register(client)
+        assert login(client, password='wrong').status_code == 401
+        assert login(client, password='wrong').status_code == 401
+        resp = login(client)
+        assert resp.status_code == 429
+        assert int(resp.headers['Retry-After']) >= 1
+        # Other accounts are unaffected
+        assert login(client, email='other@test.com').status_code == 401
+
+    def test_saturated_pool_sheds_with_503(self, app, client):
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        register(client)
+        release = threading.Event()
+        pool = HashExecutor(workers=1, queue=0, timeout=5)
+        app.extensions['pwhash'] = pool
+        started, freed = hold(pool, release)
+        try:
+            assert started.wait(5)
+            resp = login(client)
+            assert resp.status_code == 503
+            assert resp.headers['Retry-After'] == '1'
+        finally:
+            release.set()
+        assert freed.wait(5)
+        assert login(client).status_code == 200
+
+    def test_hash_timeout_sheds_with_503(self, app, client):
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        register(client)
+        release = threading.Event()
+        pool = HashExecutor(workers=1, queue=1, timeout=0.1)
+        app.extensions['pwhash'] = pool
+        started, freed = hold(pool, release)
+        try:
+            assert started.wait(5)
+            # Queued behind the blocker until the timeout
+            resp = login(client)
+            assert resp.status_code == 503
+            assert resp.headers['Retry-After'] == '1'
+        finally:
+            release.set()
+        assert freed.wait(5)
+
+    def test_disabled_account_is_not_rehashed(self, app, client):
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+        register(client)
+        user = User.query.filter_by(email='hash@test.com').first()
+        user.active = False
+        db.session.commit()
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        assert login(client).status_code == 403
+        db.session.expire_all()
+        assert User.query.filter_by(email='hash@test.com').first().password_hash.startswith('pbkdf2:sha256:1000$')
+
+    def test_ip_limit_uses_forwarded_for_behind_proxy(self, app, client):
+        app.config['TRUSTED_PROXY_HOPS'] = 1
+        trust_proxies(app)
+        app.extensions['login_limits']['ip'].limit = 1
+
+        def from_ip(ip, email):
+            return client.post('/api/auth/login', json={'email': email, 'password': 'test123456'},
+                               headers={'X-Forwarded-For': ip})
+        assert from_ip('203.0.113.1', 'a@test.com').status_code == 401
+        assert from_ip('203.0.113.2', 'b@test.com').status_code == 401
+        assert from_ip('203.0.113.1', 'c@test.com').status_code == 429
+
+
+def test_hash_executor_bounds_and_releases():
+    pool = HashExecutor(workers=1, queue=1, timeout=5)
+    release = threading.Event()
+    running, queued = hold(pool, release), hold(pool, release)  # one on the worker, one waiting
+    assert running[0].wait(5)
+    with pytest.raises(HashingBusy):
+        pool.run(lambda: None)
+    release.set()
+    assert running[1].wait(5) and queued[1].wait(5)
+    assert pool.run(lambda: 42) == 42
+
+
+def test_rate_limiter_refills(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('controller.utils.security.time.monotonic', lambda: clock[0])
+    limiter = RateLimiter(limit=2, window=60)
+    assert limiter.hit('a') == 0
+    assert limiter.hit('a') == 0
+    assert limiter.hit('a') == 30
+    assert limiter.hit('b') == 0
+    clock[0] += 30
+    assert limiter.hit('a') == 0
+
+
+class TestTokenStatus:
+    """Test compact token claims and cached revocation."""
+
+    def test_token_carries_id_and_role(self, app, client, student_token):
+        from flask_jwt_extended import decode_token
+        claims = decode_token(student_token)
+        assert claims['sub'] == str(User.query.filter_by(email='student@test.com').first().id)
+        assert claims['role'] == 'student'
+        assert 'email' not in claims
+
+    def test_disabling_user_revokes_token(self, app, client, admin_token, student_token):
+        headers = {'Authorization': f'Bearer {student_token}'}
+        assert client.get('/api/student/bookings', headers=headers).status_code == 200
+
+        student = User.query.filter_by(email='student@test.com').first()
+        resp = client.post(f'/api/admin/users/{student.id}/status', json={'active': False},
+                           headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp.status_code == 200
+        assert client.get('/api/student/bookings', headers=headers).status_code == 401
+
+    def test_status_is_cached(self, app, client, student_token):
+        headers = {'Authorization': f'Bearer {student_token}'}
+        client.get('/api/student/bookings', headers=headers)
+        student = User.query.filter_by(email='student@test.com').first()
+        # A direct DB change is only seen once the cached entry expires
+        student.active = False
+        db.session.commit()
+        assert client.get('/api/student/bookings', headers=headers).status_code == 200
+        app.extensions['user_status'].ttl = 0
+        app.extensions['user_status'].invalidate(student.id)
+        assert client.get('/api/student/bookings', headers=headers).status_code == 401
+
+    def test_student_cannot_change_user_status(self, client, student_token):
+        resp = client.post('/api/admin/users/1/status', json={'active': False},
+                           headers={'Authorization': f'Bearer {student_token}'})
+        assert resp.status_code == 403
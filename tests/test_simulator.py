@@ -0,0 +1,76 @@
+import asyncio
+import random
+from benchmarks.simulator import SimConfig, VirtualAgent, http_request
+
+
+def run_against_agent(scenario, **options):
+    config = SimConfig(base_port=0, latency_ms=0, pull_seconds=0, **options)
+
+    async def main():
+        agent = await VirtualAgent(0, config, random.Random(1)).start()
+        try:
+            return await scenario(agent)
+        finally:
+            agent.server.close()
+
+    return asyncio.run(main())
+
+
+class TestFleetSimulator:
+    """Test the virtual agent HTTP API."""
+
+    def test_container_lifecycle(self):
+        async def scenario(agent):
+            status, started = await http_request('127.0.0.1', agent.port, 'POST', '/start_container',
+                                                 {'user_id': 3, 'image': 'jupyter/base-notebook', 'cpu': 2})
+            assert status == 200
+            _, listed = await http_request('127.0.0.1', agent.port, 'GET', '/containers')
+            assert [c['name'] for c in listed] == [started['container_name']]
+            _, health = await http_request('127.0.0.1', agent.port, 'GET', '/health')
+            assert health['cpu_percent'] == 12.5
+            status, _ = await http_request('127.0.0.1', agent.port, 'POST',
+                                           f"/stop_container/{started['container_name']}")
+            assert status == 200
+            assert agent.stats['pulls'] == 1
+
+        run_against_agent(scenario)
+
+    def test_failures_and_outages(self):
+        async def scenario(agent):
+            status, _ = await http_request('127.0.0.1', agent.port, 'POST', '/start_container', {'image': 'x'})
+            assert status == 500
+            agent.down = True
+            try:
+                await http_request('127.0.0.1', agent.port, 'GET', '/health', timeout=0.2)
+                assert False, "down agent answered"
+            except asyncio.TimeoutError:
+                pass
+
+        run_against_agent(scenario, failure_rate=1.0)
+
+    def test_preempt_suspend_and_pull(self):
+        async def scenario(agent):
+            status, _ = await http_request('127.0.0.1', agent.port, 'POST', '/preempt_container/missing')
+            assert status == 404
+            _, started = await http_request('127.0.0.1', agent.port, 'POST', '/start_container',
+                                            {'user_id': 3, 'image': 'img', 'cpu': 2})
+            name = started['container_name']
+            assert (await http_request('127.0.0.1', agent.port, 'POST', '/suspend'))[0] == 409
+
+            status, _ = await http_request('127.0.0.1', agent.port, 'POST', f'/preempt_container/{name}',
+                                           {'grace': 0.1})
+            assert status == 202
+            assert name in agent.containers  # still holds its resources during the grace period
+            await asyncio.sleep(0.2)
+            assert agent.containers == {}
+
+            status, _ = await http_request('127.0.0.1', agent.port, 'POST', '/pull', {'image': 'other'})
+            assert status == 202
+            await asyncio.sleep(0)
+            assert 'other' in agent.images
+            assert (await http_request('127.0.0.1', agent.port, 'POST', '/workspaces/3/prepare'))[0] == 200
+
+            assert (await http_request('127.0.0.1', agent.port, 'POST', '/suspend'))[0] == 202
+            assert agent.stats['suspends'] == 1
+
+        run_against_agent(scenario)
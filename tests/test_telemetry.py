@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+from controller.app import db
+from controller.models import Agent, Booking, User, UsageSample, RollupWatermark
+from controller.utils.telemetry import RAW, MINUTE, HOUR, rollup, run_rollups
+
+
+AGENT_HEADERS = {'X-Agent-Token': 'agent-secret'}
+
+
+def make_active_booking(app):
+    user = User(name='Student', email='usage@test.com', password_hash='x')
+    agent = Agent(name='A', ip='10.0.0.9', status='online')
+    db.session.add_all([user, agent])
+    db.session.flush()
+    booking = Booking(
+        user_id=user.id, agent_id=agent.id, cpu=4, memory='8g', image='jupyter/notebook',
+        start_time=datetime.utcnow(), end_time=datetime.utcnow() + timedelta(hours=1),
+        status='active', container_name='compute_1_11111'
+    )
+    db.session.add(booking)
+    db.session.commit()
+    return booking.id, agent.id
+
+
+class TestTelemetry:
+    """Test telemetry ingest, rollups and admin queries."""
+
+    def test_ingest_maps_container_to_booking(self, client, app):
+        booking_id, agent_id = make_active_booking(app)
+        resp = client.post('/api/agents/telemetry', json={'id': agent_id, 'samples': [
+            {'c': 'compute_1_11111', 't': 1000, 'cpu': 50.0, 'mem': 512.0},
+            {'c': 'unknown', 't': 1000, 'cpu': 10.0, 'mem': 10.0},
+        ]}, headers=AGENT_HEADERS)
+        assert resp.status_code == 200
+        assert resp.json['stored'] == 1
+        assert UsageSample.query.filter_by(booking_id=booking_id, resolution=RAW).count() == 1
+
+    def test_rollup_minute_and_hour(self, app):
+        for ts, cpu in [(0, 10.0), (30, 30.0), (60, 50.0), (3700, 70.0)]:
+            db.session.add(UsageSample(booking_id=1, agent_id=1, resolution=RAW, ts=ts,
+                                       cpu=cpu, cpu_max=cpu, mem=100.0, mem_max=100.0, samples=1))
+        db.session.commit()
+
+        assert rollup(db, UsageSample, RAW, MINUTE, 3600) == 2
+        first = UsageSample.query.filter_by(resolution=MINUTE, ts=0).one()
+        assert first.cpu == 20.0
+        assert first.cpu_max == 30.0
+        assert first.samples == 2
+
+        # Watermark prevents rolling the same minutes twice
+        assert rollup(db, UsageSample, RAW, MINUTE, 3600) == 0
+
+        assert rollup(db, UsageSample, MINUTE, HOUR, 3600) == 1
+        hour = UsageSample.query.filter_by(resolution=HOUR).one()
+        assert round(hour.cpu, 2) == 30.0
+        assert hour.samples == 3
+
+    def test_late_samples_are_merged_once(self, app):
+        def sample(ts, cpu):
+            db.session.add(UsageSample(booking_id=1, agent_id=1, resolution=RAW, ts=ts,
+                                       cpu=cpu, cpu_max=cpu, mem=100.0, mem_max=100.0, samples=1))
+            db.session.commit()
+
+        config = {**app.config, 'TELEMETRY_ROLLUP_LAG': 0, 'TELEMETRY_RAW_RETENTION_HOURS': 24 * 365}
+        sample(0, 10.0)
+        sample(3600, 30.0)
+        run_rollups(db, UsageSample, RollupWatermark, config, now=7200)
+        assert UsageSample.query.filter_by(resolution=HOUR, ts=0).one().cpu == 10.0
+
+        # Buffered by the agent: minute 0 and hour 0 were rolled up before it arrived
+        sample(30, 50.0)
+        for now in (7200, 7260):
+            run_rollups(db, UsageSample, RollupWatermark, config, now=now)
+        minute = UsageSample.query.filter_by(resolution=MINUTE, ts=0).one()
+        assert (minute.cpu, minute.cpu_max, minute.samples) == (30.0, 50.0, 2)
+        hour = UsageSample.query.filter_by(resolution=HOUR, ts=0).one()
+        assert (hour.cpu, hour.samples) == (30.0, 2)
+
+        # A late sample in a minute that had no row yet
+        sample(120, 70.0)
+        run_rollups(db, UsageSample, RollupWatermark, config, now=7320)
+        assert UsageSample.query.filter_by(resolution=MINUTE, ts=120).one().cpu == 70.0
+        assert UsageSample.query.filter_by(resolution=HOUR, ts=0).one().samples == 3
+
+    def test_booking_usage_endpoint(self, client, app, admin_token):
+        booking_id, agent_id = make_active_booking(app)
+        db.session.add(UsageSample(booking_id=booking_id, agent_id=agent_id, resolution=MINUTE, ts=60,
+                                   cpu=25.0, cpu_max=80.0, mem=256.0, mem_max=300.0, samples=6))
+        db.session.commit()
+
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        resp = client.get(f'/api/admin/bookings/{booking_id}/usage', headers=headers)
+        assert resp.status_code == 200
+        assert resp.json['points'] == [[60, 25.0, 80.0, 256.0, 300.0]]
+        assert resp.json['peak']['cpu'] == 80.0
+
+    def test_heatmap(self, client, admin_token):
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        resp = client.get('/api/admin/usage/heatmap?hours=6', headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.json['hours']) == 6
+
+        # A sample for an hour that was already rolled up still counts
+        hour = resp.json['hours'][-1]
+        config = {**client.application.config, 'TELEMETRY_ROLLUP_LAG': 0}
+        for ts, cpu in [(hour + 1800, 20.0), (hour + 10, 40.0)]:
+            db.session.add(UsageSample(booking_id=1, agent_id=7, resolution=RAW, ts=ts,
+                                       cpu=cpu, cpu_max=cpu, mem=100.0, mem_max=100.0, samples=1))
+            db.session.commit()
+            run_rollups(db, UsageSample, RollupWatermark, config, now=hour + 2 * HOUR)
+        resp = client.get('/api/admin/usage/heatmap?hours=6', headers=headers)
+        assert resp.json['cpu']['7'][-1] == 30.0
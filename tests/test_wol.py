@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+import pytest
+from controller.app import db
+from controller.models import Agent, Booking, User
+from controller.utils import scheduler, wol
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((data, address))
+
+
+class TestWakeOnLan:
+    """Test magic packets, batch wake and per-tick dedup."""
+
+    def test_magic_packet(self):
+        packet = wol.magic_packet('00:11:22:33:44:55')
+        assert packet == b'\xff' * 6 + bytes([0, 0x11, 0x22, 0x33, 0x44, 0x55]) * 16
+        assert wol.magic_packet('00-11-22-33-44-55') == packet
+        assert wol.magic_packet('00:11:22:33:44:55') is packet
+
+    def test_invalid_mac(self):
+        with pytest.raises(ValueError):
+            wol.wake_on_lan('00:11:22')
+        with pytest.raises(ValueError):
+            wol.magic_packet('zz:11:22:33:44:55')
+
+    def test_wake_many_uses_one_socket(self, monkeypatch):
+        sock = FakeSocket()
+        monkeypatch.setattr(wol, '_socket', lambda: sock)
+        failed = wol.wake_many(['00:11:22:33:44:55', 'bad', '00:11:22:33:44:55', 'aa:bb:cc:dd:ee:ff'],
+                               broadcast=('10.0.1.255', '10.0.2.255'), port=7, repeat=2)
+        assert list(failed) == ['bad']
+        assert len(sock.sent) == 2 * 2 * 2
+        assert {address for _, address in sock.sent} == {('10.0.1.255', 7), ('10.0.2.255', 7)}
+
+    def test_cycle_wakes_each_agent_once(self, app, monkeypatch):
+        user = User(name='Student', email='wol@test.com', password_hash='x')
+        agent = Agent(name='A', ip='10.0.0.8', mac='00:11:22:33:44:55', status='offline',
+                      total_cpu=8, available_cpu=8, total_mem=16, available_mem=16)
+        db.session.add_all([user, agent])
+        db.session.flush()
+        soon = datetime.utcnow() + timedelta(minutes=5)
+        for _ in range(3):
+            db.session.add(Booking(user_id=user.id, agent_id=agent.id, cpu=1, memory='2g', image='img',
+                                   start_time=soon, end_time=soon + timedelta(hours=1), status='approved'))
+        db.session.commit()
+
+        calls = []
+        monkeypatch.setattr(scheduler, 'wake_many', lambda macs, **kw: calls.append(list(macs)) or {})
+        monkeypatch.setattr(scheduler, 'check_agent_health', lambda db, Agent: None)
+        scheduler.run_booking_cycle(db, Booking, Agent, app.config)
+        assert calls == [['00:11:22:33:44:55']]